@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Labeled (conditional) temporal consistency checking, which checks every
+scenario of an RMPyL program in a single propagation.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from collections import deque
+from .defs import assignment_conjunction
+from .projection import assignment_closure
+
+_INF = float('inf')
+
+class LabeledDistanceGraph(object):
+    """
+    Distance graph whose edges are labeled by the conjunctions in the DNF
+    supports of the temporal constraints they come from. An edge only exists
+    in the scenarios that entail its label.
+    """
+    def __init__(self,constraints,events=None,include_uncontrollable=False):
+        self.events=[]; self.event_index={}
+        if events!=None:
+            for ev in events:
+                self._add_event(ev)
+
+        self.src=[]; self.dst=[]; self.weight=[]; self.label=[]
+        self.edge_constraint=[]; self.edge_bound=[]
+        for tc in constraints:
+            if tc.type!='controllable' and not include_uncontrollable:
+                continue
+            start = self._add_event(tc.start)
+            end = self._add_event(tc.end)
+            for conj in tc.support:
+                if tc.ub<_INF:
+                    self._add_edge(start,end,tc.ub,conj,tc,'ub')
+                if tc.lb>-_INF:
+                    self._add_edge(end,start,-tc.lb,conj,tc,'lb')
+
+        self.out_edges=[[] for i in range(len(self.events))]
+        for e,u in enumerate(self.src):
+            self.out_edges[u].append(e)
+
+    @classmethod
+    def from_program(cls,prog,include_uncontrollable=False):
+        """
+        Compiles all temporal constraints of an RMPyL program, in every one of
+        its scenarios, into a labeled distance graph.
+        """
+        return cls(prog.temporal_constraints,events=prog.events,
+                   include_uncontrollable=include_uncontrollable)
+
+    @property
+    def num_events(self):
+        return len(self.events)
+
+    def _add_event(self,ev):
+        if not ev in self.event_index:
+            self.event_index[ev]=len(self.events)
+            self.events.append(ev)
+        return self.event_index[ev]
+
+    def _add_edge(self,u,v,w,label,tc,bound):
+        self.src.append(u); self.dst.append(v); self.weight.append(w)
+        self.label.append(frozenset(label))
+        self.edge_constraint.append(tc); self.edge_bound.append(bound)
+
+
+class _LabeledDistance(object):
+    """
+    Labeled distance from the virtual source to an event: the length of a walk
+    that exists in every scenario entailing the label.
+    """
+    __slots__=('node','label','distance','edges','pred','edge')
+    def __init__(self,node,label,distance,edges,pred,edge):
+        self.node=node; self.label=label; self.distance=distance
+        self.edges=edges; self.pred=pred; self.edge=edge
+
+
+class ConditionalConsistencyResult(object):
+    """
+    Outcome of a labeled consistency check. The inconsistent guards are
+    conjunctions of choice assignments (in the same form as the conjunctions
+    of a ConditionalElement's support), such that every scenario entailing one
+    of them is temporally inconsistent. The conflict of each guard is the
+    negative cycle that proves it, as (temporal constraint,bound) pairs.
+
+    If the number of labeled distances per event was capped, the truncated
+    guards are the labels of the distances that were dropped. The inconsistent
+    guards are still sound, but a scenario entailing a truncated guard may be
+    inconsistent without being covered by them, so such scenarios are never
+    reported as consistent.
+    """
+    def __init__(self,graph,conflicts,truncated_guards=frozenset()):
+        self.graph = graph
+        self.conflicts = conflicts
+        self.truncated_guards = set(truncated_guards)
+
+    @property
+    def truncated(self):
+        """Whether labeled distances were dropped because of max_labels."""
+        return len(self.truncated_guards)>0
+
+    @property
+    def consistent(self):
+        """Whether every scenario of the program is provably consistent."""
+        return len(self.conflicts)==0 and not self.truncated
+
+    @property
+    def inconsistent_guards(self):
+        """DNF (set of conjunctions) covering all inconsistent scenarios."""
+        return set(self.conflicts.keys())
+
+    def is_consistent(self,assignments):
+        """
+        Whether the scenario given by a set of choice assignments is provably
+        consistent.
+        """
+        literals = assignment_closure(assignments)
+        for guard in self.conflicts:
+            if guard<=literals:
+                return False
+        for guard in self.truncated_guards:
+            if guard<=literals:
+                return False
+        return True
+
+    def __bool__(self):
+        return self.consistent
+    __nonzero__=__bool__
+
+
+def check_conditional_consistency(prog_or_constraints,include_uncontrollable=False,max_labels=None):
+    """
+    Checks the temporal consistency of all scenarios of an RMPyL program at
+    once. Each event keeps a set of non-dominated labeled distances from a
+    virtual source, which are propagated queue-based Bellman-Ford style (the
+    labeled counterpart of stn.spfa_potentials). A labeled distance is dominated
+    by another one at the same event if the latter has a smaller (or equal)
+    label and a smaller (or equal) distance, so distances shared by many
+    scenarios are propagated only once.
+
+    A walk with as many edges as events must repeat an event. If the cycle
+    between the repetitions is negative, it is negative in every scenario that
+    entails the cycle's label. That label is recorded as an inconsistent guard,
+    and distances whose label entails it are no longer propagated.
+
+    max_labels optionally bounds the number of labeled distances kept per event.
+    Distances dropped because of it are reported as the truncated guards of
+    the result, and the scenarios entailing them are not checked.
+    """
+    if hasattr(prog_or_constraints,'temporal_constraints'):
+        graph = LabeledDistanceGraph.from_program(prog_or_constraints,include_uncontrollable)
+    else:
+        graph = LabeledDistanceGraph(prog_or_constraints,include_uncontrollable=include_uncontrollable)
+
+    n = graph.num_events
+    dst = graph.dst; weight = graph.weight; labels = graph.label
+    empty = frozenset()
+
+    entries=[[_LabeledDistance(v,empty,0.0,0,None,None)] for v in range(n)]
+    conflicts={}
+    truncated=set()
+    pending = deque([(v,entries[v][0]) for v in range(n)])
+    while len(pending)>0:
+        u,entry = pending.popleft()
+        if not _alive(entry,entries[u]) or _entails_conflict(entry.label,conflicts):
+            continue
+        for e in graph.out_edges[u]:
+            label = _conjoin(entry.label,labels[e])
+            if label==None:
+                continue #Edge doesn't exist in the scenarios of the walk
+            if _entails_conflict(label,conflicts):
+                continue
+            v = dst[e]
+            new = _LabeledDistance(v,label,entry.distance+weight[e],entry.edges+1,entry,e)
+            if not _insert(new,entries[v]):
+                continue
+            if max_labels!=None and len(entries[v])>max_labels:
+                entries[v].remove(new)
+                truncated.add(label)
+                continue
+            if new.edges>=n:
+                guard,cycle = _walk_cycle(new,labels)
+                if sum(weight[c] for c in cycle)<0.0:
+                    conflicts[guard]=graph_bounds(graph,cycle)
+                    _prune(entries,conflicts)
+                else:
+                    #The walk repeats a non-negative cycle, so it is dominated by
+                    #the shorter walk without it.
+                    entries[v].remove(new)
+                continue
+            pending.append((v,new))
+
+    return ConditionalConsistencyResult(graph,conflicts,truncated)
+
+
+def graph_bounds(graph,edges):
+    """Constraint bounds corresponding to a list of edges."""
+    return [(graph.edge_constraint[e],graph.edge_bound[e]) for e in edges]
+
+
+def _conjoin(label1,label2):
+    """Conjunction of two labels, or None if they are mutually exclusive."""
+    if label1<=label2:
+        conj = label2
+    elif label2<=label1:
+        conj = label1
+    else:
+        conj = assignment_conjunction(label1,label2)
+        if conj==None:
+            return None
+    return frozenset(conj)
+
+
+def _entails_conflict(label,conflicts):
+    for guard in conflicts:
+        if guard<=label:
+            return True
+    return False
+
+
+def _alive(entry,node_entries):
+    for other in node_entries:
+        if other is entry:
+            return True
+    return False
+
+
+def _insert(new,node_entries):
+    """
+    Inserts a labeled distance at an event unless it is dominated, removing
+    the distances it dominates. Returns whether it was inserted.
+    """
+    for other in node_entries:
+        if other.distance<=new.distance and other.label<=new.label:
+            return False
+    node_entries[:] = [other for other in node_entries
+                       if not (new.distance<=other.distance and new.label<=other.label)]
+    node_entries.append(new)
+    return True
+
+
+def _walk_cycle(entry,labels):
+    """
+    Follows the predecessors of a labeled distance until an event repeats,
+    returning the label and the edges of the cycle in between.
+    """
+    seen={}; walk=[]
+    while not entry.node in seen:
+        seen[entry.node]=len(walk)
+        walk.append(entry)
+        entry = entry.pred
+    #walk[seen[node]] is the later occurrence of the repeated event, and the
+    #entries between it and the current one form the cycle.
+    cycle_entries = walk[seen[entry.node]:]
+    cycle = [ent.edge for ent in reversed(cycle_entries)]
+    guard = frozenset()
+    for e in cycle:
+        guard = guard|labels[e]
+    return guard,cycle
+
+
+def _prune(entries,conflicts):
+    """Removes labeled distances whose label entails an inconsistent guard."""
+    for v in range(len(entries)):
+        entries[v][:] = [ent for ent in entries[v] if not _entails_conflict(ent.label,conflicts)]
@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Expected utility and optimal decisions of RMPyL programs, computed by dynamic
+programming over their choice hierarchies.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+import heapq
+from .defs import ChoiceAssignment
+from .execution import RMPyLTraverser
+from .stn import check_consistency
+from .rmpylexceptions import InvalidValueError
+
+_INF = float('inf')
+
+class ExpectedUtilitySolver(object):
+    """
+    Computes the expected utility of an RMPyL program under optimal decisions.
+    The program is viewed as a tree of choices (RMPyLTraverser's choice
+    hierarchy), in which each assignment to a choice activates clusters of
+    child choices. The value of a choice is
+
+      * for decisions, the maximum over the choice's values of the value's
+        utility plus the values of the children it activates;
+      * for probabilistic observations, the expectation of the same quantity;
+      * for uncontrollable observations, its minimum (worst case) by default,
+        or its average over a uniform distribution if uncontrollable='uniform'.
+
+    Choices activated together are solved independently and their values are
+    added up, so the cost is linear in the size of the choice hierarchy rather
+    than in its number of scenarios. Subproblems are solved iteratively (so
+    deep hierarchies don't hit Python's recursion limit) and memoized on
+    (choice,context) nodes.
+
+    consistency_check optionally prunes branches: it is called with the
+    projection of the program onto the assignments leading to a branch (the
+    context), and branches for which it returns a false value are infeasible.
+    For instance, stn.check_consistency prunes branches that are temporally
+    inconsistent on their own. Since the value of a choice then depends on the
+    assignments leading to it, contexts are only tracked when a check is given.
+    The check is local to each branch: choices activated together are still
+    solved independently, so when their assignments interact (e.g., sequential
+    decisions sharing a deadline) the optimal policy may be inconsistent and
+    its value is only an upper bound. RiskBoundedSearch checks the assignments
+    of a policy jointly.
+    """
+    def __init__(self,prog,consistency_check=None,uncontrollable='worst',traverser=None):
+        if not uncontrollable in ['worst','uniform']:
+            raise InvalidValueError('Uncontrollable choices must be evaluated as worst or uniform.')
+        self.prog = prog
+        self.consistency_check = consistency_check
+        self.uncontrollable = uncontrollable
+        self.traverser = traverser if traverser!=None else RMPyLTraverser(prog)
+        self.values={}
+        self.policy={}
+        self._children={}
+        self._checked={}
+
+    def solve(self):
+        """
+        Expected utility of the program under optimal decisions (-inf if every
+        policy leads to pruned branches).
+        """
+        roots = self.root_nodes()
+        self._solve_nodes(roots)
+        return sum(self.values[node] for node in roots)
+
+    def root_nodes(self):
+        """Nodes of the initially active choices."""
+        context = frozenset() if self.consistency_check!=None else None
+        return [(c,context) for c in self._sorted(self.traverser.initially_active_choices)]
+
+    def child_nodes(self,node,value):
+        """
+        Nodes of the choices activated by assigning a value to the choice of a
+        node, or None if the resulting branch is pruned.
+        """
+        key = (node,value)
+        if not key in self._children:
+            choice,context = node
+            assig = ChoiceAssignment(choice,value,False)
+            if context!=None:
+                child_context = context|{assig}
+                if not self._consistent(child_context):
+                    self._children[key]=None
+                    return None
+            else:
+                child_context = None
+            self._children[key] = [(c,child_context) for c in self.activated_choices(choice,value)]
+        return self._children[key]
+
+    def activated_choices(self,choice,value):
+        """Choices activated by assigning a value to a choice."""
+        return self._sorted(self.traverser.activated_choices(choice,value))
+
+    def best_decision(self,choice,context=None):
+        """
+        Optimal value of a decision in a context (the frozenset of assignments
+        leading to it, when a consistency check is used).
+        """
+        node = (choice,frozenset(context) if self.consistency_check!=None else None)
+        if not node in self.values:
+            self._solve_nodes([node])
+        return self.policy.get(node)
+
+    def optimal_decisions(self,observations=None):
+        """
+        Follows the optimal policy from the initially active choices, given the
+        values of the observations (a dictionary from observations to values),
+        and returns the optimal values of the decisions that are reached. The
+        hierarchy below observations without a given value is not followed.
+        """
+        observations = observations if observations!=None else {}
+        roots = self.root_nodes()
+        self._solve_nodes(roots)
+        decisions={}
+        stack = list(reversed(roots))
+        while len(stack)>0:
+            node = stack.pop()
+            choice = node[0]
+            if choice.type=='controllable':
+                value = self.policy.get(node)
+                if value==None:
+                    continue
+                decisions[choice]=value
+            elif choice in observations:
+                value = observations[choice]
+            else:
+                continue
+            children = self.child_nodes(node,value)
+            if children!=None:
+                self._solve_nodes(children)
+                stack.extend(reversed(children))
+        return decisions
+
+    def _solve_nodes(self,nodes):
+        """
+        Solves a set of nodes bottom-up with an explicit stack: a node is
+        expanded when first popped, and evaluated after all its children.
+        """
+        stack = [(node,False) for node in nodes if not node in self.values]
+        while len(stack)>0:
+            node,expanded = stack.pop()
+            if node in self.values:
+                continue
+            if not expanded:
+                stack.append((node,True))
+                for value in node[0].domain:
+                    children = self.child_nodes(node,value)
+                    if children!=None:
+                        stack.extend((child,False) for child in children if not child in self.values)
+            else:
+                self._evaluate(node)
+
+    def _evaluate(self,node):
+        """Computes the value of a node whose children were all solved."""
+        choice = node[0]
+        branch_values=[]
+        for i,value in enumerate(choice.domain):
+            children = self.child_nodes(node,value)
+            if children==None:
+                branch_values.append(-_INF)
+            else:
+                utility = choice.utility[i] if len(choice.utility)>0 else 0.0
+                branch_values.append(utility+sum(self.values[child] for child in children))
+
+        if choice.type=='controllable':
+            best = max(range(len(branch_values)),key=lambda i:branch_values[i])
+            self.values[node] = branch_values[best]
+            if branch_values[best]>-_INF:
+                self.policy[node] = choice.domain[best]
+        elif choice.type=='probabilistic':
+            self.values[node] = expectation(branch_values,choice.probability)
+        elif self.uncontrollable=='uniform':
+            self.values[node] = expectation(branch_values,[1.0/len(branch_values)]*len(branch_values))
+        else:
+            self.values[node] = min(branch_values)
+
+    def _consistent(self,context):
+        if not context in self._checked:
+            self._checked[context] = bool(self.consistency_check(self.prog.project(context)))
+        return self._checked[context]
+
+    def _sorted(self,choices):
+        return sorted(choices,key=lambda c:c.id)
+
+
+def expectation(values,probabilities):
+    """
+    Expected value, where values with zero probability are ignored (so that
+    impossible pruned branches don't make the expectation infinite).
+    """
+    total = 0.0
+    for v,p in zip(values,probabilities):
+        if p>0.0:
+            if v==-_INF:
+                return -_INF
+            total+=p*v
+    return total
+
+
+def optimal_decisions(prog,consistency_check=None,uncontrollable='worst'):
+    """
+    Expected utility of an RMPyL program under optimal decisions, and the
+    solver holding the optimal policy.
+    """
+    solver = ExpectedUtilitySolver(prog,consistency_check,uncontrollable)
+    return solver.solve(),solver
+
+
+class RiskBoundedPolicy(object):
+    """
+    Decisions chosen by a risk-bounded search, as a dictionary from (choice,
+    context) nodes to values, with the policy's expected utility and risk.
+    """
+    def __init__(self,policy,utility,risk):
+        self.policy = policy
+        self.utility = utility
+        self.risk = risk
+
+    def decision(self,choice,context=None):
+        """
+        Value of a decision in a context (the frozenset of assignments leading
+        to it). Without a context, the decision must be reached in a single one.
+        """
+        if context!=None:
+            return self.policy.get((choice,frozenset(context)))
+        values = [v for (c,ctx),v in self.policy.items() if c==choice]
+        if len(values)>1:
+            raise InvalidValueError('Decision '+str(choice.name)+' is reached in more than one context.')
+        return values[0] if len(values)==1 else None
+
+    @property
+    def decisions(self):
+        """Dictionary from decisions reached in a single context to their values."""
+        counts={}
+        for (c,ctx) in self.policy:
+            counts[c]=counts.get(c,0)+1
+        return {c:v for (c,ctx),v in self.policy.items() if counts[c]==1}
+
+    def __repr__(self):
+        return 'RiskBoundedPolicy(at 0x%x) utility=%f, risk=%f, %d decisions'%(
+                id(self),self.utility,self.risk,len(self.policy))
+
+
+class _SearchNode(object):
+    """
+    Partial policy: the utility and risk accumulated so far, the open (choice,
+    context,probability) nodes still to be assigned, the scenarios that are
+    still consistent, as (assignments,probability) pairs, and the decisions
+    made (as a linked list through parent nodes).
+    """
+    __slots__=('utility','risk','frontier','scenarios','bound','parent','decision')
+    def __init__(self,utility,risk,frontier,scenarios,bound,parent,decision):
+        self.utility=utility; self.risk=risk; self.frontier=frontier; self.scenarios=scenarios
+        self.bound=bound; self.parent=parent; self.decision=decision
+
+
+class RiskBoundedSearch(object):
+    """
+    Best-first branch-and-bound search for the decisions that maximize the
+    expected utility of an RMPyL program, subject to a bound on the risk of
+    failure (the probability of reaching an inconsistent scenario).
+
+    The search expands the choice hierarchy one choice at a time. Decisions
+    branch over their values, while every value of an observation is kept in
+    the same partial policy, weighted by its probability (uniform for
+    uncontrollable observations). A partial policy keeps track of its
+    scenarios, i.e., of all the assignments made so far under each combination
+    of observed values, and every assignment is added to all the scenarios in
+    which its choice is active. A scenario is checked by calling
+    consistency_check (e.g., stn.check_consistency) with the projection of the
+    program onto all of its assignments, so choices activated together are
+    checked jointly. Scenarios that fail are dropped, their probability is
+    added to the risk of the partial policy, and partial policies exceeding the
+    risk bound are pruned right away. Since projections onto more assignments
+    only gain elements, consistency_check must be monotone (a failed scenario
+    never becomes consistent again), and the risk of a partial policy is then
+    a lower bound on the risk of all its completions. Partial policies are
+    ranked by their utility plus the unconstrained expected utilities of their
+    open choices, computed by an ExpectedUtilitySolver and cached per subplan,
+    which is an admissible bound for non-negative utilities.
+
+    The risk bound applies to the program as a whole, and defaults to the
+    smallest risk bound among the program's chance constraints. The scopes of
+    the chance constraints are ignored. With processes>1, the consistency
+    checks of up to batch_size partial policies are run in parallel in a
+    process pool, each worker holding a copy of the program.
+    """
+    def __init__(self,prog,risk_bound=None,consistency_check=None,processes=None,batch_size=32):
+        self.prog = prog
+        if risk_bound==None:
+            risks = [cc.risk for cc in prog.chance_constraints]
+            risk_bound = min(risks) if len(risks)>0 else 1.0
+        self.risk_bound = risk_bound
+        self.consistency_check = consistency_check if consistency_check!=None else check_consistency
+        self.processes = processes
+        self.batch_size = batch_size
+        self.heuristic = ExpectedUtilitySolver(prog,uncontrollable='uniform')
+        self.num_expanded = 0
+        self._checked={}
+
+    def search(self):
+        """
+        Returns the optimal RiskBoundedPolicy, or None if every policy exceeds
+        the risk bound.
+        """
+        executor=None
+        if self.processes!=None and self.processes>1:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(self.processes,initializer=_init_worker,
+                                           initargs=(self.prog,self.consistency_check))
+        try:
+            return self._search(executor)
+        finally:
+            if executor!=None:
+                executor.shutdown()
+
+    def _search(self,executor):
+        empty = frozenset()
+        self._check_contexts([empty],None)
+        if self._checked[empty]:
+            frontier = tuple((c,context,1.0) for c,context in self._root_nodes())
+            scenarios,risk = ((empty,1.0),),0.0
+        else:
+            frontier,scenarios,risk = (),(),1.0
+        if risk>self.risk_bound:
+            return None
+        root = _SearchNode(0.0,risk,frontier,scenarios,self._bound(0.0,frontier),None,None)
+        queue=[(-root.bound,0,root)]; counter=1
+        batch_size = self.batch_size if executor!=None else 1
+        while len(queue)>0:
+            batch=[]
+            while len(queue)>0 and len(batch)<batch_size:
+                node = heapq.heappop(queue)[2]
+                if len(node.frontier)==0:
+                    if len(batch)==0:
+                        return self._policy(node) #Complete policy with the best bound
+                    heapq.heappush(queue,(-node.bound,counter,node)); counter+=1
+                    break
+                batch.append(node)
+
+            self._check_contexts([ctx for node in batch for ctx in self._branch_contexts(node)],executor)
+            for node in batch:
+                self.num_expanded+=1
+                for child in self._expand(node):
+                    heapq.heappush(queue,(-child.bound,counter,child)); counter+=1
+        return None
+
+    def _root_nodes(self):
+        return [(c,frozenset()) for c,ctx in self.heuristic.root_nodes()]
+
+    def _branch_contexts(self,node):
+        """Scenarios to be checked when the first open choice is assigned."""
+        choice,context,mass = node.frontier[0]
+        contexts=[]
+        for value in choice.domain:
+            assig = ChoiceAssignment(choice,value,False)
+            contexts.extend(s|{assig} for s,p in node.scenarios if context<=s)
+        return contexts
+
+    def _expand(self,node):
+        """Children of a partial policy, obtained by assigning its first open choice."""
+        choice,context,mass = node.frontier[0]
+        rest = node.frontier[1:]
+        utilities = choice.utility if len(choice.utility)>0 else [0.0]*len(choice.domain)
+        unaffected = tuple((s,p) for s,p in node.scenarios if not context<=s)
+        if choice.type=='controllable':
+            children=[]
+            for value,utility in zip(choice.domain,utilities):
+                branch,scenarios,failed = self._branch(node,value,1.0)
+                risk = node.risk+failed
+                if risk>self.risk_bound:
+                    continue
+                scenarios = unaffected+scenarios
+                frontier = self._live(branch+rest,scenarios)
+                total = node.utility+mass*utility
+                children.append(_SearchNode(total,risk,frontier,scenarios,self._bound(total,frontier),
+                                            node,((choice,context),value)))
+            return children
+
+        if choice.type=='probabilistic':
+            probabilities = choice.probability
+        else:
+            probabilities = [1.0/len(choice.domain)]*len(choice.domain)
+        frontier=(); scenarios=unaffected; risk = node.risk; total = node.utility
+        for value,utility,p in zip(choice.domain,utilities,probabilities):
+            if p<=0.0:
+                continue
+            branch,extended,failed = self._branch(node,value,p)
+            risk+=failed
+            if risk>self.risk_bound:
+                return []
+            frontier+=branch; scenarios+=extended
+            total+=mass*p*utility
+        frontier = self._live(frontier+rest,scenarios)
+        return [_SearchNode(total,risk,frontier,scenarios,self._bound(total,frontier),node.parent,node.decision)]
+
+    def _branch(self,node,value,probability):
+        """
+        Open nodes of the choices activated by assigning a value (with a given
+        probability) to the first open choice of a partial policy, the
+        consistent scenarios extended with the assignment, and the probability
+        of the scenarios that the assignment makes inconsistent.
+        """
+        choice,context,mass = node.frontier[0]
+        assig = ChoiceAssignment(choice,value,False)
+        scenarios=[]; failed=0.0
+        for s,p in node.scenarios:
+            if context<=s:
+                extended = s|{assig}
+                if self._checked[extended]:
+                    scenarios.append((extended,p*probability))
+                else:
+                    failed+=p*probability
+        child_context = context|{assig}
+        branch = tuple((c,child_context,mass*probability) for c in self.heuristic.activated_choices(choice,value))
+        return branch,tuple(scenarios),failed
+
+    def _live(self,frontier,scenarios):
+        """Open nodes that are active in at least one consistent scenario."""
+        return tuple(n for n in frontier if any(n[1]<=s for s,p in scenarios))
+
+    def _bound(self,utility,frontier):
+        """Utility plus the optimistic values of the open choices."""
+        nodes = [(c,None) for c,context,mass in frontier]
+        self.heuristic._solve_nodes(nodes)
+        values = self.heuristic.values
+        return utility+sum(mass*values[(c,None)] for c,context,mass in frontier)
+
+    def _check_contexts(self,contexts,executor):
+        """Runs the consistency checks of new contexts, in parallel if possible."""
+        pending = list(set([ctx for ctx in contexts if not ctx in self._checked]))
+        if executor==None or len(pending)<2:
+            for ctx in pending:
+                self._checked[ctx] = bool(self.consistency_check(self.prog.project(ctx)))
+            return
+        #Contexts are sent as (choice ID,value) pairs, since workers hold their
+        #own copies of the program's choices.
+        keys = [tuple((a.var.id,a.value) for a in ctx) for ctx in pending]
+        chunksize = max(1,len(keys)//(4*self.processes))
+        for ctx,consistent in zip(pending,executor.map(_check_worker,keys,chunksize=chunksize)):
+            self._checked[ctx]=consistent
+
+    def _policy(self,node):
+        utility,risk = node.utility,node.risk
+        policy={}
+        while node!=None:
+            if node.decision!=None:
+                policy[node.decision[0]]=node.decision[1]
+            node = node.parent
+        return RiskBoundedPolicy(policy,utility,risk)
+
+
+_worker_state=None
+
+def _init_worker(prog,consistency_check):
+    global _worker_state
+    choices = {c.id:c for c in prog.choices}
+    _worker_state = (prog,consistency_check,choices)
+
+
+def _check_worker(key):
+    prog,consistency_check,choices = _worker_state
+    context = [ChoiceAssignment(choices[cid],value,False) for cid,value in key]
+    return bool(consistency_check(prog.project(context)))
+
+
+def risk_bounded_decisions(prog,risk_bound=None,consistency_check=None,processes=None):
+    """
+    Optimal decisions of an RMPyL program under a risk bound (see
+    RiskBoundedSearch), or None if no policy satisfies it.
+    """
+    return RiskBoundedSearch(prog,risk_bound,consistency_check,processes).search()
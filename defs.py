@@ -411,35 +411,34 @@ def support_difference(support1,support2):
     return difference_support
 
 
-def assignment_conjunction(c1,c2): #FIXME: deal with negated assignments
+def assignment_conjunction(c1,c2):
     """
-    Computes the intersection of two conjunctions of assignments
+    Computes the intersection of two conjunctions of assignments, or None if
+    they are inconsistent. Assignments are grouped by variable, so the cost is
+    linear in the size of the conjunctions.
     """
     unique = c1.union(c2)#Conjunction without repeated elements
-    negated_map={}
-    for el1 in unique:
-        for el2 in unique:
-            if el1 != el2:
-                #Assignments related to the same variable
-                if el1.var.id==el2.var.id:
-                    #Neither is negated
-                    if not (el1.negated or el2.negated):
-                        if(el1.value!=el2.value):
-                            return None #Inconsistent double assignment to a variable
-                    #Only one is negated
-                    elif (el1.negated and not el2.negated) or (not el1.negated and el2.negated):
-                        if(el1.value==el2.value):
-                            return None #You can't assign and not assign a value to a variable
-                    #Both are negated
-                    else:
-                        if el1.var in negated_map:
-                            negated_map[el1.var]+=1
-                        else:
-                            negated_map[el1.var]=2
-
-    #You cannot negate all assignments to a variable
-    for var,num_negated in negated_map.items():
-        if num_negated==len(var.domain):
-            return None
+    by_var={}; shared=[]
+    for assig in unique:
+        var_id = assig.var.id
+        if var_id in by_var:
+            if len(by_var[var_id])==1:
+                shared.append(var_id)
+            by_var[var_id].append(assig)
+        else:
+            by_var[var_id]=[assig]
+
+    #Only variables with more than one assignment can be inconsistent
+    for var_id in shared:
+        literals = by_var[var_id]
+        var = literals[0].var
+        assigned = set([a.value for a in literals if not a.negated])
+        negated = set([a.value for a in literals if a.negated])
+        if len(assigned)>1:
+            return None #Inconsistent double assignment to a variable
+        if len(assigned&negated)>0:
+            return None #You can't assign and not assign a value to a variable
+        if len(negated)==len(var.domain):
+            return None #You cannot negate all assignments to a variable
 
     return  unique
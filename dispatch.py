@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Compilation of the STN of an RMPyL program (or of a scenario projection) into
+a minimal dispatchable network, following
+
+  N. Muscettola, P. Morris and I. Tsamardinos. Reformulating temporal plans
+  for efficient execution. KR 1998.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from array import array
+from collections import deque
+import heapq
+from .stn import DistanceGraph,spfa_potentials
+from .rmpylexceptions import TemporalInconsistencyError
+
+_INF = float('inf')
+_TOL = 1e-9
+
+class DispatchableNetwork(object):
+    """
+    Minimal dispatchable network (MDN) stored in compact arrays. Events in the
+    same rigid component are executed together with their leader, at fixed
+    offsets (offset[i]>=0) from it. Between leaders, the network keeps only
+    the edges needed for dispatching by local propagation:
+
+      * upper edges X->C (ub_offsets/ub_targets/ub_weights, indexed by X): once
+        X is executed at time t, C must be executed no later than t+w;
+      * lower edges X->C (lb_offsets/lb_targets/lb_delays, indexed by X): C must
+        wait for X, and be executed no earlier than t+delay.
+
+    num_waits[C] is the number of lower edges into C, i.e., the number of
+    events that must be executed before C becomes enabled.
+    """
+    def __init__(self,events,leader,offset,upper,lower):
+        self.events = events
+        self.event_index = {ev:i for i,ev in enumerate(events)}
+        self.leader = leader
+        self.offset = offset
+        n = len(events)
+
+        self.members=[[] for i in range(n)]
+        for i in range(n):
+            self.members[leader[i]].append(i)
+        self.leaders = array('l',[i for i in range(n) if leader[i]==i])
+
+        self.ub_offsets,self.ub_targets,self.ub_weights = _csr(n,upper)
+        self.lb_offsets,self.lb_targets,self.lb_delays = _csr(n,lower)
+        self.num_waits = array('l',[0]*n)
+        for x,c,d in lower:
+            self.num_waits[c]+=1
+
+    @property
+    def num_events(self):
+        return len(self.events)
+
+    @property
+    def num_edges(self):
+        return len(self.ub_targets)+len(self.lb_targets)
+
+    def upper_edges(self,i):
+        """(target,weight) pairs of the upper edges out of an event index."""
+        start,end = self.ub_offsets[i],self.ub_offsets[i+1]
+        return zip(self.ub_targets[start:end],self.ub_weights[start:end])
+
+    def lower_edges(self,i):
+        """(target,delay) pairs of the lower edges out of an event index."""
+        start,end = self.lb_offsets[i],self.lb_offsets[i+1]
+        return zip(self.lb_targets[start:end],self.lb_delays[start:end])
+
+    def edges(self):
+        """
+        Distance graph edges (start event,end event,weight) of the network,
+        including the edges fixing rigid events to their leaders.
+        """
+        for x in self.leaders:
+            for c,w in self.upper_edges(x):
+                yield self.events[x],self.events[c],w
+            for c,d in self.lower_edges(x):
+                yield self.events[c],self.events[x],-d
+            for m in self.members[x]:
+                if m!=x:
+                    yield self.events[x],self.events[m],self.offset[m]
+                    yield self.events[m],self.events[x],-self.offset[m]
+
+
+def compile_dispatchable_network(prog_or_constraints,include_uncontrollable=False,events=None):
+    """
+    Compiles an RMPyL program, a projection of a program, or an iterable of
+    temporal constraints into a minimal dispatchable network. Inconsistent
+    networks raise TemporalInconsistencyError. For an iterable of constraints,
+    events optionally gives the first events of the network, in order (e.g.,
+    to keep event indices fixed across networks of different projections).
+
+    The all-pairs shortest paths are computed one source at a time, by
+    Dijkstra's algorithm on the reduced costs of a feasible potential function
+    (Johnson's algorithm), so the dense distance matrix is never stored. Rigid
+    components (zero-length cycles) are collapsed first, and then an edge A->C
+    is dominated if some B lies on a shortest path from A to C with:
+
+      * D(B,C)>=0, when D(A,C)>=0 (upper-dominance);
+      * D(A,B)<0, when D(A,C)<0 (lower-dominance).
+
+    The Dijkstra queue breaks ties along zero reduced-cost edges in
+    topological order, so that the events on shortest paths to C are always
+    settled before C, and dominance is tested during the search itself.
+    """
+    if hasattr(prog_or_constraints,'temporal_constraints'):
+        graph = DistanceGraph.from_program(prog_or_constraints,include_uncontrollable)
+    else:
+        graph = DistanceGraph(prog_or_constraints,events=events,include_uncontrollable=include_uncontrollable)
+
+    potentials,cycle = spfa_potentials(graph)
+    if cycle!=None:
+        raise TemporalInconsistencyError('Inconsistent temporal constraints.',graph.edge_bounds(cycle))
+
+    n = graph.num_events
+    leader,offset = _rigid_components(graph,potentials)
+
+    #Distance graph between leaders, keeping the tightest of parallel edges
+    tightest={}
+    for u,v,w in zip(graph.src,graph.dst,graph.weight):
+        lu,lv = leader[u],leader[v]
+        if lu!=lv:
+            w = w+offset[u]-offset[v]
+            if w<tightest.get((lu,lv),_INF):
+                tightest[(lu,lv)]=w
+    out_edges=[[] for i in range(n)]
+    for (u,v),w in tightest.items():
+        out_edges[u].append((v,w))
+
+    rank = _zero_edge_rank(n,out_edges,potentials)
+    upper=[]; lower=[]
+    for a in range(n):
+        if leader[a]!=a:
+            continue
+        for c,d in _undominated_distances(a,out_edges,potentials,rank):
+            if d>=0.0:
+                upper.append((a,c,d))
+            else:
+                lower.append((c,a,-d))
+
+    return DispatchableNetwork(graph.events,leader,offset,upper,lower)
+
+
+def _rigid_components(graph,potentials):
+    """
+    Rigid components are the strongly connected components of the edges with
+    zero reduced cost. Each component is led by its earliest event, and the
+    offsets of the other events to their leader are given by the potentials.
+    """
+    n = graph.num_events
+    zero_edges=[[] for i in range(n)]
+    for u,v,w in zip(graph.src,graph.dst,graph.weight):
+        if abs(w+potentials[u]-potentials[v])<=_TOL:
+            zero_edges[u].append(v)
+
+    leader = array('l',range(n))
+    offset = array('d',[0.0]*n)
+    for component in _strongly_connected_components(zero_edges):
+        if len(component)>1:
+            first = min(component,key=lambda i:potentials[i])
+            for i in component:
+                leader[i]=first
+                offset[i]=potentials[i]-potentials[first]
+    return leader,offset
+
+
+def _strongly_connected_components(adjacency):
+    """Tarjan's algorithm with an explicit stack."""
+    n = len(adjacency)
+    index=[-1]*n; low=[0]*n; on_stack=[False]*n
+    stack=[]; components=[]; counter=0
+    for root in range(n):
+        if index[root]>=0:
+            continue
+        work=[(root,0)]
+        while len(work)>0:
+            v,i = work.pop()
+            if i==0:
+                index[v]=low[v]=counter; counter+=1
+                stack.append(v); on_stack[v]=True
+            recurse=False
+            while i<len(adjacency[v]):
+                w = adjacency[v][i]; i+=1
+                if index[w]<0:
+                    work.append((v,i)); work.append((w,0))
+                    recurse=True
+                    break
+                elif on_stack[w]:
+                    low[v]=min(low[v],index[w])
+            if recurse:
+                continue
+            if low[v]==index[v]:
+                component=[]
+                while True:
+                    w = stack.pop(); on_stack[w]=False
+                    component.append(w)
+                    if w==v:
+                        break
+                components.append(component)
+            if len(work)>0:
+                u = work[-1][0]
+                low[u]=min(low[u],low[v])
+    return components
+
+
+def _zero_edge_rank(n,out_edges,potentials):
+    """
+    Topological rank of the events with respect to the edges of zero reduced
+    cost, which are acyclic once rigid components have been collapsed.
+    """
+    in_degree=[0]*n
+    zero=[[] for i in range(n)]
+    for u in range(n):
+        for v,w in out_edges[u]:
+            if w+potentials[u]-potentials[v]<=_TOL:
+                zero[u].append(v)
+                in_degree[v]+=1
+    rank=[0]*n
+    queue = deque([v for v in range(n) if in_degree[v]==0])
+    r=0
+    while len(queue)>0:
+        u = queue.popleft()
+        rank[u]=r; r+=1
+        for v in zero[u]:
+            in_degree[v]-=1
+            if in_degree[v]==0:
+                queue.append(v)
+    return rank
+
+
+def _undominated_distances(a,out_edges,potentials,rank):
+    """
+    Shortest-path distances from a, restricted to the targets C for which the
+    edge a->C is not dominated. closest[v] is the smallest distance D(a,B) over
+    the events B strictly between a and v on some shortest path.
+    """
+    n = len(out_edges)
+    pa = potentials[a]
+    dist=[_INF]*n; closest=[_INF]*n; settled=[False]*n
+    dist[a]=0.0
+    queue=[(0.0,rank[a],a)]
+    heappush = heapq.heappush; heappop = heapq.heappop
+    result=[]
+    while len(queue)>0:
+        key,r,u = heappop(queue)
+        if settled[u]:
+            continue
+        settled[u]=True
+        du = dist[u]
+        if u!=a:
+            cu = closest[u]
+            if (du>=0.0 and cu>du+_TOL) or (du<0.0 and cu>=0.0):
+                result.append((u,du))
+            #Distances through u as an intermediate event
+            if du<cu:
+                cu = du
+        else:
+            cu = _INF
+        for v,w in out_edges[u]:
+            nd = du+w
+            dv = dist[v]
+            if nd<dv-_TOL:
+                if v==a:
+                    continue
+                dist[v]=nd; closest[v]=cu
+                #Keys never decrease along an edge, so that rounding errors
+                #don't break the ties along zero reduced-cost edges.
+                heappush(queue,(max(nd+pa-potentials[v],key),rank[v],v))
+            elif nd<=dv+_TOL and cu<closest[v]:
+                closest[v]=cu
+    return result
+
+
+def _csr(n,edges):
+    """Compressed sparse rows of (source,target,value) triples."""
+    edges = sorted(edges)
+    offsets = array('l',[0]*(n+1))
+    for u,v,x in edges:
+        offsets[u+1]+=1
+    for i in range(n):
+        offsets[i+1]+=offsets[i]
+    return offsets,array('l',[v for u,v,x in edges]),array('d',[x for u,v,x in edges])
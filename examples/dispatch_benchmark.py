@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Benchmark of the compilation of minimal dispatchable networks on plans shaped
+like the Boeing scenario (see boeing_rmpyl.py): three manipulators cleaning
+targets, and picking, placing and soldering components. The number of
+components is the original one (4) times a scale factor, given as the first
+command line argument (100 by default).
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from rmpyl.rmpyl import RMPyL, Episode
+from rmpyl.defs import Event
+from rmpyl.dispatch import compile_dispatchable_network
+import sys
+import time
+
+def activity(manipulator,action,target,lb,ub):
+    name = '(%s-%s-%s)'%(manipulator,action,target)
+    return Episode(start=Event(name='start-'+name),end=Event(name='end-'+name),
+                   duration={'ctype':'controllable','lb':lb,'ub':ub},
+                   action=name)
+
+def boeing_like_plan(scale):
+    """
+    Parallel sequences of manipulation activities, with the durations from
+    generic_manipulation.py and a deadline on the whole plan.
+    """
+    manipulators = ['baxter_left','baxter_right','human_hand']
+    components = ['%scomp%d'%(color,i) for i in range(scale)
+                  for color in ['red','blue','green','yellow']]
+
+    prog = RMPyL()
+    sequences=[]
+    for m_index,manip in enumerate(manipulators):
+        activities=[]
+        for comp in components[m_index::len(manipulators)]:
+            activities.extend([activity(manip,'clean',comp+'-target',10,100),
+                               activity(manip,'pick',comp,20,100),
+                               activity(manip,'place',comp,20,100),
+                               activity(manip,'solder',comp,15,100)])
+        sequences.append(prog.sequence(*activities))
+    prog.plan = prog.parallel(*sequences)
+    num_activities = len(components)*4
+    prog.add_overall_temporal_constraint(ctype='controllable',lb=0.0,
+                                         ub=60.0*num_activities/len(manipulators))
+    return prog
+
+
+if __name__=='__main__':
+    scale = int(sys.argv[1]) if len(sys.argv)==2 else 100
+
+    start = time.time()
+    prog = boeing_like_plan(scale)
+    build_time = time.time()-start
+    print('Plan with %d events and %d temporal constraints built in %.2f s.'%(
+          len(prog.events),len(prog.temporal_constraints),build_time))
+
+    start = time.time()
+    network = compile_dispatchable_network(prog)
+    compile_time = time.time()-start
+    print('Minimal dispatchable network with %d events (%d after collapsing rigid components) and %d edges compiled in %.2f s.'%(
+          network.num_events,len(network.leaders),network.num_edges,compile_time))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Benchmark of the repeated export of an evolving program to pTPN's. The plan is
+made of parallel sequences of activities, each of which can be performed in a
+fast or careful way (a decision). After the first export, the bounds of a few
+activities are changed before every new export, which is done both from
+scratch (ptpn.write_ptpn()) and by a pTPN exporter attached to the program,
+which only serializes the modified elements. The number of activities per
+sequence and the number of exports are given as command line arguments (200
+and 10 by default).
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from rmpyl.rmpyl import RMPyL, Episode
+from rmpyl.ptpn import write_ptpn
+import os
+import random
+import sys
+import tempfile
+import time
+
+def activity(name,lb,ub):
+    return Episode(duration={'ctype':'controllable','lb':lb,'ub':ub},action=name)
+
+def fast_or_careful_plan(num_activities,num_sequences=4):
+    """Parallel sequences of activities, each done in one of two ways."""
+    prog = RMPyL()
+    sequences=[]
+    for s in range(num_sequences):
+        activities=[]
+        for a in range(num_activities):
+            name = 'act-%d-%d'%(s,a)
+            activities.append(prog.decide({'name':'mode-'+name,
+                                           'domain':['FAST','CAREFUL'],
+                                           'utility':[1,0]},
+                                          activity('(fast-%s)'%(name),1,5),
+                                          activity('(careful-%s)'%(name),5,10)))
+        sequences.append(prog.sequence(*activities))
+    prog.plan = prog.parallel(*sequences)
+    prog.add_overall_temporal_constraint(ctype='controllable',lb=0.0,ub=10.0*num_activities)
+    return prog
+
+
+if __name__=='__main__':
+    num_activities = int(sys.argv[1]) if len(sys.argv)>=2 else 200
+    num_exports = int(sys.argv[2]) if len(sys.argv)>=3 else 10
+    edits_per_export = 5
+    random.seed(0)
+
+    prog = fast_or_careful_plan(num_activities)
+    episodes = sorted(prog.primitive_episodes,key=lambda ep:ep.action)
+    exporter = prog.attach_ptpn_exporter()
+    filename = os.path.join(tempfile.mkdtemp(),'benchmark.tpn')
+
+    start = time.time()
+    prog.to_ptpn(filename)
+    print('First export of %d events, %d temporal constraints and %d episodes (%.1f MB) in %.2f s.'%(
+          len(prog.events),len(prog.temporal_constraints),len(episodes),
+          os.path.getsize(filename)/1e6,time.time()-start))
+
+    full_time = 0.0; cached_time = 0.0
+    for i in range(num_exports):
+        for ep in random.sample(episodes,edits_per_export):
+            lb = random.randint(1,5)
+            ep.duration.set_stc(lb,lb+random.randint(0,5))
+
+        start = time.time()
+        write_ptpn(prog,filename)
+        full_time+= time.time()-start
+
+        start = time.time()
+        prog.to_ptpn(filename)
+        cached_time+= time.time()-start
+        print('Export %d: %d elements serialized, %d reused.'%(i+1,exporter.serialized,exporter.reused))
+
+    print('Average export after %d edits: %.3f s from scratch, %.3f s with the attached exporter.'%(
+          edits_per_export,full_time/num_exports,cached_time/num_exports))
+    os.remove(filename)
@@ -43,14 +43,24 @@ Functions and classes useful for executing RMPyL programs.
 @author: Pedro Santana (psantana@mit.edu).
 """
 import random
+from .defs import ChoiceAssignment
+from .projection import assignment_closure
+from .rmpylexceptions import MissingArgumentError,InvalidValueError
+
+try:
+    import numpy as np
+except ImportError: #NumPy is optional, and only used for batch sampling
+    np = None
 
 class RMPyLObservationSampler(object):
     """
     Observation generator for an RMPyL program with uncontrollable choices.
     """
     def __init__(self,rmpyl_prog):
-        #Observations that are present in the program
-        self.observations=rmpyl_prog.observations
+        #Observations that are present in the program, in a stable order (the
+        #columns of batch samples).
+        self.observations=sorted(rmpyl_prog.observations,key=lambda c:c.id)
+        self._alias_tables=None
 
     def sample_observations(self):
         """
@@ -78,6 +88,164 @@ class RMPyLObservationSampler(object):
 
         return sample_dict
 
+    def observation_probabilities(self,obs):
+        """
+        Probability distribution over the domain of an observation: the true one
+        if probabilistic, and uniform if uncontrollable.
+        """
+        domain = obs.properties['domain']
+        if obs.type=='probabilistic':
+            return list(obs.properties['probability'])
+        return [1.0/len(domain)]*len(domain)
+
+    def sample_batch(self,n,seed=None):
+        """
+        Samples n scenarios at once, returned as an n x len(observations) integer
+        matrix of indices into the domains of the observations. Each draw takes
+        O(1) time with Walker's alias method, using two uniform variates.
+
+        The seed can be an integer, a NumPy SeedSequence (e.g., one of the
+        independent streams from spawn_seeds()) or a NumPy random Generator.
+        """
+        if np==None:
+            raise ImportError('NumPy is required for batch sampling of observations.')
+        rng = random_generator(seed)
+        k = len(self.observations)
+        if k==0:
+            return np.zeros((n,0),dtype=np.intp)
+        if self._alias_tables==None:
+            self._alias_tables = self._build_alias_tables()
+        prob,alias,sizes = self._alias_tables
+
+        cols = np.arange(k)
+        columns = np.minimum((rng.random((n,k))*sizes).astype(np.intp),sizes-1)
+        accept = rng.random((n,k))<prob[cols,columns]
+        return np.where(accept,columns,alias[cols,columns])
+
+    def sample_weighted_batch(self,n,seed=None):
+        """
+        Samples n scenarios as in sample_batch(), together with their likelihood
+        ratios (all ones, since scenarios are drawn from the true distribution).
+        Samplers drawing from other distributions return the weights that make
+        weighted averages unbiased.
+        """
+        return self.sample_batch(n,seed),np.ones(n)
+
+    @staticmethod
+    def spawn_seeds(seed,num_streams):
+        """
+        Independent seed sequences for sampling in parallel (e.g., one per
+        process), reproducible from a single seed.
+        """
+        if np==None:
+            raise ImportError('NumPy is required for batch sampling of observations.')
+        return np.random.SeedSequence(seed).spawn(num_streams)
+
+    def _build_alias_tables(self):
+        """
+        Alias tables (Vose's construction) for all observations, padded to the
+        size of the largest domain.
+        """
+        k = len(self.observations)
+        m = max(len(obs.properties['domain']) for obs in self.observations)
+        prob = np.ones((k,m)); alias = np.zeros((k,m),dtype=np.intp)
+        sizes = np.zeros(k,dtype=np.intp)
+        for i,obs in enumerate(self.observations):
+            probabilities = self.observation_probabilities(obs)
+            size = len(probabilities)
+            sizes[i]=size
+            scaled = [p*size for p in probabilities]
+            small = [j for j,p in enumerate(scaled) if p<1.0]
+            large = [j for j,p in enumerate(scaled) if p>=1.0]
+            while len(small)>0 and len(large)>0:
+                s = small.pop(); l = large.pop()
+                prob[i,s]=scaled[s]; alias[i,s]=l
+                scaled[l] = scaled[l]+scaled[s]-1.0
+                if scaled[l]<1.0:
+                    small.append(l)
+                else:
+                    large.append(l)
+            #Leftovers have probability one, up to rounding errors
+            for j in small+large:
+                prob[i,j]=1.0; alias[i,j]=j
+        return prob,alias,sizes
+
+
+class StratifiedObservationSampler(RMPyLObservationSampler):
+    """
+    Observation sampler that stratifies each batch: the unit interval is split
+    into n strata of equal probability, each observation draws one uniform
+    variate per stratum (in an independent random order of strata per
+    observation), and variates are mapped to values by inverse transform. Each
+    value is thus sampled in almost exactly its expected number of samples, and
+    only the interactions between observations remain random.
+    """
+    def sample_batch(self,n,seed=None):
+        if np==None:
+            raise ImportError('NumPy is required for batch sampling of observations.')
+        rng = random_generator(seed)
+        samples = np.empty((n,len(self.observations)),dtype=np.intp)
+        for j,obs in enumerate(self.observations):
+            uniforms = (rng.permutation(n)+rng.random(n))/float(n)
+            cdf = np.cumsum(self.observation_probabilities(obs))
+            samples[:,j] = np.minimum(np.searchsorted(cdf/cdf[-1],uniforms,side='right'),len(cdf)-1)
+        return samples
+
+
+class ImportanceObservationSampler(RMPyLObservationSampler):
+    """
+    Observation sampler that draws from a proposal distribution, which should
+    oversample the (rare) values that lead to failures, and weighs samples by
+    their likelihood ratio (true over proposal probability of the scenario).
+
+    The proposal is a dictionary from observations to lists of probabilities
+    over their domains. Observations not in it use a defensive mixture that
+    gives weight mixture to the uniform distribution and 1-mixture to the true
+    one, which raises the probability of rare values while keeping weights
+    bounded by 1/(1-mixture) per observation.
+    """
+    def __init__(self,rmpyl_prog,proposal=None,mixture=0.5):
+        super(ImportanceObservationSampler,self).__init__(rmpyl_prog)
+        if not (0.0<=mixture<1.0):
+            raise InvalidValueError('The mixture weight must be in [0,1).')
+        self.proposal = proposal if proposal!=None else {}
+        self.mixture = mixture
+
+    def proposal_probabilities(self,obs):
+        """Proposal distribution over the domain of an observation."""
+        if obs in self.proposal:
+            return list(self.proposal[obs])
+        true_probs = super(ImportanceObservationSampler,self).observation_probabilities(obs)
+        uniform = 1.0/len(true_probs)
+        return [(1.0-self.mixture)*p+self.mixture*uniform for p in true_probs]
+
+    def observation_probabilities(self,obs):
+        """Samples are drawn from the proposal distribution."""
+        return self.proposal_probabilities(obs)
+
+    def sample_weighted_batch(self,n,seed=None):
+        samples = self.sample_batch(n,seed)
+        log_weights = np.zeros(n)
+        for j,obs in enumerate(self.observations):
+            true_probs = np.array(super(ImportanceObservationSampler,self).observation_probabilities(obs),dtype=float)
+            proposal = np.array(self.proposal_probabilities(obs),dtype=float)
+            if np.any((proposal<=0.0)&(true_probs>0.0)):
+                raise InvalidValueError('The proposal must be positive wherever '+str(obs.name)+' has positive probability.')
+            with np.errstate(divide='ignore',invalid='ignore'):
+                log_ratios = np.log(true_probs)-np.log(proposal)
+            log_weights+=log_ratios[samples[:,j]]
+        return samples,np.exp(log_weights)
+
+
+def random_generator(seed=None):
+    """
+    NumPy random Generator from an integer seed, a SeedSequence, or an existing
+    Generator (returned unchanged).
+    """
+    if isinstance(seed,np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
 
 # Let's not focus on the problem of deciding the temporal precedence of choices
 # in a TPN, since that requires reasoning about the temporal constraints
@@ -98,76 +266,332 @@ class RMPyLTraverser(object):
     def __init__(self,prog):
         self.prog = prog
         self.choices = list(prog.choices)
-        self.temporal_constraints = prog.temporal_constraints
+        self.temporal_constraints = list(prog.temporal_constraints)
+        self.support_index = prog.support_index if hasattr(prog,'support_index') else prog.index
 
         #choice_activation_dict is a dictionary that maps choices variables to
         #a dictionary of assignments, which in turn leads to the sets of choices
         #that are made active by that choice assignment.
         self.choice_activation_dict,self.initially_active_choices = self._choice_activation()
+        self._build_constraint_index()
 
-    def active_temporal_constraints(self,assignments):
+    def active_temporal_constraints(self,assignments=None):
         """
         Returns the set of active temporal constraints for a given assignment
-        to choice variables.
+        to choice variables (or, if None, for the assignments pushed with
+        push_assignment()). A constraint is active if one of the conjunctions
+        in its support is entailed by the assignments. Active conjunctions are
+        found by counting hits in the literal postings of the program's support
+        index (see projection.SupportIndex) for the assignments and the
+        negations they imply, so the cost is proportional to the conjunctions
+        those literals appear in.
         """
-        return [t for t in self.temporal_constraints if t.is_active(assignments)]
+        if assignments==None:
+            return [self.temporal_constraints[i] for i in sorted(self._active)]
+        index = self.support_index
+        active = set(self._unconditional_tcs)
+        hits={}
+        for lit in assignment_closure(set(assignments)):
+            for conj_id in index._postings.get(lit,()):
+                tc_index = self._conj_tc.get(conj_id)
+                if tc_index!=None:
+                    h = hits.get(conj_id,0)+1
+                    hits[conj_id]=h
+                    if h==len(index._conj_literals[conj_id]):
+                        active.add(tc_index)
+        return [self.temporal_constraints[i] for i in sorted(active)]
+
+    def activated_choices(self,choice,value):
+        """
+        Set of choices activated by assigning a value to a choice, according to
+        the choice hierarchy.
+        """
+        activation = self.choice_activation_dict.get(choice,{})
+        activated = set(activation.get((value,False),[]))
+        for (other,negated),cluster in activation.items():
+            if negated and other!=value:
+                activated.update(cluster)
+        return activated
+
+    def push_assignment(self,assignment):
+        """
+        Adds an assignment to the current (incremental) set of assignments, and
+        returns the temporal constraints that it activates.
+        """
+        if assignment in self._assigned:
+            return []
+        self._assigned.add(assignment)
+        index = self.support_index
+        activated=[]
+        for lit in assignment_closure([assignment]):
+            count = self._literals.get(lit,0)
+            self._literals[lit]=count+1
+            if count>0:
+                continue #Already implied by another assignment
+            for conj_id in index._postings.get(lit,()):
+                tc_index = self._conj_tc.get(conj_id)
+                if tc_index==None:
+                    continue
+                h = self._hits.get(conj_id,0)+1
+                self._hits[conj_id]=h
+                if h==len(index._conj_literals[conj_id]):
+                    self._satisfied[tc_index]+=1
+                    if not tc_index in self._active:
+                        self._active.add(tc_index)
+                        activated.append(self.temporal_constraints[tc_index])
+        return activated
+
+    def pop_assignment(self,assignment):
+        """
+        Removes an assignment from the current set of assignments, and returns
+        the temporal constraints that it deactivates.
+        """
+        if not assignment in self._assigned:
+            return []
+        self._assigned.remove(assignment)
+        index = self.support_index
+        deactivated=[]
+        for lit in assignment_closure([assignment]):
+            count = self._literals[lit]-1
+            if count>0:
+                self._literals[lit]=count
+                continue #Still implied by another assignment
+            del self._literals[lit]
+            for conj_id in index._postings.get(lit,()):
+                tc_index = self._conj_tc.get(conj_id)
+                if tc_index==None:
+                    continue
+                if self._hits[conj_id]==len(index._conj_literals[conj_id]):
+                    self._satisfied[tc_index]-=1
+                    if self._satisfied[tc_index]==0 and not tc_index in self._unconditional_set:
+                        self._active.remove(tc_index)
+                        deactivated.append(self.temporal_constraints[tc_index])
+                self._hits[conj_id]-=1
+        return deactivated
+
+    @property
+    def assignments(self):
+        """Current set of assignments pushed with push_assignment()."""
+        return frozenset(self._assigned)
+
+    def clear_assignments(self):
+        """Removes all assignments pushed with push_assignment()."""
+        self._assigned=set()
+        self._literals={}
+        self._hits={}
+        self._satisfied=[0]*len(self.temporal_constraints)
+        self._active=set(self._unconditional_tcs)
+
+    def _build_constraint_index(self):
+        """
+        Maps the conjunctions of the support index that belong to the supports
+        of the program's temporal constraints to the positions of those
+        constraints.
+        """
+        index = self.support_index
+        positions = {tc:i for i,tc in enumerate(self.temporal_constraints)}
+        start,end = index.group('temporal_constraints')
+        self._unconditional_tcs=[]
+        for el_index in index._unconditional:
+            if start<=el_index<end and index.elements[el_index] in positions:
+                self._unconditional_tcs.append(positions[index.elements[el_index]])
+        self._conj_tc={}
+        for conj_id,el_index in enumerate(index._conj_element):
+            if start<=el_index<end and index.elements[el_index] in positions:
+                self._conj_tc[conj_id] = positions[index.elements[el_index]]
+        self._unconditional_set = frozenset(self._unconditional_tcs)
+        self.clear_assignments()
 
     def _choice_activation(self):
         """
         Internal function that builds the choice activation mapping and determines
         the initial set of active choices in a program.
+
+        A choice c activates a cluster of choices if a conjunction in the
+        cluster's support extends a conjunction in c's support by a single
+        assignment to c. Those are found by removing each assignment from the
+        cluster's support conjunctions and looking the remainder up in an
+        activation index keyed by conjunction, rather than comparing every
+        pair of choices.
         """
         support_clusters = group_elements_by_support(self.choices)
+        self.activation_index = conjunction_index(self.choices)
         choice_hierarchy={}; initially_active_choices=[]
         if len(support_clusters)>0: #There are choices in the RMPyL program
             initially_active_choices=support_clusters[0]
             for choice_cluster in support_clusters[1:]:
-                cluster_support = choice_cluster[0].support
-                for c in self.choices:
-                    if (not c in choice_cluster):
-                        activates,assig = self._activates(c,cluster_support)
-                        if activates:
-                            if c in choice_hierarchy:
-                                choice_hierarchy[c][(assig.value,assig.negated)]=choice_cluster
-                            else:
-                                choice_hierarchy[c]={(assig.value,assig.negated):choice_cluster}
+                cluster_members = set(choice_cluster)
+                activations=[]
+                for conj_support in choice_cluster[0].support:
+                    for assig in conj_support:
+                        c = assig.var
+                        if (not c in cluster_members) and (c in self.activation_index.get(conj_support-{assig},())):
+                            activations.append((c,(assig.value,assig.negated)))
+                for c,key in activations:
+                    assig_dict = choice_hierarchy.setdefault(c,{})
+                    if not key in assig_dict:
+                        assig_dict[key]=choice_cluster
+                    elif not choice_cluster[0] in assig_dict[key]:
+                        #The same assignment activates more than one cluster
+                        assig_dict[key]=assig_dict[key]+choice_cluster
 
         return choice_hierarchy,initially_active_choices
 
-    def _activates(self,choice,support):
+
+class HierarchicalObservationSampler(RMPyLObservationSampler):
+    """
+    Observation sampler that follows the choice hierarchy of an RMPyL program
+    (RMPyLTraverser.choice_activation_dict), so that only the observations
+    activated by earlier samples (and by the given decisions) are sampled.
+    Unreached observations are reported as -1.
+    """
+    def __init__(self,rmpyl_prog,decisions=None):
+        super(HierarchicalObservationSampler,self).__init__(rmpyl_prog)
+        self.prog = rmpyl_prog
+        self.decisions = decisions if decisions!=None else {}
+        traverser = RMPyLTraverser(rmpyl_prog)
+
+        #Choices in hierarchical order, each with the (parent position,value
+        #index,negated) assignments that activate it.
+        activation={}
+        for parent,assig_dict in traverser.choice_activation_dict.items():
+            for (value,negated),cluster in assig_dict.items():
+                for c in cluster:
+                    activation.setdefault(c,[]).append((parent,parent.domain.index(value),negated))
+        self.choices=[]; position={}
+        for c in sorted(traverser.initially_active_choices,key=lambda c:c.id):
+            position[c]=len(self.choices); self.choices.append(c)
+        pending = sorted([c for c in activation if not c in position],key=lambda c:c.id)
+        while len(pending)>0:
+            ready = [c for c in pending if all(p in position for p,v,neg in activation[c])]
+            if len(ready)==0:
+                break #Cyclic activation can't happen in well-formed programs
+            for c in ready:
+                position[c]=len(self.choices); self.choices.append(c)
+            pending = [c for c in pending if not c in position]
+
+        self._initial = set(position[c] for c in traverser.initially_active_choices)
+        self._activation = [[(position[p],v,neg) for p,v,neg in activation.get(c,[]) if p in position]
+                            for c in self.choices]
+        self._obs_column = {obs:j for j,obs in enumerate(self.observations)}
+        self._obs_positions = [position.get(obs,-1) for obs in self.observations]
+
+    def sample_choices(self,n,seed=None):
+        """
+        Samples n scenarios as an n x len(choices) matrix of indices into the
+        domains of the choices (in hierarchical order), with -1 for choices
+        that are not reached. Reached decisions take their given values.
+        """
+        if np==None:
+            raise ImportError('NumPy is required for batch sampling of observations.')
+        rng = random_generator(seed)
+        if self._alias_tables==None and len(self.observations)>0:
+            self._alias_tables = self._build_alias_tables()
+
+        values = np.full((n,len(self.choices)),-1,dtype=np.intp)
+        for pos,c in enumerate(self.choices):
+            if pos in self._initial:
+                mask = np.ones(n,dtype=bool)
+            else:
+                mask = np.zeros(n,dtype=bool)
+                for parent,v,negated in self._activation[pos]:
+                    pv = values[:,parent]
+                    mask|= (pv>=0)&(pv!=v) if negated else (pv==v)
+            count = int(mask.sum())
+            if count==0:
+                continue
+            if c.type=='controllable':
+                if not c in self.decisions:
+                    raise MissingArgumentError('No value for reached decision '+str(c.name))
+                values[mask,pos] = c.domain.index(self.decisions[c])
+            else:
+                values[mask,pos] = self._draw(self._obs_column[c],count,rng)
+        return values
+
+    def sample_batch(self,n,seed=None):
+        """
+        Samples n scenarios as an n x len(observations) matrix of indices into
+        the domains of the observations, with -1 for unreached observations.
+        """
+        values = self.sample_choices(n,seed)
+        samples = np.full((n,len(self.observations)),-1,dtype=np.intp)
+        for j,pos in enumerate(self._obs_positions):
+            if pos>=0:
+                samples[:,j] = values[:,pos]
+        return samples
+
+    def sample_batch_with_elements(self,n,seed=None):
         """
-        Whether a choice activates a support or not.
+        Samples n scenarios, returning the observation matrix of sample_batch()
+        and, for each sample, the frozenset of indices of its active elements
+        in the program's SupportIndex (prog.support_index.elements). Samples of
+        the same scenario share the same set.
         """
-        for conj_choice in choice.support:
-            for conj_support in support:
-                if conj_choice < conj_support:
-                    diff = conj_support-conj_choice
-                    if len(diff)==1:
-                        assig = list(diff)[0]
-                        if assig.var == choice:
-                            return True,assig
-        return False,None
+        values = self.sample_choices(n,seed)
+        samples = np.full((n,len(self.observations)),-1,dtype=np.intp)
+        for j,pos in enumerate(self._obs_positions):
+            if pos>=0:
+                samples[:,j] = values[:,pos]
+
+        index = self.prog.support_index
+        active=[None]*n
+        if len(self.choices)==0:
+            scenarios,inverse = np.zeros((1,0),dtype=np.intp),np.zeros(n,dtype=np.intp)
+        else:
+            scenarios,inverse = np.unique(values,axis=0,return_inverse=True)
+            inverse = inverse.ravel()
+        for s in range(scenarios.shape[0]):
+            assignments = [ChoiceAssignment(c,c.domain[v],False)
+                           for c,v in zip(self.choices,scenarios[s]) if v>=0]
+            elements = index.project(assignments).active_indices
+            for i in np.flatnonzero(inverse==s):
+                active[i] = elements
+        return samples,active
+
+    def _draw(self,j,count,rng):
+        """Draws count values of the j-th observation from its alias table."""
+        prob,alias,sizes = self._alias_tables
+        columns = np.minimum((rng.random(count)*sizes[j]).astype(np.intp),sizes[j]-1)
+        accept = rng.random(count)<prob[j,columns]
+        return np.where(accept,columns,alias[j,columns])
+
 
 def group_elements_by_support(elements):
     """
     Groups conditional elements (those with activating supports) that share the
-    same support, i.e., those that must be part of the same execution.
-    """
-    element_list = elements if isinstance(elements,(list,tuple)) else list(elements)
-    index_list = range(len(element_list))
-    support_clusters=[]
-    while len(index_list)>0:
-        #Each support cluster starts with the current first variable
-        support_clusters.append([element_list[index_list[0]]])
-        remove_index = set([index_list[0]])
-        for i in index_list[1:]:
-            #If two variables share the same support, removes it from future consideration
-            if element_list[index_list[0]].support == element_list[i].support:
-                support_clusters[-1].append(element_list[i])
-                remove_index.add(i)
-        index_list = [i for i in index_list if not i in remove_index]
-
+    same support, i.e., those that must be part of the same execution. Elements
+    are hashed on their canonical (frozen) supports, and clusters are sorted by
+    the length of their supports.
+    """
+    support_clusters=[]; cluster_by_support={}
+    for el in elements:
+        key = support_key(el.support)
+        if key in cluster_by_support:
+            cluster_by_support[key].append(el)
+        else:
+            cluster_by_support[key]=[el]
+            support_clusters.append(cluster_by_support[key])
     #Sorts the supports by their length
     support_clusters.sort(key=lambda clus: sum([len(conj) for conj in clus[0].support]))
-
     return support_clusters
+
+
+def support_key(support):
+    """Canonical hashable form of a DNF support."""
+    return frozenset(frozenset(conj) for conj in support)
+
+
+def conjunction_index(elements):
+    """
+    Activation index from each conjunction in the supports of a collection of
+    conditional elements to the set of elements whose support contains it.
+    """
+    index={}
+    for el in elements:
+        for conj in el.support:
+            key = frozenset(conj)
+            if key in index:
+                index[key].add(el)
+            else:
+                index[key]=set([el])
+    return index
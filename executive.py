@@ -0,0 +1,637 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Asyncio executive that dispatches RMPyL programs compiled into minimal
+dispatchable networks. Requires Python 3.5 or later.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+import asyncio
+import heapq
+import inspect
+import time
+from collections import deque,namedtuple
+from .defs import Choice,ChoiceAssignment
+from .dispatch import compile_dispatchable_network
+from .rmpylexceptions import MissingArgumentError,InvalidValueError,DispatchError,TemporalInconsistencyError
+
+_INF = float('inf')
+_TOL = 1e-9
+
+ExecutionRecord = namedtuple('ExecutionRecord',['event','time','due','latency'])
+ExecutionRecord.__doc__ = """
+Execution of an event: time of execution, time at which it was due, and
+wall-clock latency (in seconds) between the executive waking up for it and the
+end of its dispatch.
+"""
+
+
+class WallClock(object):
+    """
+    Real-time clock. Plan time units are converted to seconds by a scale
+    factor.
+    """
+    def __init__(self,seconds_per_unit=1.0):
+        self.seconds_per_unit = seconds_per_unit
+        self._start=None
+
+    def start(self):
+        self._start = time.monotonic()
+
+    def now(self):
+        return (time.monotonic()-self._start)/self.seconds_per_unit
+
+    async def sleep_until(self,t,wakeup):
+        """Waits until plan time t, or until the wakeup event is set."""
+        timeout = (t-self.now())*self.seconds_per_unit
+        if timeout>0.0:
+            try:
+                await asyncio.wait_for(wakeup.wait(),timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SimulatedClock(object):
+    """
+    Discrete-event clock for testing, which jumps to the next due time as soon
+    as the executive yields control to the event loop. Simulated time stands
+    still while the executive waits for external inputs.
+    """
+    def __init__(self):
+        self._now = 0.0
+
+    def start(self):
+        self._now = 0.0
+
+    def now(self):
+        return self._now
+
+    async def sleep_until(self,t,wakeup):
+        await asyncio.sleep(0)
+        if not wakeup.is_set() and t<_INF:
+            self._now = max(self._now,t)
+
+
+class Executive(object):
+    """
+    Dispatches an RMPyL program (or a projection) compiled into minimal
+    dispatchable networks. Enabled events are kept in a priority queue by their
+    earliest execution time, and executing an event only updates the time
+    windows of its neighbors in the network.
+
+    Decisions are made by a policy (dictionary or function from Choice objects
+    to values, such as a policy.PolicyCursor, which is also told about every
+    assignment). The value of a decision is taken from the policy as soon as
+    the policy knows it (for a PolicyCursor, once the observations it depends
+    on are made), and is assigned when the decision's event is executed.
+    Observations are provided through observe() as they arrive, or
+    drawn from an observation model (function from Choice objects to values)
+    for simulation. Every assignment prunes the program elements whose support
+    becomes unsatisfiable, which are never executed.
+
+    The network is compiled over the projection of the program onto the
+    assignments made so far and the decisions known from the policy (for a
+    projection, its own assignments are made before execution starts), so it
+    must be consistent (the bounds of uncontrollable durations are treated as
+    requirements). It is recompiled whenever this projection changes:
+    executed events keep their times, and the time windows of the other events
+    are recomputed by propagation from the executed ones, in the order of
+    execution. Events of branches that are not active yet wait for the choices
+    that activate them, and so do the active events touching their
+    constraints, unless those events have to precede the choices. Constraints
+    of a branch that bind events executed before its choice cannot be
+    anticipated, and are reported in violations if the branch is taken. If
+    events end up waiting for each other, run() raises a DispatchError.
+
+    Before the clock starts, run() compiles the networks of the projections
+    reachable by observations (breadth first, up to max_networks of them, with
+    the decisions known from the policy at that point). Networks that weren't
+    compiled in advance are compiled in the default executor of the event
+    loop, so that other plans sharing the loop keep being dispatched, and the
+    compilation isn't part of the latency of the event that triggered it.
+
+    Uncontrollable durations end when complete() is called for their episode,
+    or after a duration drawn from a duration model (function from temporal
+    constraints to durations). The on_start and on_end callbacks, which may be
+    coroutine functions, receive the primitive episodes being released and
+    finished, along with the current time.
+    """
+    def __init__(self,prog,policy=None,clock=None,observation_model=None,
+                 duration_model=None,on_start=None,on_end=None,max_networks=16):
+        self.prog = prog
+        self.policy = policy if policy!=None else {}
+        self.clock = clock if clock!=None else WallClock()
+        self.observation_model = observation_model
+        self.duration_model = duration_model
+        self.on_start = on_start
+        self.on_end = on_end
+
+        #Events are indexed as in the support index, for all networks
+        if hasattr(prog,'support_index'):
+            self._index = prog.support_index
+            self._base = frozenset()
+        else:
+            self._index = prog.index
+            self._base = frozenset(prog.assignments)
+        self._fixed = {a.var:a.value for a in self._base if not a.negated}
+        start,end = self._index.group('events')
+        self.events = self._index.elements[start:end]
+        self.event_index = {ev:i for i,ev in enumerate(self.events)}
+        self._decisions = [ev for ev in self.events if isinstance(ev,Choice) and ev.type=='controllable']
+        self._observables = [ev for ev in self.events if isinstance(ev,Choice) and ev.type!='controllable']
+        self.max_networks = max_networks
+        self._networks={} #Compiled networks, by the assignments of their projection
+
+        self._episodes_starting={}; self._episodes_ending={}; self._episode_end={}
+        for ep in self._index.primitive_episodes:
+            self._episodes_starting.setdefault(self.event_index[ep.start],[]).append(ep)
+            self._episodes_ending.setdefault(self.event_index[ep.end],[]).append(ep)
+            self._episode_end[ep]=self.event_index[ep.end]
+
+        self._init_pruning()
+        self._reset()
+
+    def _init_pruning(self):
+        """
+        Tracks, for every event and primitive episode, the number of support
+        conjunctions that are still satisfiable.
+        """
+        index = self._index
+        self._num_conj=[0]*len(index.elements)
+        for el_index in index._unconditional:
+            self._num_conj[el_index]+=1
+        for el_index in index._conj_element:
+            self._num_conj[el_index]+=1
+
+    def _reset(self):
+        n = len(self.events)
+        self.executed=[False]*n
+        self.times=[None]*n
+        self.records=[]
+        self.violations=[]
+        self.assignments={}
+        if hasattr(self.policy,'reset'):
+            self.policy.reset()
+        self._alive_conj = list(self._num_conj)
+        self._dead_conj=set()
+        self.pruned=set()
+        self._num_pruned=0
+        for assig in self._base:
+            if not assig.negated:
+                self._prune(assig.var,assig.value)
+        self._order=[]
+        self._checked=set()
+        self._awaiting={}
+        self._observations={}
+        self._sampled={}; self._completed=set()
+        self._tasks=[]
+        self._num_executed=0
+        self._wakeup = None
+        self._outdated=False
+        self._anticipated={}
+        self._anticipate()
+        self._compile()
+
+    @property
+    def done(self):
+        return self._num_executed+self._num_pruned==len(self.events)
+
+    def observe(self,choice,value):
+        """Provides the outcome of an observation."""
+        if not value in choice.domain:
+            raise InvalidValueError('%s is not in the domain of %s'%(str(value),str(choice)))
+        self._observations[choice]=value
+        i = self.event_index[choice]
+        if i in self._awaiting:
+            del self._awaiting[i]
+            self._push(self.clock.now(),i)
+
+    def complete(self,episode):
+        """Signals that the uncontrollable duration of an episode has finished."""
+        i = self._episode_end[episode]
+        self._completed.add(i)
+        if i in self._awaiting:
+            del self._awaiting[i]
+            self._push(self.clock.now(),i)
+
+    def is_pruned(self,element):
+        """Whether an element belongs to a branch that will not be executed."""
+        return element in self.pruned
+
+    async def run(self):
+        """
+        Executes the whole program and returns the execution records.
+        """
+        self._reset()
+        self._wakeup = asyncio.Event()
+        await self._precompile()
+        self.clock.start()
+        while not self.done:
+            if self._outdated:
+                await self._recompile()
+                continue
+            if len(self._queue)==0:
+                if not any(self.active[i] and not self.executed[i] for i in self._awaiting):
+                    raise DispatchError('No remaining event of the plan can be dispatched: events wait for each other.')
+                #Waits for observations or the ends of uncontrollable durations
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            due,count,i = self._queue[0]
+            if due>self.clock.now()+_TOL:
+                await self.clock.sleep_until(due,self._wakeup)
+                self._wakeup.clear()
+                continue
+            heapq.heappop(self._queue)
+            if self.executed[i] or not self.active[i]:
+                continue
+            net = self.network
+            if net.leader[i]==i and not i in self._contingent and self.lb[i]>due+_TOL:
+                self._push(self.lb[i],i) #Release time increased after queuing
+                continue
+            if (i in self._contingent or self._is_observation(i)) and not self._resolve_external(i):
+                continue
+            self._execute(i,due,time.perf_counter())
+
+        if len(self._tasks)>0:
+            await asyncio.gather(*self._tasks)
+        return self.records
+
+    async def _precompile(self):
+        """Compiles the networks of the reachable projections in the executor."""
+        loop = asyncio.get_event_loop()
+        for key,proj in self._reachable_projections(self.max_networks-len(self._networks)):
+            try:
+                net = await loop.run_in_executor(None,self._compile_network,proj)
+            except TemporalInconsistencyError:
+                continue #Raised again if the projection is reached
+            self._networks[key]=(proj,net)
+
+    async def _recompile(self):
+        """Compiles the network of a new projection in the executor."""
+        key = self._scenario_key()
+        if not key in self._networks:
+            proj = self._index.project(key)
+            net = await asyncio.get_event_loop().run_in_executor(None,self._compile_network,proj)
+            self._store_network(key,proj,net)
+        self._outdated=False
+        self._compile()
+
+    def _reachable_projections(self,limit):
+        """
+        Projections reachable from the current one by making observations, up
+        to a number of them, breadth first. Those already compiled are skipped.
+        """
+        values = self._values()
+        projections=[]; seen=set()
+        queue = deque([{}])
+        while len(queue)>0 and len(projections)<limit:
+            observed = queue.popleft()
+            key = frozenset(self._base).union(ChoiceAssignment(c,v,False) for c,v in values.items())
+            key = key.union(ChoiceAssignment(c,v,False) for c,v in observed.items())
+            if key in seen:
+                continue
+            seen.add(key)
+            proj = self._index.project(key)
+            if not key in self._networks:
+                projections.append((key,proj))
+            for c in self._observables:
+                if not (c in values or c in observed) and self.event_index[c] in proj.active_indices:
+                    for v in c.domain:
+                        extended = dict(observed); extended[c]=v
+                        queue.append(extended)
+        return projections
+
+    def _compile_network(self,proj):
+        return compile_dispatchable_network(proj.temporal_constraints,include_uncontrollable=True,events=self.events)
+
+    def _store_network(self,key,proj,net):
+        if len(self._networks)<self.max_networks:
+            self._networks[key]=(proj,net)
+
+    def _compile(self):
+        """
+        Sets up the network of the projection onto the known choice values
+        (compiling it, unless it was compiled before), and recomputes the time
+        windows of the events that were not executed by propagating from the
+        executed ones.
+        """
+        n = len(self.events)
+        self._scenario = self._scenario_key()
+        if self._scenario in self._networks:
+            proj,net = self._networks[self._scenario]
+        else:
+            proj = self._index.project(self._scenario)
+            net = self._compile_network(proj)
+            self._store_network(self._scenario,proj,net)
+        self.network = net
+        constraints = proj.temporal_constraints
+
+        self.active=[False]*n
+        for el_index in proj.active_indices:
+            if el_index<n:
+                self.active[el_index]=True
+
+        #Ends of uncontrollable durations, mapped to their start and constraint
+        self._contingent={}; self._contingent_from={}
+        for tc in constraints:
+            if tc.type!='controllable':
+                start,end = net.event_index[tc.start],net.event_index[tc.end]
+                self._contingent[end]=(start,tc)
+                self._contingent_from.setdefault(start,[]).append(end)
+
+        #An event that must not precede another one (zero-weight upper edge)
+        #waits for it. This keeps branches from starting before their choices
+        #are made, events from preceding the ends of uncontrollable durations,
+        #and the order of simultaneous events under a real-time clock.
+        zero_waits=[0]*n
+        self._zero_waiting={}
+        for x in net.leaders:
+            for c,w in net.upper_edges(x):
+                if w<=_TOL:
+                    zero_waits[x]+=1
+                    self._zero_waiting.setdefault(c,[]).append(x)
+
+        self.lb=[0.0]*n; self.ub=[_INF]*n
+        self.waits=[w+zw for w,zw in zip(net.num_waits,zero_waits)]
+        for i in self._blocked_events(proj):
+            self.waits[i]+=1
+        self._queue=[]; self._counter=0
+        for i in self._order:
+            self._propagate(i,self.times[i])
+        for i in net.leaders:
+            if self.waits[i]==0 and not self.executed[i]:
+                self._enable(i)
+
+        #Constraints activated between events that were already executed
+        for tc in constraints:
+            if not tc in self._checked:
+                start,end = self.event_index[tc.start],self.event_index[tc.end]
+                if self.executed[start] and self.executed[end]:
+                    t_start,t_end = self.times[start],self.times[end]
+                    if t_end-t_start<tc.lb-_TOL or t_end-t_start>tc.ub+_TOL:
+                        self.violations.append((tc.end,t_end,t_start+tc.lb,t_start+tc.ub))
+                self._checked.add(tc)
+
+    def _values(self):
+        """Values of the choices that are known, from assignments or the policy."""
+        values = dict(self._fixed)
+        values.update(self._anticipated)
+        values.update(self.assignments)
+        return values
+
+    def _scenario_key(self):
+        """Assignments of the projection that the network is compiled over."""
+        return frozenset(self._base).union(ChoiceAssignment(c,v,False) for c,v in self._values().items())
+
+    def _blocked_events(self,proj):
+        """
+        Leaders of the active events that touch temporal constraints of
+        branches that are not active yet. They wait for the unassigned choices
+        in the supports of those constraints, unless they have to be executed
+        before them.
+        """
+        net = self.network
+        index = self._index
+        start,end = index.group('temporal_constraints')
+        values = self._values()
+        blocked=set()
+        for el_index in range(start,end):
+            tc = index.elements[el_index]
+            if (el_index in proj.active_indices) or (tc in self.pruned):
+                continue
+            choices=set()
+            for conj in tc.support:
+                if any(a.var in values and (values[a.var]==a.value)==a.negated for a in conj):
+                    continue #Contradicted by the known values
+                choices.update(self.event_index[a.var] for a in conj if not a.var in values)
+            for ev in [tc.start,tc.end]:
+                i = net.leader[self.event_index[ev]]
+                if (not self.active[i]) or self.executed[i] or (i in blocked):
+                    continue
+                for c in choices:
+                    if self.active[c] and not self.executed[c] and not self._precedes(i,c):
+                        blocked.add(i)
+                        break
+        return blocked
+
+    def _precedes(self,i,j):
+        """Whether event i has to be executed before event j in the network."""
+        net = self.network
+        target = net.leader[j]
+        stack=[net.leader[i]]; visited=set(stack)
+        while len(stack)>0:
+            x = stack.pop()
+            if x==target:
+                return True
+            successors = [c for c,d in net.lower_edges(x)]+self._zero_waiting.get(x,[])
+            successors+= [net.leader[c] for c in self._contingent_from.get(x,())]
+            for c in successors:
+                if not c in visited:
+                    visited.add(c)
+                    stack.append(c)
+        return False
+
+    def _is_observation(self,i):
+        ev = self.events[i]
+        return isinstance(ev,Choice) and ev.type!='controllable'
+
+    def _resolve_external(self,i):
+        """
+        Whether an event driven by the outside world (an observation or the end
+        of an uncontrollable duration) can be executed now. Otherwise, it waits
+        for observe() or complete(), or for its sampled duration to elapse.
+        """
+        ev = self.events[i]
+        if isinstance(ev,Choice):
+            if ev in self._fixed:
+                return True
+            if (not ev in self._observations) and self.observation_model!=None:
+                self._observations[ev]=self.observation_model(ev)
+            if ev in self._observations:
+                return True
+        elif self.duration_model!=None:
+            if not i in self._sampled:
+                start,tc = self._contingent[i]
+                self._sampled[i] = self.times[start]+self.duration_model(tc)
+            if self._sampled[i]<=self.clock.now()+_TOL:
+                return True
+            self._push(self._sampled[i],i)
+            return False
+        elif i in self._completed:
+            return True
+        self._awaiting[i]=True
+        return False
+
+    def _push(self,t,i):
+        self._counter+=1
+        heapq.heappush(self._queue,(t,self._counter,i))
+        if self._wakeup!=None:
+            self._wakeup.set()
+
+    def _enable(self,i):
+        """
+        Queues an active event that no longer waits for other events. The ends
+        of uncontrollable durations are queued when their durations start.
+        """
+        if self.active[i] and not i in self._contingent:
+            self._push(self.lb[i],i)
+
+    def _execute(self,i,due,woke_up):
+        """Executes an event (and the events rigidly linked to it) and propagates."""
+        t = self.clock.now()
+        if t<self.lb[i]-_TOL or t>self.ub[i]+_TOL:
+            self.violations.append((self.events[i],t,self.lb[i],self.ub[i]))
+        self.executed[i]=True; self.times[i]=t
+        self._order.append(i)
+        self._num_executed+=1
+
+        ev = self.events[i]
+        if isinstance(ev,Choice):
+            self._assign(ev)
+        self._release(i,t)
+        if isinstance(ev,Choice) and self._scenario_key()!=self._scenario:
+            if self._scenario_key() in self._networks:
+                self._compile() #Propagates from all executed events, including this one
+            else:
+                self._outdated=True #Compiled by run() outside of this event's dispatch
+        else:
+            self._propagate(i,t)
+
+        self.records.append(ExecutionRecord(ev,t,due,time.perf_counter()-woke_up))
+
+    def _propagate(self,i,t):
+        """Updates the time windows of the neighbors of an event executed at time t."""
+        net = self.network
+        if net.leader[i]==i:
+            for m in net.members[i]:
+                if m!=i and not self.executed[m]:
+                    self.lb[m]=self.ub[m]=t+net.offset[m]
+                    self._push(t+net.offset[m],m)
+            for c,w in net.upper_edges(i):
+                if t+w<self.ub[c]:
+                    self.ub[c]=t+w
+            for c,d in net.lower_edges(i):
+                if t+d>self.lb[c]:
+                    self.lb[c]=t+d
+                self.waits[c]-=1
+                if self.waits[c]==0:
+                    self._enable(c)
+        for c in self._contingent_from.get(i,()):
+            if not self.executed[c]:
+                self._push(max(self.lb[c],t),c)
+        for c in self._zero_waiting.get(i,()):
+            if t>self.lb[c]:
+                self.lb[c]=t
+            self.waits[c]-=1
+            if self.waits[c]==0:
+                self._enable(c)
+
+    def _assign(self,choice):
+        """Assigns a value to a choice and prunes the unsatisfiable branches."""
+        if choice in self._fixed:
+            value = self._fixed[choice]
+        elif choice in self._anticipated:
+            value = self._anticipated[choice]
+        elif choice.type=='controllable':
+            value = self._decide(choice)
+        else:
+            value = self._observations[choice]
+        self.assignments[choice]=value
+        if hasattr(self.policy,'assign'):
+            self.policy.assign(choice,value) #Stateful policies, e.g., a PolicyCursor
+        self._prune(choice,value)
+        if choice.type!='controllable':
+            self._anticipate()
+
+    def _decide(self,choice):
+        """Value of a decision according to the policy."""
+        if callable(self.policy):
+            return self.policy(choice)
+        elif choice in self.policy:
+            return self.policy[choice]
+        raise MissingArgumentError('The policy has no value for decision '+str(choice.name))
+
+    def _anticipate(self):
+        """
+        Takes the values of the decisions that the policy already knows, so
+        that events don't wait for decisions whose outcome isn't uncertain.
+        """
+        for choice in self._decisions:
+            if not (choice in self._fixed or choice in self.assignments or choice in self._anticipated):
+                try:
+                    self._anticipated[choice] = self._decide(choice)
+                except MissingArgumentError:
+                    pass #Depends on observations that weren't made yet
+
+    def _prune(self,choice,value):
+        """Prunes the elements whose support is contradicted by an assignment."""
+        contradicted = [ChoiceAssignment(choice,value,True)]
+        contradicted+= [ChoiceAssignment(choice,v,False) for v in choice.domain if v!=value]
+        index = self._index
+        num_events = len(self.events)
+        for lit in contradicted:
+            for conj_id in index._postings.get(lit,()):
+                if not conj_id in self._dead_conj:
+                    self._dead_conj.add(conj_id)
+                    el_index = index._conj_element[conj_id]
+                    self._alive_conj[el_index]-=1
+                    if self._alive_conj[el_index]==0:
+                        self.pruned.add(index.elements[el_index])
+                        if el_index<num_events:
+                            self._num_pruned+=1
+
+    def _release(self,i,t):
+        """Calls the callbacks of the primitive episodes starting or ending at an event."""
+        for callback,episodes in [(self.on_start,self._episodes_starting),(self.on_end,self._episodes_ending)]:
+            if callback!=None:
+                for ep in episodes.get(i,()):
+                    if not ep in self.pruned:
+                        result = callback(ep,t)
+                        if inspect.isawaitable(result):
+                            self._tasks.append(asyncio.ensure_future(result))
+
+
+async def run_all(executives):
+    """
+    Runs many executives concurrently in the same event loop, returning their
+    execution records.
+    """
+    return await asyncio.gather(*[ex.run() for ex in executives])
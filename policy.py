@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Compilation of decision policies into compact lookup tables for online
+execution, which can be saved to files and memory-mapped when loaded.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+import bisect
+import json
+import mmap
+import struct
+import sys
+from array import array
+from .execution import RMPyLTraverser
+from .defs import ChoiceAssignment
+from .rmpylexceptions import InvalidValueError,MissingArgumentError
+
+_MAGIC = b'RMPP'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIIIIIIQQ')
+
+class CompiledPolicy(object):
+    """
+    Decision policy compiled into a trie over the choice hierarchy. Each node
+    is a context (the assignments leading to a cluster of choices activated
+    together), holding the policy's values for the decisions in the cluster,
+    and the edges to the nodes activated by each assignment to the cluster's
+    choices (only the chosen value for decisions, every value for
+    observations).
+
+    The trie is stored in CSR form in int32 arrays: node_edges and
+    node_decisions are the offsets of each node's edges and decisions, edges
+    are sorted keys choice*stride+value (choices and values are indices into
+    the choice table) and their children, and decisions are (choice,value)
+    index pairs. The arrays are written after a fixed header, followed by a
+    JSON table of choice IDs, names and domains, so loaded policies can be
+    memory-mapped and used without copying.
+    """
+    def __init__(self,choices,stride,node_edges,edge_keys,edge_children,
+                 node_decisions,decision_choices,decision_values,buffer=None):
+        self.choices = choices
+        self.stride = stride
+        self.node_edges = node_edges
+        self.edge_keys = edge_keys
+        self.edge_children = edge_children
+        self.node_decisions = node_decisions
+        self.decision_choices = decision_choices
+        self.decision_values = decision_values
+        self.choice_index = {c['id']:i for i,c in enumerate(choices)}
+        self._buffer = buffer #Keeps memory-mapped files open
+
+    @property
+    def num_nodes(self):
+        return len(self.node_edges)-1
+
+    @property
+    def num_edges(self):
+        return len(self.edge_keys)
+
+    def child(self,node,choice_index,value_index):
+        """Node reached from a node by an assignment, or -1 if there is none."""
+        key = choice_index*self.stride+value_index
+        start,end = self.node_edges[node],self.node_edges[node+1]
+        pos = bisect.bisect_left(self.edge_keys,key,start,end)
+        if pos<end and self.edge_keys[pos]==key:
+            return self.edge_children[pos]
+        return -1
+
+    def cursor(self):
+        """New PolicyCursor at the root of the trie."""
+        return PolicyCursor(self)
+
+    def to_bytes(self):
+        """Binary representation of the compiled policy."""
+        arrays = [self.node_edges,self.edge_keys,self.edge_children,
+                  self.node_decisions,self.decision_choices,self.decision_values]
+        body = b''.join(_int32_bytes(a) for a in arrays)
+        table = json.dumps({'choices':self.choices},default=str).encode('utf-8')
+        header = _HEADER.pack(_MAGIC,_VERSION,len(self.choices),self.stride,self.num_nodes,
+                              self.num_edges,len(self.decision_choices),
+                              _HEADER.size+len(body),len(table))
+        return header+body+table
+
+    def save(self,filename):
+        """Writes the compiled policy to a file."""
+        with open(filename,'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def from_bytes(cls,data,buffer=None):
+        """
+        Compiled policy from its binary representation (any object supporting
+        the buffer protocol). The int32 arrays are views on the data.
+        """
+        view = memoryview(data)
+        magic,version,num_choices,stride,num_nodes,num_edges,num_decisions,table_offset,table_length = \
+            _HEADER.unpack_from(view,0)
+        if magic!=_MAGIC or version!=_VERSION:
+            raise InvalidValueError('Not a compiled RMPyL policy (version %d).'%_VERSION)
+        sizes = [num_nodes+1,num_edges,num_edges,num_nodes+1,num_decisions,num_decisions]
+        arrays=[]; offset = _HEADER.size
+        for size in sizes:
+            arrays.append(_int32_view(view,offset,size))
+            offset+=4*size
+        table = json.loads(bytes(view[table_offset:table_offset+table_length]).decode('utf-8'))
+        return cls(table['choices'],stride,*arrays,buffer=buffer)
+
+    @classmethod
+    def load(cls,filename,use_mmap=True):
+        """
+        Loads a compiled policy from a file, memory-mapping it by default so
+        that the tables are paged in on demand and shared between processes.
+        """
+        with open(filename,'rb') as f:
+            if use_mmap:
+                data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                return cls.from_bytes(data,buffer=data)
+            return cls.from_bytes(f.read())
+
+
+class PolicyCursor(object):
+    """
+    Follows the assignments made during an execution through a compiled
+    policy, so that the value of each decision is found in O(1) time. It can
+    be used directly as the policy of an Executive, which calls it to get the
+    values of decisions and reports every assignment through assign().
+    """
+    def __init__(self,compiled):
+        self.compiled = compiled
+        self.reset()
+
+    def reset(self):
+        """Moves the cursor back to the root of the policy (no assignments)."""
+        self._expecting={}
+        self._decisions={}
+        self._activate(0)
+
+    def assign(self,choice,value):
+        """Records an assignment to a choice (a Choice object or its ID)."""
+        ci = self._choice_index(choice)
+        vi = self._value_index(choice,ci,value)
+        for node in self._expecting.pop(ci,()):
+            child = self.compiled.child(node,ci,vi)
+            if child>=0:
+                self._activate(child)
+
+    def decide(self,choice):
+        """Value of a decision given the assignments so far."""
+        ci = self._choice_index(choice)
+        if not ci in self._decisions:
+            raise MissingArgumentError('The policy has no value for decision '+str(getattr(choice,'name',choice)))
+        vi = self._decisions[ci]
+        domain = choice.domain if hasattr(choice,'domain') else self.compiled.choices[ci]['domain']
+        return domain[vi]
+
+    __call__ = decide
+
+    def _activate(self,node):
+        compiled = self.compiled
+        for d in range(compiled.node_decisions[node],compiled.node_decisions[node+1]):
+            self._decisions[compiled.decision_choices[d]] = compiled.decision_values[d]
+        stride = compiled.stride
+        for e in range(compiled.node_edges[node],compiled.node_edges[node+1]):
+            ci = compiled.edge_keys[e]//stride
+            if ci in self._expecting:
+                if self._expecting[ci][-1]!=node:
+                    self._expecting[ci].append(node)
+            else:
+                self._expecting[ci]=[node]
+
+    def _choice_index(self,choice):
+        cid = choice.id if hasattr(choice,'id') else choice
+        if not cid in self.compiled.choice_index:
+            raise InvalidValueError('Choice is not in the compiled policy: '+str(cid))
+        return self.compiled.choice_index[cid]
+
+    def _value_index(self,choice,ci,value):
+        domain = choice.domain if hasattr(choice,'domain') else self.compiled.choices[ci]['domain']
+        return domain.index(value)
+
+
+def compile_policy(prog,policy,traverser=None):
+    """
+    Compiles a decision policy over an RMPyL program into a CompiledPolicy. The
+    policy can be a dictionary from decisions to values, a dictionary from
+    (decision,context) nodes to values (as in RiskBoundedPolicy.policy and
+    ExpectedUtilitySolver.policy, where contexts are frozensets of ancestor
+    assignments), or an object with such a dictionary as its policy attribute.
+    """
+    policy = policy.policy if hasattr(policy,'policy') else policy
+    traverser = traverser if traverser!=None else RMPyLTraverser(prog)
+    choices = sorted(prog.choices,key=lambda c:c.id)
+    choice_index = {c:i for i,c in enumerate(choices)}
+    stride = max([len(c.domain) for c in choices]+[1])
+    if len(choices)*stride>=2**31:
+        raise InvalidValueError('Too many choices to encode edge keys in 32 bits.')
+
+    def lookup(choice,context):
+        for key in [(choice,context),(choice,None),choice]:
+            if key in policy:
+                return policy[key]
+        return None
+
+    node_edges=array('i',[0]); edge_keys=array('i'); edge_children=array('i')
+    node_decisions=array('i',[0]); decision_choices=array('i'); decision_values=array('i')
+    #Nodes are numbered in breadth-first order, so children are only known
+    #after their parent's edges have been written.
+    queue=[(frozenset(),sorted(traverser.initially_active_choices,key=lambda c:c.id))]
+    head = 0
+    while head<len(queue):
+        context,cluster = queue[head]; head+=1
+        edges=[]
+        for c in cluster:
+            if c.type=='controllable':
+                value = lookup(c,context)
+                if value==None:
+                    continue #Decision not reached by the policy
+                decision_choices.append(choice_index[c])
+                decision_values.append(c.domain.index(value))
+                values=[value]
+            else:
+                values = c.domain
+            for value in values:
+                activated = traverser.activated_choices(c,value)
+                if len(activated)>0:
+                    child_context = context|{ChoiceAssignment(c,value,False)}
+                    edges.append((choice_index[c]*stride+c.domain.index(value),len(queue)))
+                    queue.append((child_context,sorted(activated,key=lambda c:c.id)))
+        edges.sort()
+        for key,child in edges:
+            edge_keys.append(key); edge_children.append(child)
+        node_edges.append(len(edge_keys))
+        node_decisions.append(len(decision_choices))
+
+    table = [{'id':c.id,'name':c.name,'domain':list(c.domain)} for c in choices]
+    return CompiledPolicy(table,stride,node_edges,edge_keys,edge_children,
+                          node_decisions,decision_choices,decision_values)
+
+
+def _int32_bytes(values):
+    """Little-endian bytes of an int32 array."""
+    arr = values if isinstance(values,array) and values.itemsize==4 else array('i',values)
+    if sys.byteorder!='little':
+        arr = array('i',arr); arr.byteswap()
+    return arr.tobytes() if hasattr(arr,'tobytes') else arr.tostring()
+
+
+def _int32_view(view,offset,count):
+    """
+    Little-endian int32 array at an offset of a buffer, as a zero-copy view
+    when possible.
+    """
+    chunk = view[offset:offset+4*count]
+    if sys.byteorder=='little' and hasattr(chunk,'cast'):
+        return chunk.cast('i')
+    arr = array('i')
+    if hasattr(arr,'frombytes'):
+        arr.frombytes(bytes(chunk))
+    else:
+        arr.fromstring(bytes(chunk))
+    if sys.byteorder!='little':
+        arr.byteswap()
+    return arr
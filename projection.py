@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Projection of RMPyL programs onto (partial) assignments to their choices.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from array import array
+from collections import OrderedDict
+from .defs import Choice,ChoiceAssignment,assignment_conjunction
+from .ptpn import to_ptpn
+from .rmpylexceptions import MissingArgumentError
+
+class SupportIndex(object):
+    """
+    Inverted index from choice assignments (literals) to the conjunctions in the
+    DNF supports of the events, primitive episodes and temporal constraints of
+    an RMPyL program. Elements are numbered in a stable order, so that other
+    analyses can store per-element quantities in arrays.
+
+    The cache_size most recently used projections are cached, so that
+    projecting onto one scenario after another (e.g., while sampling or
+    executing) uses a bounded amount of memory.
+    """
+    def __init__(self,prog,cache_size=1024):
+        self.prog = prog
+        self.cache_size = cache_size
+
+        #Stable element index: events, then primitive episodes, then temporal
+        #constraints, each group sorted by element ID.
+        self.events = sorted(prog.events,key=lambda el:el.id)
+        self.primitive_episodes = sorted(prog.primitive_episodes,key=lambda el:el.id)
+        self.temporal_constraints = sorted(prog.temporal_constraints,key=lambda el:el.id)
+        self.elements = self.events+self.primitive_episodes+self.temporal_constraints
+        self.element_index = {el:i for i,el in enumerate(self.elements)}
+
+        #Unconditional elements (true support) are active in every projection.
+        self._unconditional=[]
+        self._conj_element=[]; self._conj_literals=[]
+        self._postings={}
+        for el_index,el in enumerate(self.elements):
+            for conj in el.support:
+                if len(conj)==0:
+                    self._unconditional.append(el_index)
+                else:
+                    conj_id = len(self._conj_element)
+                    self._conj_element.append(el_index)
+                    self._conj_literals.append(conj)
+                    for assig in conj:
+                        if assig in self._postings:
+                            self._postings[assig].append(conj_id)
+                        else:
+                            self._postings[assig]=[conj_id]
+
+        self._cache=OrderedDict()
+
+    def group(self,element_type):
+        """
+        Range of element indices [start,end) occupied by a group of elements
+        ('events', 'primitive_episodes' or 'temporal_constraints').
+        """
+        n_ev = len(self.events); n_ep = len(self.primitive_episodes)
+        if element_type=='events':
+            return 0,n_ev
+        elif element_type=='primitive_episodes':
+            return n_ev,n_ev+n_ep
+        elif element_type=='temporal_constraints':
+            return n_ev+n_ep,len(self.elements)
+        else:
+            raise ValueError('Unknown group of elements: '+str(element_type))
+
+    def project(self,assignments):
+        """
+        Returns the projection of the program onto a (partial) assignment to
+        its choices. Cached projections of sub-assignments are extended, so
+        the cost is proportional to the elements activated by the new
+        assignments.
+        """
+        key = frozenset(assignments)
+        projection = self._cached(key)
+        if projection!=None:
+            return projection
+
+        #Looks for a cached projection differing by a single assignment.
+        for assig in key:
+            parent = self._cache.get(key-{assig})
+            if parent!=None:
+                projection = self._extend(parent,[assig])
+                break
+        else:
+            literals = assignment_closure(key)
+            projection = ProjectedProgram(self,key,literals,self._active_indices(literals))
+
+        self._store(key,projection)
+        return projection
+
+    def extend(self,projection,assignments):
+        """
+        Extends a projection with additional assignments.
+        """
+        key = projection.assignments.union(assignments)
+        extended = self._cached(key)
+        if extended!=None:
+            return extended
+        extended = self._extend(projection,[a for a in assignments if not a in projection.assignments])
+        self._store(key,extended)
+        return extended
+
+    def clear_cache(self):
+        """Drops all cached projections."""
+        self._cache=OrderedDict()
+
+    def _cached(self,key):
+        """Cached projection for a set of assignments (or None), marked as recently used."""
+        projection = self._cache.pop(key,None)
+        if projection!=None:
+            self._cache[key]=projection
+        return projection
+
+    def _store(self,key,projection):
+        """Caches a projection, dropping the least recently used ones beyond cache_size."""
+        self._cache[key]=projection
+        while len(self._cache)>self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _active_indices(self,literals):
+        """
+        Indices of the elements with a support conjunction entailed by the
+        given set of literals, found by counting literal hits per conjunction.
+        """
+        active = set(self._unconditional)
+        counts={}
+        for lit in literals:
+            for conj_id in self._postings.get(lit,()):
+                c = counts.get(conj_id,0)+1
+                counts[conj_id]=c
+                if c==len(self._conj_literals[conj_id]):
+                    active.add(self._conj_element[conj_id])
+        return active
+
+    def _extend(self,projection,new_assignments):
+        """
+        Builds the projection for the union of an existing projection's
+        assignments with new ones. Only conjunctions containing the new
+        literals have to be checked.
+        """
+        key = projection.assignments.union(new_assignments)
+        new_literals = assignment_closure(new_assignments)
+        literals = projection.literals|new_literals
+        active = set(projection.active_indices)
+        for lit in new_literals:
+            if lit in projection.literals:
+                continue
+            for conj_id in self._postings.get(lit,()):
+                el_index = self._conj_element[conj_id]
+                if (not el_index in active) and (self._conj_literals[conj_id] <= literals):
+                    active.add(el_index)
+        return ProjectedProgram(self,key,literals,active)
+
+
+class ProjectedProgram(object):
+    """
+    Lightweight view of the component of an RMPyL program that is active under
+    a (partial) assignment to its choices. It exposes the same accessors used
+    to export and analyze full programs.
+    """
+    def __init__(self,index,assignments,literals,active_indices):
+        self.index = index
+        self.assignments = assignments
+        self.literals = literals
+        self.active_indices = frozenset(active_indices)
+
+    @property
+    def prog(self):
+        """Program being projected."""
+        return self.index.prog
+
+    @property
+    def id(self):
+        return self.prog.id
+
+    @property
+    def name(self):
+        return self.prog.name
+
+    def _group(self,element_type):
+        """Active elements from a group, in the index order."""
+        start,end = self.index.group(element_type)
+        elements = self.index.elements
+        return [elements[i] for i in sorted(self.active_indices) if start<=i<end]
+
+    @property
+    def events(self):
+        """Active events."""
+        return self._group('events')
+
+    @property
+    def primitive_episodes(self):
+        """Active primitive episodes."""
+        return self._group('primitive_episodes')
+
+    @property
+    def temporal_constraints(self):
+        """Active temporal constraints."""
+        return self._group('temporal_constraints')
+
+    @property
+    def choices(self):
+        """Active choice events."""
+        return [e for e in self.events if isinstance(e,Choice)]
+
+    @property
+    def decisions(self):
+        """Active decisions."""
+        return [c for c in self.choices if c.type=='controllable']
+
+    @property
+    def observations(self):
+        """Active observations."""
+        return [c for c in self.choices if c.type in ['uncontrollable','probabilistic']]
+
+    @property
+    def unassigned_choices(self):
+        """Active choices that have not been assigned in this projection."""
+        assigned = set([a.var for a in self.assignments])
+        return [c for c in self.choices if not c in assigned]
+
+    @property
+    def first_event(self):
+        ev = self.prog.first_event
+        return ev if self.is_active(ev) else None
+
+    @property
+    def last_event(self):
+        ev = self.prog.last_event
+        return ev if self.is_active(ev) else None
+
+    @property
+    def chance_constraints(self):
+        """Chance constraints with at least one active constraint in scope."""
+        return set([cc for cc in self.prog.chance_constraints
+                    if any(self.is_active(c) for c in cc.constraints)])
+
+    @property
+    def state_variables(self):
+        return self.prog.state_variables
+
+    @property
+    def initial_state(self):
+        return self.prog.initial_state
+
+    def is_active(self,element):
+        """Whether an element of the program is active in this projection."""
+        el_index = self.index.element_index.get(element)
+        return (el_index!=None) and (el_index in self.active_indices)
+
+    def extend(self,assignments):
+        """Projection for this projection's assignments plus new ones."""
+        return self.index.extend(self,assignments)
+
+    def to_ptpn(self,filename,exclude_op=['__stop__'],streaming=False,guards='flattened',processes=None):
+        """
+        Exports the projected program to a pTPN XML.
+        """
+        return to_ptpn(prog=self,filename=filename,exclude_op=exclude_op,streaming=streaming,guards=guards,processes=processes)
+
+    def __len__(self):
+        return len(self.active_indices)
+
+    def __repr__(self):
+        return 'ProjectedProgram(at 0x%x) %s: %d active elements'%(id(self),str(sorted(self.assignments,key=str)),len(self))
+
+
+class ActivationProbabilities(object):
+    """
+    Marginal probabilities that the elements of an RMPyL program are active,
+    under a fixed decision policy (a dictionary from decisions to values).
+    Probabilistic choices follow Choice.probability, and uncontrollable ones
+    are uniformly distributed.
+
+    Distinct choices are independent, and the conjunctions in supports include
+    the assignments that activate the choices they mention, so the probability
+    of a conjunction is the product of the probabilities of its choices'
+    assignments. The probability of a DNF support (a disjunction of possibly
+    overlapping conjunctions) follows from inclusion-exclusion, in the
+    recursive form
+
+      P(ctx & (C1 | ... | Cm)) = P(ctx & C1) + P(ctx & (C2 | ... | Cm))
+                                             - P(ctx & C1 & (C2 | ... | Cm))
+
+    Conjunctions and partial disjunctions shared by many supports are memoized,
+    so their probabilities are only computed once.
+    """
+    def __init__(self,index,decisions=None):
+        self.index = index
+        self.decisions = decisions if decisions!=None else {}
+        self._conj_memo={}
+        self._union_memo={}
+
+    def compute(self):
+        """Probabilities of all elements, aligned with index.elements."""
+        return array('d',[self.support_probability(el.support) for el in self.index.elements])
+
+    def support_probability(self,support):
+        """Probability of a DNF support."""
+        conjunctions = sorted(set([frozenset(conj) for conj in support]),key=len)
+        for conj in conjunctions:
+            if len(conj)==0:
+                return 1.0
+        return self._union(frozenset(),tuple(conjunctions))
+
+    def conjunction_probability(self,conj):
+        """Probability of a conjunction of choice assignments."""
+        conj = frozenset(conj)
+        if not conj in self._conj_memo:
+            by_var={}
+            for assig in conj:
+                if assig.var in by_var:
+                    by_var[assig.var].append(assig)
+                else:
+                    by_var[assig.var]=[assig]
+            #Decisions without a value only matter if the other choices leave
+            #the conjunction possible (otherwise they may well be unreachable).
+            prob = 1.0; missing=[]
+            for var,literals in by_var.items():
+                if var.type=='controllable' and not var in self.decisions:
+                    missing.append(var)
+                    continue
+                prob*=self._literals_probability(var,literals)
+                if prob==0.0:
+                    break
+            if prob>0.0 and len(missing)>0:
+                missing.sort(key=lambda c:c.id)
+                raise MissingArgumentError('No value for decision '+str(missing[0].name))
+            self._conj_memo[conj]=prob
+        return self._conj_memo[conj]
+
+    def _literals_probability(self,var,literals):
+        """Probability that a choice satisfies all literals about it."""
+        allowed = set(var.domain)
+        for assig in literals:
+            if assig.negated:
+                allowed.discard(assig.value)
+            else:
+                allowed&=set([assig.value])
+        distribution = self.distribution(var)
+        return sum(p for val,p in zip(var.domain,distribution) if val in allowed)
+
+    def distribution(self,choice):
+        """Distribution over the domain of a choice."""
+        if choice.type=='controllable':
+            if not choice in self.decisions:
+                raise MissingArgumentError('No value for decision '+str(choice.name))
+            return [1.0 if val==self.decisions[choice] else 0.0 for val in choice.domain]
+        elif choice.type=='probabilistic':
+            return list(choice.probability)
+        return [1.0/len(choice.domain)]*len(choice.domain)
+
+    def _union(self,context,conjunctions):
+        """Probability of context AND (disjunction of the conjunctions)."""
+        key = (context,conjunctions)
+        if key in self._union_memo:
+            return self._union_memo[key]
+        result = 0.0
+        if len(conjunctions)>0:
+            first,rest = conjunctions[0],conjunctions[1:]
+            joint = context|first if first<=context or context<=first else assignment_conjunction(context,first)
+            if first<=context:
+                result = self.conjunction_probability(context) #The disjunction is entailed
+            elif joint==None:
+                result = self._union(context,rest) #First conjunction is impossible
+            else:
+                joint = frozenset(joint)
+                result = self.conjunction_probability(joint)+self._union(context,rest)
+                if len(rest)>0 and result>0.0:
+                    result-=self._union(joint,rest)
+        self._union_memo[key]=result
+        return result
+
+
+def activation_probabilities(prog,decisions=None):
+    """
+    Marginal activation probabilities of the elements of an RMPyL program, as
+    an array aligned with prog.support_index.elements (see
+    ActivationProbabilities).
+    """
+    return ActivationProbabilities(prog.support_index,decisions).compute()
+
+
+def assignment_closure(assignments):
+    """
+    Set of literals entailed by a set of choice assignments: an assignment
+    c=v also entails NOT(c=w) for every other value w in the domain of c.
+    """
+    literals = set(assignments)
+    for assig in assignments:
+        if not assig.negated:
+            for val in assig.var.domain:
+                if val!=assig.value:
+                    literals.add(ChoiceAssignment(assig.var,val,negated=True))
+    return frozenset(literals)
@@ -38,34 +38,43 @@
 """
 RMPyL: a Python package for writing RMPL programs.
 
-Module that allows RMPyL programs to be exported to TPN's (or pTPN's).
+Module that allows RMPyL programs to be exported to TPN's (or pTPN's), and
+imported back from pTPN's.
 
 @author: Pedro Santana (psantana@mit.edu).
 """
+import re
+import warnings
+from collections import deque,namedtuple
 import xml.etree.cElementTree as ET
 import xml.dom.minidom as minidom
-from .constraints import AssignmentStateConstraint,LinearStateConstraint
+from .defs import Event,Choice,ChoiceAssignment,StateVariable,support_conjunction
+from .episodes import Episode
+from .constraints import TemporalConstraint,ChanceConstraint,AssignmentStateConstraint,LinearStateConstraint
 
-def to_ptpn(prog,filename,exclude_op=[]):
+def to_ptpn(prog,filename,exclude_op=[],streaming=False,guards='flattened',processes=None):
     """
-    Converts an RMPyL program into a pretty XML representation. The current
-    implementation is ridiculous (prog->XMLTREE->XMLString->XMLDOM->PrettyXMLString),
-    but works well.
+    Converts an RMPyL program into a pTPN. With streaming=True, or whenever
+    processes is given, the pretty XML is written to the file element by
+    element by write_ptpn() (with processes>1, by that many worker processes),
+    and None is returned.
+
+    Otherwise, the whole XML tree of the program is built and returned as a
+    compact string, and, if filename is given, it is reparsed with minidom to
+    write a pretty XML to the file. This keeps the string return value of
+    earlier versions, but the memory used grows with the size of the program,
+    so write_ptpn() is preferable for large programs.
+
+    With guards='shared', elements refer to a table of distinct guards, rather
+    than having their own copy of the guard (see GuardTable).
     """
-    #Primitive episode durations
-    durations = [ep.duration for ep in prog.primitive_episodes]
+    if streaming or processes!=None:
+        if filename!=None:
+            write_ptpn(prog,filename,exclude_op,guards,processes)
+        return None
+    guard_table = GuardTable(guards)
 
-    #Temporal constraints that are not durations, so that they don't get added
-    #twice in the pTPN
-    temporal_constraints = [tc for tc in prog.temporal_constraints if not tc in durations]
-
-    #Removes opearators from the policy, leaving only their temporal duration
-    episode_list=[]
-    for e in prog.primitive_episodes:
-        if e.action in exclude_op:
-            temporal_constraints.append(e.duration)
-        else:
-            episode_list.append(e)
+    temporal_constraints,episode_list = _exported_constraints_and_episodes(prog,exclude_op)
 
     root = ET.Element('tpns') #pTPN root
     root.set('xmlns','http://mers.csail.mit.edu/tpn')
@@ -76,20 +85,24 @@ def to_ptpn(prog,filename,exclude_op=[]):
         break
     export_header_fields(tpn_xml,prog,bogusID=bogus_event.id) #Header fields
 
+    #Table of shared guards, filled once all elements have been exported
+    if guard_table.mode=='shared':
+        xml_guards = ET.SubElement(tpn_xml,'guards')
+
     #Adding all temporal events,including choices
     xml_events = ET.SubElement(tpn_xml,'events')
     for ev in prog.events:
-        xml_events.append(export_temporal_event(ev))
+        xml_events.append(export_temporal_event(ev,guard_table))
 
     #Adding temporal constraints
     xml_tcs = ET.SubElement(tpn_xml,'temporal-constraints')
     for tc in temporal_constraints:
-        xml_tcs.append(export_temporal_constraint(tc))
+        xml_tcs.append(export_temporal_constraint(tc,guard_table))
 
     #Adding primitive episodes
     xml_episodes = ET.SubElement(tpn_xml,'episodes')
     for ep in episode_list:
-        xml_episodes.append(export_episode(ep))
+        xml_episodes.append(export_episode(ep,guard_table))
 
     #Adding chance constraints
     xml_ccs = ET.SubElement(tpn_xml,'chance-constraints')
@@ -99,7 +112,7 @@ def to_ptpn(prog,filename,exclude_op=[]):
     #Adding decision variables
     xml_decisions = ET.SubElement(tpn_xml,'decision-variables')
     for c in prog.choices:
-        xml_decisions.append(export_choice(c))
+        xml_decisions.append(export_choice(c,guard_table))
 
     #Adding state variables
     xml_state_variables = ET.SubElement(tpn_xml,'state-variables')
@@ -109,6 +122,10 @@ def to_ptpn(prog,filename,exclude_op=[]):
     #Adding initial state
     tpn_xml.append(export_state(prog.initial_state,initial=True))
 
+    if guard_table.mode=='shared':
+        for g_def in guard_table.definitions():
+            xml_guards.append(g_def)
+
     #Converts XML tree object to string
     tree_str = ET.tostring(root, 'utf-8')
 
@@ -121,6 +138,584 @@ def to_ptpn(prog,filename,exclude_op=[]):
     return tree_str #Returns TPN as a string
 
 
+def write_ptpn(prog,out,exclude_op=[],guards='flattened',processes=None,chunk_size=1000):
+    """
+    Writes an RMPyL program as a pretty pTPN XML to a file object (or to a
+    file, given its name), one element at a time. The output is identical to
+    that of to_ptpn(), but no XML tree of the whole program is ever built, so
+    the memory used doesn't grow with the size of the program.
+
+    With processes>1, events, temporal constraints, episodes and choices are
+    split into chunks of chunk_size elements, which are converted to compact
+    records (see _element_record()) and serialized by a pool of worker
+    processes. Chunks are written in order as they are ready, and only a few
+    chunks per process are pending at any time.
+    """
+    if not hasattr(out,'write'):
+        with open(out,'w') as fi:
+            return write_ptpn(prog,fi,exclude_op,guards,processes,chunk_size)
+
+    executor=None
+    if processes!=None and processes>1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(processes)
+    try:
+        _write_ptpn(prog,out,exclude_op,guards,executor,chunk_size,2*(processes or 1))
+    finally:
+        if executor!=None:
+            executor.shutdown()
+
+
+def _write_ptpn(prog,out,exclude_op,guards,executor,chunk_size,window):
+    temporal_constraints,episode_list = _exported_constraints_and_episodes(prog,exclude_op)
+    guard_table = GuardTable(guards)
+    fragments = guard_table.fragments
+
+    out.write('<?xml version="1.0" ?>\n')
+    out.write('<tpns xmlns="http://mers.csail.mit.edu/tpn">\n')
+    out.write('\t<tpn>\n')
+
+    #HACK to make a list of temporal constraints be recognized as a valid TPN
+    bogus_id = ''
+    for bogus_event in prog.events:
+        bogus_id = bogus_event.id
+        break
+    header = ET.Element('tpn')
+    export_header_fields(header,prog,bogusID=bogus_id)
+    for field in header:
+        write_xml_element(out,field,2)
+
+    if guard_table.mode=='shared':
+        #The guard table is written before the elements that refer to it, so
+        #their guards are collected beforehand (in the same order as below).
+        for el in _guarded_elements(prog,temporal_constraints,episode_list):
+            guard_table.guard_id(el.support)
+        write_xml_container(out,'guards',guard_table.definitions(),2)
+
+    if executor==None:
+        write_xml_container(out,'events',(export_temporal_event(ev,guard_table) for ev in prog.events),2,fragments)
+        write_xml_container(out,'temporal-constraints',(export_temporal_constraint(tc,guard_table) for tc in temporal_constraints),2,fragments)
+        write_xml_container(out,'episodes',(export_episode(ep,guard_table) for ep in episode_list),2,fragments)
+    else:
+        refs={}
+        for tag,elements in [('events',prog.events),('temporal-constraints',temporal_constraints),('episodes',episode_list)]:
+            _write_fragments(out,tag,_parallel_fragments(executor,tag,elements,guard_table,refs,chunk_size,window),2)
+    write_xml_container(out,'chance-constraints',(export_chance_constraint(cc) for cc in prog.chance_constraints),2)
+    if executor==None:
+        write_xml_container(out,'decision-variables',(export_choice(c,guard_table) for c in prog.choices),2,fragments)
+    else:
+        _write_fragments(out,'decision-variables',_parallel_fragments(executor,'decision-variables',prog.choices,guard_table,refs,chunk_size,window),2)
+    write_xml_container(out,'state-variables',(export_state_variable(sv) for sv in prog.state_variables),2)
+    write_xml_element(out,export_state(prog.initial_state,initial=True),2)
+
+    out.write('\t</tpn>\n')
+    out.write('</tpns>\n')
+
+
+def write_xml_element(out,elem,depth,fragments=None):
+    """
+    Writes an XML element (and its children) exactly as minidom's
+    toprettyxml(indent="\t") would at a given depth: elements with a single
+    text node on one line, empty ones self-closed.
+
+    Elements shared by several parents (such as the guards in a GuardTable) can
+    be serialized only once, by providing a dictionary of fragments, indexed by
+    the id() of such elements, where serialized elements are stored per depth.
+    """
+    if fragments!=None and id(elem) in fragments:
+        by_depth = fragments[id(elem)]
+        if not depth in by_depth:
+            fragment = _FragmentWriter()
+            write_xml_element(fragment,elem,depth)
+            by_depth[depth] = ''.join(fragment)
+        out.write(by_depth[depth])
+        return
+
+    indent = '\t'*depth
+    attrs = ''.join([' %s="%s"'%(k,_escape_xml(v)) for k,v in elem.attrib.items()])
+    if len(elem)==0:
+        if elem.text:
+            out.write('%s<%s%s>%s</%s>\n'%(indent,elem.tag,attrs,_escape_xml(elem.text),elem.tag))
+        else:
+            out.write('%s<%s%s/>\n'%(indent,elem.tag,attrs))
+    else:
+        out.write('%s<%s%s>\n'%(indent,elem.tag,attrs))
+        for child in elem:
+            write_xml_element(out,child,depth+1,fragments)
+        out.write('%s</%s>\n'%(indent,elem.tag))
+
+
+def write_xml_container(out,tag,elements,depth,fragments=None):
+    """
+    Writes an XML element whose children are generated one at a time. The
+    opening tag is only written once the first child is available, since an
+    empty container is self-closed.
+    """
+    indent = '\t'*depth
+    empty = True
+    for elem in elements:
+        if empty:
+            out.write('%s<%s>\n'%(indent,tag))
+            empty = False
+        write_xml_element(out,elem,depth+1,fragments)
+    if empty:
+        out.write('%s<%s/>\n'%(indent,tag))
+    else:
+        out.write('%s</%s>\n'%(indent,tag))
+
+
+class PTPNExporter(object):
+    """
+    Exporter of an RMPyL program to pTPN's that keeps the serialized XML of each
+    element between exports. Elements are only serialized again if their
+    fingerprint (everything about them that is written to the pTPN, such as
+    their support, bounds, or domain) has changed since the previous export, so
+    a program that evolves through small edits can be exported repeatedly at a
+    fraction of the cost. The output is equivalent to that of write_ptpn(), and
+    tostring() returns the compact XML string that to_ptpn() returns.
+    """
+    def __init__(self,prog):
+        self.prog = prog
+        self.serialized = 0 #Elements serialized in the last export
+        self.reused = 0 #Elements whose cached fragment was reused
+        self.clear()
+
+    def clear(self,guards='flattened'):
+        """Discards all cached fragments."""
+        self._guard_table = GuardTable(guards)
+        self._fragments = {}
+        self._guard_definitions = {}
+        self._compact = []
+
+    def write(self,out,exclude_op=['__stop__'],guards='flattened'):
+        """
+        Writes the program as a pretty pTPN XML to a file object (or to a file,
+        given its name), serializing only new and modified elements.
+        """
+        if not hasattr(out,'write'):
+            with open(out,'w') as fi:
+                return self.write(fi,exclude_op,guards)
+        if guards!=self._guard_table.mode:
+            self.clear(guards)
+
+        prog = self.prog
+        temporal_constraints,episode_list = _exported_constraints_and_episodes(prog,exclude_op)
+        self.serialized = 0; self.reused = 0
+        sections = [('events',prog.events,export_temporal_event,True),
+                    ('temporal-constraints',temporal_constraints,export_temporal_constraint,True),
+                    ('episodes',episode_list,export_episode,True),
+                    ('chance-constraints',prog.chance_constraints,export_chance_constraint,False),
+                    ('decision-variables',prog.choices,export_choice,True),
+                    ('state-variables',prog.state_variables,export_state_variable,False)]
+        sections = [(tag,self._section_fragments(tag,elements,export,guarded))
+                    for tag,elements,export,guarded in sections]
+
+        if self._guard_table.mode=='shared':
+            #Guard IDs must follow the order of first use, as in a new export.
+            #Otherwise (e.g., after removing elements or renaming choices),
+            #everything is serialized again.
+            used_guards=[]; seen=set()
+            for tag,entries in sections:
+                for entry in entries:
+                    if entry[2]!=None and not entry[2] in seen:
+                        seen.add(entry[2])
+                        used_guards.append(entry[2])
+            if used_guards!=['G%d'%i for i in range(len(self._guard_table.ids))]:
+                self.clear(guards)
+                return self.write(out,exclude_op,guards)
+        compact = [b'<tpns xmlns="http://mers.csail.mit.edu/tpn"><tpn>']
+
+        out.write('<?xml version="1.0" ?>\n')
+        out.write('<tpns xmlns="http://mers.csail.mit.edu/tpn">\n')
+        out.write('\t<tpn>\n')
+
+        bogus_id = ''
+        for bogus_event in prog.events:
+            bogus_id = bogus_event.id
+            break
+        header = ET.Element('tpn')
+        export_header_fields(header,prog,bogusID=bogus_id)
+        for field in header:
+            write_xml_element(out,field,2)
+            compact.append(ET.tostring(field,'utf-8'))
+
+        if self._guard_table.mode=='shared':
+            definitions=[]
+            for gd_xml in self._guard_table.definitions():
+                gd_id = _child_text(gd_xml,'id')
+                if not gd_id in self._guard_definitions:
+                    fragment = _FragmentWriter()
+                    write_xml_element(fragment,gd_xml,3)
+                    self._guard_definitions[gd_id] = (''.join(fragment),ET.tostring(gd_xml,'utf-8'))
+                definitions.append(self._guard_definitions[gd_id])
+            _write_fragments(out,'guards',[d[0] for d in definitions],2)
+            compact.append(_compact_container('guards',[d[1] for d in definitions]))
+
+        for tag,entries in sections:
+            _write_fragments(out,tag,(entry[1] for entry in entries),2)
+            compact.append(_compact_container(tag,[entry[3] for entry in entries]))
+        initial_state = export_state(prog.initial_state,initial=True)
+        write_xml_element(out,initial_state,2)
+        compact.append(ET.tostring(initial_state,'utf-8'))
+        compact.append(b'</tpn></tpns>')
+        self._compact = compact
+
+        out.write('\t</tpn>\n')
+        out.write('</tpns>\n')
+
+    def tostring(self):
+        """
+        Compact XML string of the last export, as returned by to_ptpn().
+        """
+        return b''.join(self._compact)
+
+    def _section_fragments(self,tag,elements,export,guarded):
+        """
+        Cache entries (fingerprint, pretty XML, guard ID and compact XML) of the
+        elements of a section of the pTPN, reusing the cached ones whose
+        fingerprint hasn't changed. Elements that are no longer part of the
+        program are dropped from the cache.
+        """
+        cache = self._fragments.get(tag,{})
+        shared = guarded and self._guard_table.mode=='shared'
+        fingerprint = _FINGERPRINTS[tag]
+        current = {}; entries = []
+        for el in elements:
+            fp = fingerprint(el)
+            entry = cache.get(el)
+            if entry==None or entry[0]!=fp:
+                el_xml = export(el,self._guard_table) if guarded else export(el)
+                fragment = _FragmentWriter()
+                write_xml_element(fragment,el_xml,3,self._guard_table.fragments)
+                entry = (fp,''.join(fragment),self._guard_table.guard_id(el.support) if shared else None,
+                         ET.tostring(el_xml,'utf-8'))
+                self.serialized+=1
+            else:
+                self.reused+=1
+            current[el] = entry
+            entries.append(entry)
+        self._fragments[tag] = current
+        return entries
+
+
+def _write_fragments(out,tag,fragments,depth):
+    """Writes an XML element whose children have already been serialized."""
+    indent = '\t'*depth
+    empty = True
+    for fragment in fragments:
+        if empty:
+            out.write('%s<%s>\n'%(indent,tag))
+            empty = False
+        out.write(fragment)
+    if empty:
+        out.write('%s<%s/>\n'%(indent,tag))
+    else:
+        out.write('%s</%s>\n'%(indent,tag))
+
+
+def _compact_container(tag,parts):
+    """
+    Compact XML (as written by ET.tostring()) of an element whose children are
+    given in compact form.
+    """
+    tag = tag.encode('utf-8')
+    if len(parts)==0:
+        return b'<'+tag+b' />'
+    return b'<'+tag+b'>'+b''.join(parts)+b'</'+tag+b'>'
+
+
+def _parallel_fragments(executor,tag,elements,guard_table,refs,chunk_size,window):
+    """
+    Serialized chunks of elements of a section of the pTPN, in order, keeping
+    at most window chunks pending in the executor.
+    """
+    supports = {}
+    pending = deque()
+    chunk = []
+    for el in elements:
+        chunk.append(_element_record(tag,el,guard_table,refs))
+        if len(chunk)==chunk_size:
+            pending.append(executor.submit(_serialize_records,tag,chunk,
+                                           _chunk_supports(chunk,guard_table,refs,supports)))
+            chunk = []
+            if len(pending)>=window:
+                yield pending.popleft().result()
+    if len(chunk)>0:
+        pending.append(executor.submit(_serialize_records,tag,chunk,
+                                       _chunk_supports(chunk,guard_table,refs,supports)))
+    while len(pending)>0:
+        yield pending.popleft().result()
+
+
+#Compact, picklable representations of the elements of a pTPN, with the same
+#attributes used by the export functions.
+_Reference = namedtuple('_Reference',['id','name'])
+_EventRecord = namedtuple('_EventRecord',['id','name','support'])
+_ConstraintRecord = namedtuple('_ConstraintRecord',['id','name','support','start','end','type','lb','ub','distribution'])
+_EpisodeRecord = namedtuple('_EpisodeRecord',['id','name','support','start','end','duration','action','all_state_constraints'])
+_ChoiceRecord = namedtuple('_ChoiceRecord',['id','name','support','type','domain','utility','probability'])
+_LinearConstraintRecord = namedtuple('_LinearConstraintRecord',['as_string'])
+_AssignmentConstraintRecord = namedtuple('_AssignmentConstraintRecord',['scope','values'])
+
+
+def _reference(obj,refs):
+    """Reference to an event, choice or state variable (one per object)."""
+    if not obj in refs:
+        refs[obj] = _Reference(obj.id,obj.name)
+    return refs[obj]
+
+
+def _element_record(tag,el,guard_table,refs):
+    """
+    Record of an element in a section of the pTPN. Events, choices and state
+    variables referred to by the element are represented by references, and
+    its support by the ID of its guard in the table (in 'flattened' mode, the
+    supports of the guards used by a chunk of records are sent along with it).
+    """
+    support = guard_table.guard_id(el.support)
+    if tag=='events':
+        return _EventRecord(el.id,el.name,support)
+    elif tag=='temporal-constraints':
+        return _ConstraintRecord(el.id,el.name,support,_reference(el.start,refs),_reference(el.end,refs),
+                                 el.type,el.lb,el.ub,el.distribution)
+    elif tag=='episodes':
+        dur = el.duration
+        scs=[]
+        for sc in el.all_state_constraints:
+            if isinstance(sc,LinearStateConstraint):
+                scs.append(_LinearConstraintRecord(sc.as_string))
+            elif isinstance(sc,AssignmentStateConstraint):
+                scs.append(_AssignmentConstraintRecord(tuple(_reference(sv,refs) for sv in sc.scope),tuple(sc.values)))
+            else:
+                scs.append(sc)
+        return _EpisodeRecord(el.id,el.name,support,_reference(el.start,refs),_reference(el.end,refs),
+                              _ConstraintRecord(None,None,None,None,None,dur.type,dur.lb,dur.ub,dur.distribution),
+                              str(el.action),scs)
+    else:
+        return _ChoiceRecord(el.id,el.name,support,el.type,list(el.domain),
+                             list(el.utility),list(el.probability))
+
+
+def _chunk_supports(chunk,guard_table,refs,supports):
+    """
+    Supports of the guards used by a chunk of records in 'flattened' mode,
+    indexed by guard ID, or None in 'shared' mode. Supports are converted to
+    references once, and kept in a dictionary of supports.
+    """
+    if guard_table.mode=='shared':
+        return None
+    chunk_supports={}
+    for record in chunk:
+        g_id = record.support
+        if not g_id in chunk_supports:
+            if not g_id in supports:
+                supports[g_id] = tuple(tuple(ChoiceAssignment(_reference(a.var,refs),a.value,a.negated)
+                                             for a in conj) for conj in guard_table.support(g_id))
+            chunk_supports[g_id] = supports[g_id]
+    return chunk_supports
+
+
+def _serialize_records(tag,records,supports):
+    """Serializes a chunk of element records (in a worker process)."""
+    guards = _RecordGuards(supports)
+    export = _RECORD_EXPORTERS[tag]
+    fragment = _FragmentWriter()
+    for record in records:
+        write_xml_element(fragment,export(record,guards),3,guards.fragments)
+    return ''.join(fragment)
+
+
+class _RecordGuards(object):
+    """
+    Guards of records, whose supports are IDs of guards in a GuardTable, with
+    the same interface as a GuardTable. Guards are either references to the
+    shared ones, or written from the given supports of each ID.
+    """
+    def __init__(self,supports=None):
+        self.supports = supports
+        self.fragments = {}
+        self._elements = {}
+
+    def element(self,guard_id):
+        if not guard_id in self._elements:
+            if self.supports==None:
+                g_xml = ET.Element('guard')
+                g_ref = ET.SubElement(g_xml,'guard-reference')
+                g_ref.text = guard_id
+            else:
+                g_xml = export_guard(self.supports[guard_id])
+            self._elements[guard_id] = g_xml
+            self.fragments[id(g_xml)] = {}
+        return self._elements[guard_id]
+
+
+def _guard_key(support):
+    """
+    Canonical hashable form of a support as written to a guard, i.e., with
+    choices identified by their IDs (so that renaming a choice changes the
+    keys of the supports that mention it).
+    """
+    return frozenset(frozenset((a.var.id,a.value,a.negated) for a in conj) for conj in support)
+
+
+def _duration_fingerprint(tc):
+    if tc.type=='uncontrollable_probabilistic':
+        return (tc.type,tuple(sorted(tc.distribution.items())))
+    return (tc.type,tc.lb,tc.ub)
+
+def _event_fingerprint(ev):
+    return (ev.id,ev.name,_guard_key(ev.support))
+
+def _temporal_constraint_fingerprint(tc):
+    return (tc.id,tc.name,_guard_key(tc.support),tc.start.id,tc.end.id,_duration_fingerprint(tc))
+
+def _episode_fingerprint(ep):
+    return (ep.id,ep.name,_guard_key(ep.support),ep.start.id,ep.end.id,str(ep.action),
+            _duration_fingerprint(ep.duration),
+            frozenset((sc.__class__,sc.as_string) for sc in ep.all_state_constraints))
+
+def _chance_constraint_fingerprint(cc):
+    return (cc.id,cc.name,cc.risk,tuple(c.id for c in cc.constraints))
+
+def _choice_fingerprint(choice):
+    return (choice.id,choice.name,_guard_key(choice.support),choice.type,
+            tuple(choice.domain),tuple(choice.utility),tuple(choice.probability))
+
+def _state_variable_fingerprint(sv):
+    return (sv.id,sv.name,sv.type,tuple(sv.domain))
+
+_FINGERPRINTS = {'events':_event_fingerprint,
+                 'temporal-constraints':_temporal_constraint_fingerprint,
+                 'episodes':_episode_fingerprint,
+                 'chance-constraints':_chance_constraint_fingerprint,
+                 'decision-variables':_choice_fingerprint,
+                 'state-variables':_state_variable_fingerprint}
+
+
+def _exported_constraints_and_episodes(prog,exclude_op):
+    """
+    Temporal constraints and primitive episodes to be written to a pTPN.
+    """
+    #Primitive episode durations
+    durations = set([ep.duration for ep in prog.primitive_episodes])
+
+    #Temporal constraints that are not durations, so that they don't get added
+    #twice in the pTPN
+    temporal_constraints = [tc for tc in prog.temporal_constraints if not tc in durations]
+
+    #Removes opearators from the policy, leaving only their temporal duration
+    episode_list=[]
+    for e in prog.primitive_episodes:
+        if e.action in exclude_op:
+            temporal_constraints.append(e.duration)
+        else:
+            episode_list.append(e)
+    return temporal_constraints,episode_list
+
+
+def _guarded_elements(prog,temporal_constraints,episode_list):
+    """Elements with guards, in the order they are written to a pTPN."""
+    for ev in prog.events:
+        yield ev
+    for tc in temporal_constraints:
+        yield tc
+    for ep in episode_list:
+        yield ep
+    for c in prog.choices:
+        yield c
+
+
+class _FragmentWriter(list):
+    """File-like list of serialized strings."""
+    write = list.append
+
+
+def _escape_xml(data):
+    """Escapes text and attribute values the way minidom does."""
+    return data.replace('&','&amp;').replace('<','&lt;').replace('"','&quot;').replace('>','&gt;')
+
+
+class GuardTable(object):
+    """
+    Guards of the elements in a pTPN, generated only once per canonical support
+    (elements under the same branch of a program have identical guards).
+
+    In 'flattened' mode, every element has its own copy of the guard written by
+    export_guard(). In 'shared' mode, the distinct guards are written once, to a
+    table of guard definitions with IDs, and elements only have a guard
+    referring to one of them, e.g.,
+
+    <guards>
+        <guard-definition>
+            <id>G0</id>
+            <guard>...</guard>
+        </guard-definition>
+    </guards>
+    ...
+    <guard><guard-reference>G0</guard-reference></guard>
+    """
+    def __init__(self,mode='flattened'):
+        if not mode in ['flattened','shared']:
+            raise ValueError('Guards must be exported either flattened or shared.')
+        self.mode = mode
+        self.ids = {}
+        self.fragments = {}
+        self._supports = []
+        self._elements = {}
+
+    def guard_id(self,support):
+        """ID of a guard in the table, in order of first use."""
+        key = _guard_key(support)
+        if not key in self.ids:
+            self.ids[key] = 'G%d'%(len(self.ids))
+            self._supports.append(support)
+        return self.ids[key]
+
+    def representative(self,support):
+        """
+        First support used with the same canonical form, from which its guard
+        is written (equal supports may list their assignments in different
+        orders).
+        """
+        return self.support(self.guard_id(support))
+
+    def support(self,guard_id):
+        """Support from which a guard in the table is written."""
+        return self._supports[int(guard_id[1:])]
+
+    def element(self,support):
+        """
+        Guard element for a support, which is the same object for all elements
+        with the same support (see write_xml_element()).
+        """
+        key = _guard_key(support)
+        if not key in self._elements:
+            if self.mode=='shared':
+                g_xml = ET.Element('guard')
+                g_ref = ET.SubElement(g_xml,'guard-reference')
+                g_ref.text = self.guard_id(support)
+            else:
+                g_xml = export_guard(self.representative(support))
+            self._elements[key] = g_xml
+            self.fragments[id(g_xml)] = {}
+        return self._elements[key]
+
+    def definitions(self,used=None):
+        """
+        Guard definitions in the table, in order of their IDs (only those in a
+        set of used IDs, if one is given).
+        """
+        for support in self._supports:
+            g_id = self.ids[_guard_key(support)]
+            if used!=None and not g_id in used:
+                continue
+            gd_xml = ET.Element('guard-definition')
+            gd_id = ET.SubElement(gd_xml,'id')
+            gd_id.text = g_id
+            gd_xml.append(export_guard(support))
+            yield gd_xml
+
+
 def export_header_fields(tpn_xml,prog,bogusID=''):
     """
     Adds the fields that compose the 'header' of a pTPN XML file.
@@ -145,7 +740,7 @@ def export_header_fields(tpn_xml,prog,bogusID=''):
         prog_end.text = _element_id(prog.last_event)
 
 
-def export_temporal_event(temp_event):
+def export_temporal_event(temp_event,guards=None):
     """
     Generates the portion of a pTPN file corresponding to a temporal event that
     is not a choice.
@@ -157,19 +752,19 @@ def export_temporal_event(temp_event):
     ev_id.text = _element_id(temp_event)
     ev_name.text = _element_name(temp_event)
 
-    ev_xml.append(export_guard(temp_event.support))
+    ev_xml.append(_export_guard(temp_event.support,guards))
 
     return ev_xml
 
 
-def export_temporal_constraint(tc):
+def export_temporal_constraint(tc,guards=None):
     """
     Generates the portion of a pTPN file corresponding to a temporal constraint.
     """
     tc_xml = ET.Element('temporal-constraint')
     tc_id = ET.SubElement(tc_xml,'id')
     tc_name = ET.SubElement(tc_xml,'name')
-    tc_xml.append(export_guard(tc.support))
+    tc_xml.append(_export_guard(tc.support,guards))
     tc_to_event = ET.SubElement(tc_xml,'to-event')
     tc_from_event = ET.SubElement(tc_xml,'from-event')
     tc_xml.append(export_duration(tc))
@@ -182,14 +777,14 @@ def export_temporal_constraint(tc):
     return tc_xml
 
 
-def export_episode(episode):
+def export_episode(episode,guards=None):
     """
     Generates the portion of a pTPN file corresponding to an episode.
     """
     ep_xml = ET.Element('episode')
     ep_id = ET.SubElement(ep_xml,'id')
     ep_name = ET.SubElement(ep_xml,'name')
-    ep_xml.append(export_guard(episode.support))
+    ep_xml.append(_export_guard(episode.support,guards))
     ep_to_event = ET.SubElement(ep_xml,'to-event')
     ep_from_event = ET.SubElement(ep_xml,'from-event')
     ep_xml.append(export_duration(episode.duration))
@@ -205,7 +800,7 @@ def export_episode(episode):
     return ep_xml
 
 
-def export_choice(choice):
+def export_choice(choice,guards=None):
     """
     Generates the portion of a pTPN file corresponding to a choice (controllable
     or not).
@@ -216,7 +811,7 @@ def export_choice(choice):
     c_xml = ET.Element('decision-variable')
     c_id = ET.SubElement(c_xml,'id')
     c_name = ET.SubElement(c_xml,'name')
-    c_xml.append(export_guard(choice.support))
+    c_xml.append(_export_guard(choice.support,guards))
     c_type = ET.SubElement(c_xml,'type')
     c_at = ET.SubElement(c_xml,'at-event')
     c_xml.append(export_choice_domain(choice))
@@ -291,6 +886,11 @@ def export_guard(support):
     return g_xml
 
 
+def _export_guard(support,guards):
+    """Guard from a GuardTable, if any, or written by export_guard()."""
+    return guards.element(support) if guards!=None else export_guard(support)
+
+
 def export_duration(duration):
     """
     Generates the portion of a pTPN file corresponding to a duration.
@@ -403,9 +1003,9 @@ def export_state_constraints(state_constraints):
         sc_and_xml=ET.SubElement(sc_wff,'and')
         for sc in state_constraints:
             sc_and_wff_xml=ET.SubElement(sc_and_xml,'wff')
-            if isinstance(sc,LinearStateConstraint):
+            if isinstance(sc,(LinearStateConstraint,_LinearConstraintRecord)):
                 sc_and_wff_xml.append(export_linear_state_constraint(sc))
-            elif isinstance(sc,AssignmentStateConstraint):
+            elif isinstance(sc,(AssignmentStateConstraint,_AssignmentConstraintRecord)):
                 sc_and_wff_xml.append(export_assignments_state_constraint(sc))
             else:
                 raise NotImplementedError('Only linear and assignment constraints are supported as of now.')
@@ -470,3 +1070,421 @@ def _choice_id(el):
 def _choice_name(el):
     """Name associated to a choice ID."""
     return _element_name(el)+'C'
+
+
+def from_ptpn(source):
+    """
+    Reads a pTPN XML (from a file name or a file object) into an RMPyL program,
+    in a single pass over the file, so the source doesn't need to be seekable.
+    Elements of the XML are discarded as soon as they have been read, so the
+    memory used is that of the program being built, and not of its XML tree.
+
+    The pTPN is flat, so the imported program's plan is a parallel composition
+    of its primitive episodes, to which all other temporal constraints belong.
+    Choice values, state constraints and durations are the same as in the
+    exported program, with the exception of choice domains: the pTPN doesn't
+    record the types of choice values, so they are read back as the strings
+    written by str() (e.g., a domain [1,2] is imported as ['1','2']), and so
+    are the values in guards.
+    """
+    importer = PTPNImporter()
+    stack = []
+    for action,elem in ET.iterparse(source,events=('start','end')):
+        if action=='start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        depth = len(stack)
+        tag = _local_tag(elem.tag)
+        if depth==2 and tag in ['id','name','start-event','end-event']:
+            importer.import_header_field(tag,elem.text)
+        elif (depth==3 and tag in _IMPORTERS) or (depth==2 and tag=='initial-state'):
+            getattr(importer,_IMPORTERS[tag])(elem)
+        else:
+            continue
+        #Converted elements are removed from the tree as they are read
+        elem.clear()
+        stack[-1].remove(elem)
+    return importer.program()
+
+
+_IMPORTERS = {'guard-definition':'import_guard_definition',
+              'event':'import_event',
+              'temporal-constraint':'import_temporal_constraint',
+              'episode':'import_episode',
+              'chance-constraint':'import_chance_constraint',
+              'decision-variable':'import_choice',
+              'state-variable':'import_state_variable',
+              'initial-state':'import_initial_state'}
+
+
+class PTPNImporter(object):
+    """
+    Reads the elements of a pTPN XML, in the order they appear in the file, and
+    builds the elements of an RMPyL program from them in program().
+
+    Decision variables are listed after the events, constraints and guards that
+    refer to them, so these elements are kept as specifications until all of
+    the file has been read. In particular, guards are kept unresolved, with
+    (choice ID,value,negated) tuples instead of choice assignments (see
+    import_guard()). Likewise, state constraints are only built once the
+    state variables, which are listed last, are known.
+    """
+    def __init__(self):
+        self.header = {}
+        self.events = {}
+        self.choices = {}
+        self.temporal_constraints = {}
+        self.episodes = []
+        self.chance_constraints = []
+        self.state_variables = {}
+        self.initial_state = {}
+        self.guards = {}
+        self._event_specs = []
+        self._temporal_constraint_specs = []
+        self._episode_specs = []
+        self._chance_constraint_specs = []
+        self._state_constraints = {}
+
+    def import_header_field(self,tag,text):
+        self.header[tag] = text
+
+    def event(self,event_id):
+        """
+        Event (or choice) with a given ID, created on first reference. Only
+        valid once all decision variables have been imported.
+        """
+        if not event_id in self.events:
+            if event_id in self.choices:
+                self.events[event_id] = self.choices[event_id]
+            else:
+                self.events[event_id] = Event(id=event_id)
+        return self.events[event_id]
+
+    def choice(self,choice_id):
+        """Choice with a given ID (see _choice_id()), imported by import_choice()."""
+        choice = self.choices.get(_choice_event_id(choice_id))
+        if choice==None:
+            raise ValueError('Decision variable %s is not in the pTPN.'%(choice_id))
+        return choice
+
+    def import_guard_definition(self,gd_xml):
+        self.guards[_child_text(gd_xml,'id')] = self.import_guard(_child(gd_xml,'guard'))
+
+    def import_event(self,ev_xml):
+        self._event_specs.append((_child_text(ev_xml,'id'),_child_text(ev_xml,'name'),
+                                  self._guard(ev_xml)))
+
+    def import_temporal_constraint(self,tc_xml):
+        kwargs = import_duration(_child(tc_xml,'duration'))
+        kwargs.update(id=_child_text(tc_xml,'id'),name=_child_text(tc_xml,'name'))
+        self._temporal_constraint_specs.append((_child_text(tc_xml,'from-event'),_child_text(tc_xml,'to-event'),
+                                                kwargs,self._guard(tc_xml)))
+
+    def import_episode(self,ep_xml):
+        kwargs = {'id':_child_text(ep_xml,'id'),
+                  'name':_child_text(ep_xml,'name'),
+                  'action':_child_text(ep_xml,'dispatch',''),
+                  'duration':import_duration(_child(ep_xml,'duration'))}
+        sc_xml = _child(ep_xml,'state-constraint')
+        specs = import_state_constraint_specs(sc_xml) if sc_xml!=None else []
+        self._episode_specs.append((_child_text(ep_xml,'from-event'),_child_text(ep_xml,'to-event'),
+                                    kwargs,self._guard(ep_xml),specs))
+
+    def import_chance_constraint(self,cc_xml):
+        self._chance_constraint_specs.append(((_child_text(cc_xml,'constraints','') or '').split(),
+                                              {'risk':1.0-float(_child_text(cc_xml,'probability')),
+                                               'id':_child_text(cc_xml,'id'),
+                                               'name':_child_text(cc_xml,'name')}))
+
+    def import_choice(self,c_xml):
+        """Creates a choice, whose domain values are strings (see from_ptpn())."""
+        domain=[]; utility=[]; probability=[]
+        for domval in _children(_child(c_xml,'domain'),'domainval'):
+            domain.append(_child_text(domval,'value',''))
+            if _child(domval,'utility')!=None:
+                utility.append(_parse_number(_child_text(domval,'utility')))
+            if _child(domval,'probability')!=None:
+                probability.append(_parse_number(_child_text(domval,'probability')))
+        event_id = _choice_event_id(_child_text(c_xml,'id'))
+        choice = Choice(domain,_child_text(c_xml,'type'),id=event_id)
+        self.choices[event_id] = choice
+        if len(utility)>0:
+            choice.utility = utility
+        if len(probability)>0:
+            choice.probability = probability
+
+    def import_state_variable(self,sv_xml):
+        d_xml = _child(sv_xml,'domain')
+        finite = _child(d_xml,'finite-domain')
+        if finite!=None:
+            domain_dict = {'type':'finite-discrete',
+                           'domain':[val.text or '' for val in _children(finite,'value')]}
+        else:
+            d_range = _child(_child(d_xml,'continuous-domain'),'range')
+            domain_dict = {'type':'continuous',
+                           'domain':[_parse_number(_child_text(d_range,'lower-bound')),
+                                     _parse_number(_child_text(d_range,'upper-bound'))]}
+        sv = StateVariable(domain_dict,id=_child_text(sv_xml,'id'),name=_child_text(sv_xml,'name'))
+        self.state_variables[sv.id] = sv
+
+    def import_initial_state(self,state_xml):
+        for assig in _children(state_xml,'assignment'):
+            sv = self.state_variables[_child_text(assig,'state-variable')]
+            self.initial_state[sv] = _state_value(sv,_child_text(assig,'value',''))
+
+    def state_constraint(self,spec):
+        """
+        State constraint described by an imported specification. Equal
+        specifications give the same constraint object, as constraints imposed
+        over several episodes are only exported once per episode.
+        """
+        if not spec in self._state_constraints:
+            sv_by_name = {sv.name:sv for sv in self.state_variables.values()}
+            if spec[0]=='linear':
+                _,scope,coef,rel,rhs = spec
+                sc = LinearStateConstraint(scope=[sv_by_name[name] for name in scope],
+                                           coef=list(coef),rel=rel,rhs=rhs)
+            else:
+                scope = [sv_by_name[name] for name,_ in spec[1]]
+                values = [_state_value(sv,val) for sv,(_,val) in zip(scope,spec[1])]
+                sc = AssignmentStateConstraint(scope=scope,values=values)
+            self._state_constraints[spec] = sc
+        return self._state_constraints[spec]
+
+    def program(self):
+        """RMPyL program with all elements imported so far."""
+        #Imported here, since the rmpyl module depends on this one.
+        from .rmpyl import RMPyL
+
+        prog = RMPyL(**{f:self.header[f] for f in ['id','name'] if self.header.get(f)!=None})
+        self._build_elements()
+
+        start = self.events.get(self.header.get('start-event'))
+        end = self.events.get(self.header.get('end-event'))
+        tcs = list(self.temporal_constraints.values())
+        if start!=None and end!=None:
+            if len(self.episodes)==1 and self.episodes[0].start==start and self.episodes[0].end==end:
+                #The plan is a single primitive episode
+                prog.plan = self.episodes[0]
+                for tc in tcs:
+                    prog.add_temporal_constraint(tc)
+            else:
+                #Default IDs are memory addresses, which could clash with imported ones
+                plan = Episode(start=start,end=end,parallel=self.episodes,temporal_constraints=tcs,
+                               id=prog.id+'-plan')
+                #The plan's duration was exported as one of its temporal constraints
+                for tc in tcs:
+                    if tc.start==start and tc.end==end:
+                        plan.properties['duration'] = tc
+                        break
+                prog.plan = plan
+        else:
+            for tc in tcs:
+                prog.add_temporal_constraint(tc)
+
+        for ev in self.events.values():
+            prog.add_event(ev)
+        for sv in self.state_variables.values():
+            prog.add_state_variable(sv)
+        for cc in self.chance_constraints:
+            prog.add_chance_constraint(cc)
+        prog.initial_state = self.initial_state
+        return prog
+
+    def _build_elements(self):
+        """
+        Builds the events, temporal constraints, episodes and chance
+        constraints read so far, binding their guards to the imported choices.
+        """
+        for event_id,name,guard in self._event_specs:
+            ev = self.event(event_id)
+            ev.name = name
+            self._set_support(ev,guard)
+        self._event_specs = []
+
+        for start_id,end_id,kwargs,guard in self._temporal_constraint_specs:
+            tc = TemporalConstraint(start=self.event(start_id),end=self.event(end_id),**kwargs)
+            self._set_support(tc,guard)
+            self.temporal_constraints[tc.id] = tc
+        self._temporal_constraint_specs = []
+
+        for start_id,end_id,kwargs,guard,specs in self._episode_specs:
+            ep = Episode(start=self.event(start_id),end=self.event(end_id),**kwargs)
+            self._set_support(ep,guard)
+            for spec in specs:
+                ep.add_overall_state_constraint(self.state_constraint(spec))
+            self.episodes.append(ep)
+        self._episode_specs = []
+
+        for constraint_ids,kwargs in self._chance_constraint_specs:
+            constraints=[]
+            for c_id in constraint_ids:
+                if c_id in self.temporal_constraints:
+                    constraints.append(self.temporal_constraints[c_id])
+                else:
+                    warnings.warn('Constraint %s in chance constraint %s is not in the pTPN, and was ignored.'%(c_id,kwargs['id']))
+            self.chance_constraints.append(ChanceConstraint(constraint_scope=constraints,**kwargs))
+        self._chance_constraint_specs = []
+
+    def _guard(self,el_xml):
+        """Unresolved guard of an element, or None if it has none."""
+        g_xml = _child(el_xml,'guard')
+        return self.import_guard(g_xml) if g_xml!=None else None
+
+    def _set_support(self,el,guard):
+        if guard!=None:
+            el.support = self.support(guard)
+
+    def import_guard(self,g_xml):
+        """
+        Unresolved guard, to be converted into a support by support(). Besides
+        the disjunctions of conjunctions written by export_guard() and
+        references to shared guards (see GuardTable), arbitrary nestings of
+        'and', 'or', and negated 'decision-variable-equals' are accepted.
+
+        Guards are kept in DNF, with (choice ID,value,negated) tuples in place
+        of choice assignments. Conjunctions of disjunctions can only be
+        distributed once the choice domains are known, so they are kept as
+        ('and',guards) tuples, and disjunctions of those as ('or',guards).
+        """
+        content = g_xml[0]
+        tag = _local_tag(content.tag)
+        if tag=='boolean-constant':
+            return set([frozenset()]) if content.text.strip()=='true' else set()
+        elif tag=='or':
+            guards = [self.import_guard(g) for g in _children(content,'guard')]
+            if all(isinstance(g,set) for g in guards):
+                return set().union(*guards)
+            return ('or',guards)
+        elif tag=='and':
+            guards = [self.import_guard(g) for g in _children(content,'guard')]
+            if all(isinstance(g,set) and len(g)==1 for g in guards):
+                #Conjunction of assignments, as written by export_guard()
+                return set([frozenset().union(*[next(iter(g)) for g in guards])])
+            return ('and',guards)
+        elif tag=='not':
+            return set([frozenset([_decision_equals(_child(content,'guard')[0],True)])])
+        elif tag=='decision-variable-equals':
+            return set([frozenset([_decision_equals(content,False)])])
+        elif tag=='guard-reference':
+            return self.guards[content.text]
+        raise ValueError('Unsupported guard <%s> in pTPN.'%(tag))
+
+    def support(self,guard):
+        """Support (in DNF) represented by an unresolved guard (see import_guard())."""
+        if isinstance(guard,set):
+            return set([frozenset([ChoiceAssignment(self.choice(c_id),value,negated)
+                                   for c_id,value,negated in conj]) for conj in guard])
+        op,guards = guard
+        if op=='or':
+            support = set()
+            for g in guards:
+                support.update(self.support(g))
+            return support
+        support = set([frozenset()])
+        for g in guards:
+            support = support_conjunction(support,self.support(g))
+        return support
+
+
+def _decision_equals(eq_xml,negated):
+    """Unresolved assignment (see PTPNImporter.import_guard()) to a decision variable."""
+    if _local_tag(eq_xml.tag)!='decision-variable-equals':
+        raise ValueError('Only assignments to decision variables can be negated in guards.')
+    return (_child_text(eq_xml,'variable'),_child_text(eq_xml,'value',''),negated)
+
+
+def import_duration(dur_xml):
+    """
+    Keyword arguments of a TemporalConstraint, as represented by the duration
+    portion of a pTPN (see export_duration()).
+    """
+    content = dur_xml[0]
+    tag = _local_tag(content.tag)
+    if tag in ['bounded-duration','set-bounded-uncertain-duration']:
+        return {'ctype':'controllable' if tag=='bounded-duration' else 'uncontrollable_bounded',
+                'lb':_parse_number(_child_text(content,'lower-bound')),
+                'ub':_parse_number(_child_text(content,'upper-bound'))}
+    elif tag=='probabilistic-uncertain-duration':
+        dist_type = _child_text(content,'distribution-type').upper()
+        params = [_parse_number(p.text) for p in _children(_child(content,'parameters'),'parameter')]
+        if dist_type in ['GAUSSIAN','NORMAL']:
+            distribution = {'type':'gaussian','mean':params[0],'variance':params[1]}
+        elif dist_type=='UNIFORM':
+            distribution = {'type':'uniform','lb':params[0],'ub':params[1]}
+        else:
+            raise TypeError('Invalid type of probability distribution.')
+        return {'ctype':'uncontrollable_probabilistic','distribution':distribution}
+    raise TypeError('Invalid type of temporal constraint.')
+
+
+def import_state_constraint_specs(sc_xml):
+    """
+    Hashable specifications of the state constraints represented by the state
+    constraint portion of a pTPN (see export_state_constraints()), to be built
+    once the state variables are known.
+    """
+    specs=[]
+    wff_content = _child(sc_xml,'wff')[0]
+    if _local_tag(wff_content.tag)=='and':
+        for wff in _children(wff_content,'wff'):
+            content = wff[0]
+            if _local_tag(content.tag)=='boolean-expression':
+                lhs,rel = _child_text(content,'condition').rsplit(' ',1)
+                rhs = _parse_number(_child_text(_child(content,'value'),'constant'))
+                tokens = _LINEAR_TERM.split(lhs)
+                coef = tuple(_parse_number(t[:-1]) for t in tokens[1::2])
+                scope = tuple(tokens[2::2])
+                specs.append(('linear',scope,coef,rel,rhs))
+            else:
+                assigs=[]
+                for a_wff in _children(content,'wff'):
+                    be = _child(a_wff,'boolean-expression')
+                    assigs.append((_child_text(be,'condition')[:-1],
+                                   _child_text(_child(be,'value'),'constant','')))
+                specs.append(('assignment',tuple(assigs)))
+    return specs
+
+
+#Signed coefficient of a term in the string representation of a linear constraint
+_LINEAR_TERM = re.compile(r'([+-][0-9.]+(?:[eE][+-]?[0-9]+)?\*)')
+
+
+def _local_tag(tag):
+    """Tag without its namespace."""
+    return tag.rsplit('}',1)[-1]
+
+def _children(elem,tag):
+    return [c for c in elem if _local_tag(c.tag)==tag]
+
+def _child(elem,tag):
+    for c in elem:
+        if _local_tag(c.tag)==tag:
+            return c
+    return None
+
+def _child_text(elem,tag,default=None):
+    c = _child(elem,tag)
+    return default if (c==None or c.text==None) else c.text
+
+def _parse_number(text):
+    """Integer or float written by str()."""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def _state_value(state_var,text):
+    """Value of a state variable written by str()."""
+    return text if state_var.type=='finite-discrete' else _parse_number(text)
+
+def _choice_event_id(choice_id):
+    """Inverse of _choice_id()."""
+    return choice_id[:-1]
+
+
+_RECORD_EXPORTERS = {'events':export_temporal_event,
+                     'temporal-constraints':export_temporal_constraint,
+                     'episodes':export_episode,
+                     'decision-variables':export_choice}
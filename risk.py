@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Monte Carlo estimation of the risk of violating the chance constraints of RMPyL
+programs, with confidence intervals and early stopping.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from .defs import ChoiceAssignment
+from .simulation import ScheduleSimulator,norm_ppf,uniform_sequence
+from .execution import RMPyLObservationSampler,random_generator
+from .rmpylexceptions import MissingArgumentError
+
+try:
+    import numpy as np
+except ImportError: #NumPy is optional, and only used for numerical analyses
+    np = None
+
+class RiskEstimate(object):
+    """
+    Estimated probability of violating the temporal constraints in the scope
+    of a chance constraint, with a Wilson score confidence interval. Samples
+    with likelihood ratio weights (from importance sampling) give weighted
+    estimates, with a normal confidence interval.
+    """
+    def __init__(self,chance_constraint,confidence):
+        self.chance_constraint = chance_constraint
+        self.confidence = confidence
+        self._z = float(norm_ppf(np.array([0.5+confidence/2.0]))[0])
+        self.violations = 0
+        self.num_samples = 0
+        self.weighted = False
+        self.violation_weight = 0.0
+        self.violation_weight_sq = 0.0
+
+    def add_samples(self,violated,weights=None):
+        """Adds a boolean array of violations, and their weights if any."""
+        self.num_samples+=len(violated)
+        self.violations+=int(violated.sum())
+        if weights is None:
+            self.violation_weight+=float(violated.sum())
+            self.violation_weight_sq+=float(violated.sum())
+        else:
+            self.weighted = True
+            w = weights[violated]
+            self.violation_weight+=float(w.sum())
+            self.violation_weight_sq+=float((w*w).sum())
+
+    @property
+    def risk_bound(self):
+        return self.chance_constraint.risk
+
+    @property
+    def probability(self):
+        """Point estimate of the probability of violation."""
+        return self.violation_weight/float(self.num_samples) if self.num_samples>0 else 0.0
+
+    @property
+    def interval(self):
+        """Confidence interval for the probability of violation."""
+        n = float(self.num_samples)
+        if n==0:
+            return 0.0,1.0
+        if self.weighted:
+            p = self.probability
+            variance = max(self.violation_weight_sq/n-p*p,0.0)/n
+            if self.violations==0:
+                #No violations yet, so the sample variance is zero: use the
+                #width of the Wilson interval for zero violations instead.
+                variance = max(variance,(self._z/n)**2)
+            half = self._z*variance**0.5
+            return max(p-half,0.0),min(p+half,1.0)
+        p = self.violations/n; z2 = self._z*self._z
+        center = (p+z2/(2.0*n))/(1.0+z2/n)
+        half = self._z*((p*(1.0-p)/n+z2/(4.0*n*n))**0.5)/(1.0+z2/n)
+        return max(center-half,0.0),min(center+half,1.0)
+
+    @property
+    def satisfied(self):
+        """
+        True (False) if the confidence interval is entirely below (above) the
+        chance constraint's risk bound, and None while it is still undecided.
+        """
+        lower,upper = self.interval
+        if upper<=self.risk_bound:
+            return True
+        elif lower>self.risk_bound:
+            return False
+        return None
+
+    def __repr__(self):
+        return 'RiskEstimate(at 0x%x) p=%.6f, interval=(%.6f,%.6f), risk=%f, samples=%d'%(
+                id(self),self.probability,self.interval[0],self.interval[1],self.risk_bound,self.num_samples)
+
+
+class RiskEstimator(object):
+    """
+    Estimates the risk of the chance constraints of an RMPyL program under a
+    fixed assignment to its decisions. Each sample draws values for all
+    observations (from Choice.probability for probabilistic choices, and
+    uniformly for uncontrollable ones) and for all uncontrollable durations.
+    Samples are grouped by scenario, and each scenario's projection and
+    schedule simulator are compiled only once. Only the temporal constraints
+    in the scope of chance constraints are evaluated.
+
+    Variance can be reduced with a different observation sampler (e.g., a
+    StratifiedObservationSampler, or an ImportanceObservationSampler for rare
+    failures), and with quasi-random durations (sequence='halton' or 'sobol',
+    see simulation.uniform_sequence()).
+    """
+    def __init__(self,prog,decisions=None,confidence=0.95,sampler=None,sequence='random'):
+        if np==None:
+            raise ImportError('NumPy is required by the risk estimator.')
+        self.prog = prog
+        self.confidence = confidence
+        decisions = decisions if decisions!=None else {}
+        missing = [d for d in prog.decisions if not d in decisions]
+        if len(missing)>0:
+            raise MissingArgumentError('Risk estimation requires values for all decisions: '+str([d.name for d in missing]))
+        self.decisions = [ChoiceAssignment(d,decisions[d],False) for d in prog.decisions]
+
+        self.sampler = sampler if sampler!=None else RMPyLObservationSampler(prog)
+        self.observations = self.sampler.observations
+        self.sequence = sequence
+        self._simulators={}
+        self._sequences={}
+
+    def scenario_simulator(self,values):
+        """
+        Schedule simulator for the scenario given by a tuple of observation
+        value indices, plus the rows of its constraints and the scenario's key
+        (the indices of its active elements).
+        """
+        assignments = list(self.decisions)
+        for obs,val in zip(self.observations,values):
+            if val>=0: #Unreached observations are -1 (see HierarchicalObservationSampler)
+                assignments.append(ChoiceAssignment(obs,obs.domain[val],False))
+        projection = self.prog.project(assignments)
+        key = projection.active_indices
+        if not key in self._simulators:
+            sim = ScheduleSimulator(projection)
+            self._simulators[key] = (sim,{tc:i for i,tc in enumerate(sim.constraints)},key)
+        return self._simulators[key]
+
+    def evaluate(self,chance_constraints=None,max_samples=100000,min_samples=1000,
+                 batch_size=5000,seed=None):
+        """
+        Estimates the risk of a set of chance constraints (all of the program's
+        by default). Sampling stops once every confidence interval is entirely
+        above or below its risk bound (after at least min_samples samples), or
+        after max_samples samples. Returns a dictionary from chance constraints
+        to RiskEstimate objects.
+        """
+        rng = random_generator(seed)
+        if chance_constraints==None:
+            chance_constraints = self.prog.chance_constraints
+        estimates = {cc:RiskEstimate(cc,self.confidence) for cc in chance_constraints}
+
+        total = 0
+        while total<max_samples:
+            batch = min(batch_size,max_samples-total)
+            self._evaluate_batch(estimates,batch,rng)
+            total+=batch
+            if total>=min_samples and all(est.satisfied!=None for est in estimates.values()):
+                break
+        return estimates
+
+    def is_safe(self,**kwargs):
+        """
+        Whether all chance constraints are satisfied with the estimator's
+        confidence (undecided estimates count as unsafe).
+        """
+        return all(est.satisfied==True for est in self.evaluate(**kwargs).values())
+
+    def _evaluate_batch(self,estimates,num_samples,rng):
+        observations,weights = self.sampler.sample_weighted_batch(num_samples,rng)
+        observations = observations.T
+        if np.all(weights==1.0):
+            weights = None
+        if len(self.observations)>0:
+            scenarios,inverse = np.unique(observations,axis=1,return_inverse=True)
+            inverse = inverse.ravel()
+        else:
+            scenarios,inverse = np.zeros((0,1),dtype=np.intp),np.zeros(num_samples,dtype=np.intp)
+
+        for s in range(scenarios.shape[1]):
+            members = np.flatnonzero(inverse==s)
+            count = len(members)
+            sim,rows,key = self.scenario_simulator(tuple(scenarios[:,s]))
+            #Each scenario continues its own sequence of duration variates, so
+            #that quasi-random sequences keep their even coverage across batches.
+            if not key in self._sequences:
+                self._sequences[key] = uniform_sequence(self.sequence,sim.num_uncontrollable,rng)
+            uniforms = self._sequences[key].random(count)
+            times = sim.schedule(sim.durations(uniforms))
+            violations = sim.violations(times)
+            scenario_weights = weights[members] if weights is not None else None
+            for cc,est in estimates.items():
+                scope = [rows[c] for c in cc.constraints if c in rows]
+                if len(scope)>0:
+                    est.add_samples(violations[scope].any(axis=0),scenario_weights)
+                else:
+                    est.add_samples(np.zeros(count,dtype=bool),scenario_weights)
@@ -47,7 +47,10 @@ from .utils import valid_assignment
 from .constraints import TemporalConstraint
 from .episodes import Episode,sequence_composition,parallel_composition,choose_composition
 from .rmpylexceptions import InvalidTypeError,IDError,CompositionError,DuplicateElementError
-from .ptpn import to_ptpn
+from .ptpn import to_ptpn,PTPNExporter
+from .projection import SupportIndex
+from .stn import IncrementalConsistencyChecker
+from .execution import RMPyLTraverser
 
 class RMPyL(NamedElement):
     """
@@ -70,8 +73,12 @@ class RMPyL(NamedElement):
         self._primitive_episodes=set()
         self._events = set()
         self._user_state_variables = set()
+        self._user_events = set()
         self._cached=False
         self._episode_mapping={}
+        self._support_index=None
+        self._consistency_checker=None
+        self._ptpn_exporter=None
         #self._event_successors={}
 
     @property
@@ -86,6 +93,8 @@ class RMPyL(NamedElement):
             raise InvalidTypeError('Plans should be represented as Episodes.')
         self._plan_episode = new_plan
         self._cached=False
+        if self._consistency_checker!=None:
+            self._consistency_checker.mark_stale()
 
     @property
     def first_event(self):
@@ -237,6 +246,23 @@ class RMPyL(NamedElement):
         self._update_recursive()
         return self._episode_mapping
 
+    @property
+    def support_index(self):
+        """
+        Index from choice assignments to the elements they guard.
+        """
+        self._update_recursive()
+        if self._support_index==None:
+            self._support_index = SupportIndex(self)
+        return self._support_index
+
+    @property
+    def consistency_checker(self):
+        """
+        Incremental temporal consistency checker attached to the program, if any.
+        """
+        return self._consistency_checker
+
     # @property
     # def event_successors(self):
     #     """
@@ -374,16 +400,66 @@ class RMPyL(NamedElement):
         Adds a temporal constraint to the plan.
         """
         if not tc in self._user_temporal_constraints:
+            if self._consistency_checker!=None:
+                #Raises TemporalInconsistencyError, leaving the program unchanged
+                self._consistency_checker.check_addition(tc)
             self._user_temporal_constraints.add(tc)
             self._update_temporal_constraint_guard(tc)
             self._cached=False
         else:
             raise DuplicateElementError('Tried adding repeated temporal constraint '+str(tc))
 
+    def attach_consistency_checker(self,include_uncontrollable=False):
+        """
+        Attaches an incremental temporal consistency checker to the program,
+        so that temporal constraints that would make it inconsistent are
+        rejected when added. Returns the checker, which can also tighten
+        constraints and roll changes back.
+        """
+        self._consistency_checker = IncrementalConsistencyChecker(self,include_uncontrollable)
+        return self._consistency_checker
+
+    def detach_consistency_checker(self):
+        """
+        Stops checking the consistency of new temporal constraints.
+        """
+        self._consistency_checker = None
+
+    @property
+    def ptpn_exporter(self):
+        """
+        pTPN exporter attached to the program, if any.
+        """
+        return self._ptpn_exporter
+
+    def attach_ptpn_exporter(self):
+        """
+        Attaches a pTPN exporter to the program, which keeps the XML of its
+        elements between calls to to_ptpn(), so that only elements modified in
+        the meantime are serialized again. Returns the exporter.
+        """
+        self._ptpn_exporter = PTPNExporter(self)
+        return self._ptpn_exporter
+
+    def detach_ptpn_exporter(self):
+        """
+        Discards the pTPN exporter and its cached XML.
+        """
+        self._ptpn_exporter = None
+
     def remove_temporal_constraint(self,tc):
         """
         Removes a temporal constraint from the internal sets.
         """
+        if self._consistency_checker!=None:
+            self._consistency_checker.retract(tc)
+        self._discard_temporal_constraint(tc)
+
+    def _discard_temporal_constraint(self,tc):
+        """
+        Removes a temporal constraint from the internal sets, without notifying
+        the consistency checker.
+        """
         self._user_temporal_constraints.discard(tc)
         for ep in self.episodes:
             tcs = ep.temporal_constraints
@@ -446,6 +522,14 @@ class RMPyL(NamedElement):
         self._user_state_variables.add(sv)
         self._cached=False
 
+    def add_event(self,event):
+        """
+        Adds an event to the program, even if it is not the start or end of any
+        of its episodes (e.g., events imported from a pTPN).
+        """
+        self._user_events.add(event)
+        self._cached=False
+
     def add_overall_state_constraint(self,state_constraint):
         """
         Syntactic sugar for imposing a state constraint on the whole program.
@@ -464,11 +548,63 @@ class RMPyL(NamedElement):
         self.add_temporal_constraint(overall)
         return overall
 
-    def to_ptpn(self,filename,exclude_op=['__stop__']):
-        """
-        Exports the RMPyL program to a pTPN XML.
-        """
-        return to_ptpn(prog=self,filename=filename,exclude_op=exclude_op)
+    def to_ptpn(self,filename,exclude_op=['__stop__'],streaming=False,guards='flattened',processes=None):
+        """
+        Exports the RMPyL program to a pTPN XML (written incrementally to the
+        file if streaming=True, see ptpn.write_ptpn()). If a pTPN exporter is
+        attached to the program, the XML is written by it.
+        """
+        if self._ptpn_exporter!=None and filename!=None and processes==None:
+            self._ptpn_exporter.write(filename,exclude_op,guards)
+            return None if streaming else self._ptpn_exporter.tostring()
+        return to_ptpn(prog=self,filename=filename,exclude_op=exclude_op,streaming=streaming,guards=guards,processes=processes)
+
+    def project(self,assignments):
+        """
+        Returns the component of the program (events, primitive episodes and
+        temporal constraints) that is active under a (partial) assignment to
+        its choices.
+        """
+        return self.support_index.project(assignments)
+
+    def count_scenarios(self,by_choice=False):
+        """
+        Number of scenarios of the program, i.e., of complete assignments to
+        the choices that are active in them. It is computed by dynamic
+        programming over the choice hierarchy, bottom-up: the scenarios below
+        a choice are the sum over its values of the product of the scenarios
+        below the choices each value activates. The top-level count is the
+        product over the initially active choices, so the cost is linear in
+        the size of the choice hierarchy and scenarios are never enumerated.
+
+        If by_choice is True, also returns a dictionary from each choice to
+        the number of scenarios of the subplan below it.
+        """
+        traverser = RMPyLTraverser(self)
+        roots = traverser.initially_active_choices
+        counts={}
+        stack = [(c,False) for c in roots]
+        while len(stack)>0:
+            choice,expanded = stack.pop()
+            if choice in counts:
+                continue
+            if not expanded:
+                stack.append((choice,True))
+                for value in choice.domain:
+                    stack.extend((c,False) for c in traverser.activated_choices(choice,value) if not c in counts)
+            else:
+                total = 0
+                for value in choice.domain:
+                    branch = 1
+                    for c in traverser.activated_choices(choice,value):
+                        branch*=counts[c]
+                    total+=branch
+                counts[choice]=total
+
+        num_scenarios = 1
+        for c in roots:
+            num_scenarios*=counts[c]
+        return (num_scenarios,counts) if by_choice else num_scenarios
 
     def __add__(self,other):
         """
@@ -539,6 +675,7 @@ class RMPyL(NamedElement):
         if (force or (not self._cached)):
             #Quantities do not have to be recomputed if the plan does not change
             self._cached=True
+            self._support_index=None
 
             if self._plan_episode!=None:
                 episodes,temp_consts,state_consts,events = self._recursive_traversal([self._plan_episode])
@@ -564,7 +701,7 @@ class RMPyL(NamedElement):
             for user_tc in self._user_temporal_constraints:
                 user_defined_events.add(user_tc.start)
                 user_defined_events.add(user_tc.end)
-            self._events = set(events).union(user_defined_events)
+            self._events = set(events).union(user_defined_events,self._user_events)
 
             #Updates the support of user-defined constraints
             self._update_all_user_constraint_guards()
@@ -79,4 +79,12 @@ class InconsistentSupportError(RMPyLException):
         super(InconsistentSupportError,self).__init__(value)        
         self.assignments=assignments  
 
+class TemporalInconsistencyError(RMPyLException):
+    """Raised when a set of temporal constraints is inconsistent."""
+    def __init__(self,value,conflict=None):
+        super(TemporalInconsistencyError,self).__init__(value)
+        self.conflict=conflict if conflict!=None else []
 
+class DispatchError(RMPyLException):
+    """Raised when an executive can't dispatch the remaining events of a plan."""
+    pass
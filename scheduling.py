@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Earliest/latest start times, slack and critical paths of controllable RMPyL
+programs (or of scenario projections), computed by the critical path method.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from array import array
+from collections import deque
+from .defs import Event
+from .constraints import TemporalConstraint
+from .stn import check_consistency
+from .rmpylexceptions import TemporalInconsistencyError
+
+_INF = float('inf')
+_TOL = 1e-9
+
+class Schedule(object):
+    """
+    Earliest and latest start times of the events of a program, relative to a
+    time origin at which the plan can start at the earliest, and with every
+    event occurring no later than the horizon. Times are stored in arrays
+    indexed like the events list.
+    """
+    def __init__(self,events,earliest,latest,horizon,method,constraints,episode_map):
+        self.events = events
+        self.event_index = {ev:i for i,ev in enumerate(events)}
+        self.earliest = earliest
+        self.latest = latest
+        self.horizon = horizon
+        self.method = method
+        self._constraints = constraints
+        self._episode_map = episode_map
+
+    def earliest_start(self,ev):
+        return self.earliest[self.event_index[ev]]
+
+    def latest_start(self,ev):
+        return self.latest[self.event_index[ev]]
+
+    def slack(self,ev):
+        """Amount of time an event can be delayed without delaying the plan."""
+        i = self.event_index[ev]
+        return self.latest[i]-self.earliest[i]
+
+    @property
+    def slacks(self):
+        return array('d',[l-e for e,l in zip(self.earliest,self.latest)])
+
+    def critical_events(self,tol=_TOL):
+        """Events with no slack."""
+        return [ev for ev,e,l in zip(self.events,self.earliest,self.latest) if l-e<=tol]
+
+    def critical_path(self,tol=_TOL):
+        """
+        Primitive episodes, in execution order, along a chain of tight
+        precedence constraints between events with no slack that ends at the
+        latest such event.
+        """
+        earliest = self.earliest; latest = self.latest
+        critical = [i for i in range(len(self.events)) if latest[i]-earliest[i]<=tol]
+        if len(critical)==0:
+            return []
+        in_constraints=[[] for i in range(len(self.events))]
+        for tc in self._constraints:
+            if tc.lb>-_INF:
+                in_constraints[self.event_index[tc.end]].append(tc)
+
+        path=[]
+        v = max(critical,key=lambda i:earliest[i])
+        visited=set([v])
+        while True:
+            for tc in in_constraints[v]:
+                u = self.event_index[tc.start]
+                if (not u in visited) and latest[u]-earliest[u]<=tol and \
+                   abs(earliest[u]+tc.lb-earliest[v])<=tol:
+                    break
+            else:
+                break
+            if tc in self._episode_map:
+                path.append(self._episode_map[tc])
+            visited.add(u)
+            v = u
+        path.reverse()
+        return path
+
+
+def compute_schedule(prog_or_constraints,horizon=None,include_uncontrollable=False):
+    """
+    Computes the earliest and latest start times of all events of an RMPyL
+    program, of a projection of a program, or of an iterable of temporal
+    constraints. If no horizon is given, it is the earliest completion time of
+    the plan, so that critical events have zero slack.
+
+    Constraints with lb>=0 are precedence edges of an event DAG, processed in
+    topological order in O(V+E): earliest times are longest paths from the
+    origin, and latest times are computed backwards from the horizon. The
+    result is exact when the times from this relaxation satisfy all
+    constraints (e.g., deadlines and negative lower bounds). Otherwise, or if
+    the precedence edges have a cycle, times are computed by shortest paths on
+    the full STN. Inconsistent networks raise TemporalInconsistencyError.
+    """
+    if hasattr(prog_or_constraints,'temporal_constraints'):
+        events = list(prog_or_constraints.events)
+        constraints = prog_or_constraints.temporal_constraints
+        episode_map = {ep.duration:ep for ep in prog_or_constraints.primitive_episodes}
+    else:
+        events=[]; constraints = prog_or_constraints; episode_map={}
+    constraints = [tc for tc in constraints if include_uncontrollable or tc.type=='controllable']
+
+    event_index = {ev:i for i,ev in enumerate(events)}
+    for tc in constraints:
+        for ev in [tc.start,tc.end]:
+            if not ev in event_index:
+                event_index[ev]=len(events)
+                events.append(ev)
+
+    times = _dag_schedule(events,event_index,constraints,horizon)
+    if times!=None:
+        earliest,latest,horizon = times
+        method = 'dag'
+    else:
+        earliest,latest,horizon = _stn_schedule(events,constraints,horizon)
+        method = 'stn'
+    return Schedule(events,earliest,latest,horizon,method,constraints,episode_map)
+
+
+def _dag_schedule(events,event_index,constraints,horizon):
+    """
+    Critical path method over the precedence edges (lb>=0). Returns None if
+    they have a cycle, or if the resulting times are not a valid schedule.
+    """
+    n = len(events)
+    #Precedence edges in compressed sparse row format, bucketed by source
+    #with a counting pass (no sorting, so that the whole pass is O(V+E))
+    edge_list = [(event_index[tc.start],event_index[tc.end],tc.lb)
+                 for tc in constraints if 0.0<=tc.lb<_INF]
+    offsets = array('l',[0]*(n+1))
+    in_degree = array('l',[0]*n)
+    for u,v,w in edge_list:
+        offsets[u+1]+=1
+        in_degree[v]+=1
+    for i in range(n):
+        offsets[i+1]+=offsets[i]
+    targets = array('l',[0]*len(edge_list))
+    weights = array('d',[0.0]*len(edge_list))
+    fill = array('l',offsets[:n])
+    for u,v,w in edge_list:
+        k = fill[u]; fill[u]=k+1
+        targets[k]=v; weights[k]=w
+
+    order = array('l')
+    queue = deque([v for v in range(n) if in_degree[v]==0])
+    while len(queue)>0:
+        u = queue.popleft()
+        order.append(u)
+        for k in range(offsets[u],offsets[u+1]):
+            v = targets[k]
+            in_degree[v]-=1
+            if in_degree[v]==0:
+                queue.append(v)
+    if len(order)<n:
+        return None #The precedence graph is not a DAG
+
+    earliest = array('d',[0.0]*n)
+    for u in order:
+        eu = earliest[u]
+        for k in range(offsets[u],offsets[u+1]):
+            v = targets[k]
+            if eu+weights[k]>earliest[v]:
+                earliest[v] = eu+weights[k]
+
+    if horizon==None:
+        horizon = max(earliest) if n>0 else 0.0
+    latest = array('d',[horizon]*n)
+    for u in reversed(order):
+        lu = latest[u]
+        for k in range(offsets[u],offsets[u+1]):
+            if latest[targets[k]]-weights[k]<lu:
+                lu = latest[targets[k]]-weights[k]
+        latest[u] = lu
+
+    for i in range(n):
+        if earliest[i]>latest[i]+_TOL:
+            return None
+    for tc in constraints:
+        u = event_index[tc.start]; v = event_index[tc.end]
+        for times in [earliest,latest]:
+            elapsed = times[v]-times[u]
+            if elapsed<tc.lb-_TOL or elapsed>tc.ub+_TOL:
+                return None
+    return earliest,latest,horizon
+
+
+def _stn_schedule(events,constraints,horizon):
+    """
+    Earliest and latest times by shortest paths in the STN extended with a
+    virtual origin, which precedes all events by at most the horizon.
+    """
+    origin = Event(name='__schedule-origin__')
+    if horizon==None:
+        bounds = [TemporalConstraint(origin,ev,'controllable',lb=0.0,ub=_INF) for ev in events]
+        result = check_consistency(list(constraints)+bounds,method='spfa')
+        if not result.consistent:
+            raise TemporalInconsistencyError('Inconsistent temporal constraints.',result.conflict)
+        horizon = max(result.earliest_times(origin)) if len(events)>0 else 0.0
+
+    bounds = [TemporalConstraint(origin,ev,'controllable',lb=0.0,ub=horizon) for ev in events]
+    result = check_consistency(list(constraints)+bounds,method='spfa')
+    if not result.consistent:
+        raise TemporalInconsistencyError('Inconsistent temporal constraints within the horizon.',result.conflict)
+    index = result.graph.event_index
+    earliest_times = result.earliest_times(origin)
+    latest_times = result.latest_times(origin)
+    earliest = array('d',[earliest_times[index[ev]] for ev in events])
+    latest = array('d',[latest_times[index[ev]] for ev in events])
+    return earliest,latest,horizon
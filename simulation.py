@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Vectorized Monte Carlo simulation of the schedules of RMPyL programs with
+uncontrollable durations.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+import math
+import warnings
+from collections import deque
+from .execution import random_generator
+from .rmpylexceptions import InvalidTypeError,InvalidValueError
+
+try:
+    import numpy as np
+except ImportError: #NumPy is optional, and only used for numerical analyses
+    np = None
+
+try:
+    from scipy.stats import qmc
+except ImportError: #SciPy is optional, and only used for Sobol sequences
+    qmc = None
+
+_INF = float('inf')
+
+class ScheduleSimulator(object):
+    """
+    Simulates the execution of a program (or of one of its projections, for
+    programs with choices) under sampled uncontrollable durations. The event
+    graph is compiled once into a topological order of precedence edges:
+
+      * each controllable temporal constraint with lb>=0 delays its end event
+        by at least lb after its start;
+      * each uncontrollable temporal constraint sets its end event exactly at
+        its start plus a sampled duration.
+
+    Events are scheduled as early as possible, so the simulated schedules are
+    the earliest-start schedules (longest paths from the first event). Every
+    temporal constraint, including upper bounds (deadlines), is then checked
+    against the simulated schedules.
+    """
+    def __init__(self,prog_or_constraints):
+        if np==None:
+            raise ImportError('NumPy is required by the schedule simulator.')
+        if hasattr(prog_or_constraints,'temporal_constraints'):
+            constraints = prog_or_constraints.temporal_constraints
+            events = prog_or_constraints.events
+            first,last = prog_or_constraints.first_event,prog_or_constraints.last_event
+        else:
+            constraints = prog_or_constraints; events=[]; first=last=None
+
+        self.events=[]; self.event_index={}
+        for ev in events:
+            self._add_event(ev)
+        self.constraints = list(constraints)
+
+        #Uncontrollable durations, indexed by their position in the duration
+        #samples.
+        self.uncontrollable=[]
+        contingent_end={}
+        for tc in self.constraints:
+            self._add_event(tc.start); self._add_event(tc.end)
+            if tc.type!='controllable':
+                if tc.end in contingent_end:
+                    raise InvalidTypeError('Event is the end of more than one uncontrollable duration: '+str(tc.end))
+                contingent_end[tc.end]=len(self.uncontrollable)
+                self.uncontrollable.append(tc)
+
+        n = len(self.events)
+        self.first = self.event_index[first] if first in self.event_index else None
+        self.last = self.event_index[last] if last in self.event_index else None
+
+        #Precedence edges into each event. The end of an uncontrollable duration
+        #is determined by its start and the sampled duration alone.
+        preds=[[] for i in range(n)]
+        self.contingent=[None]*n
+        for tc in self.constraints:
+            u = self.event_index[tc.start]; v = self.event_index[tc.end]
+            if tc.type!='controllable':
+                self.contingent[v]=(u,contingent_end[tc.end])
+            elif tc.lb>=0.0 and not tc.end in contingent_end:
+                preds[v].append((u,tc.lb))
+
+        self.order = self._topological_order(preds)
+        self.preds=[(np.array([u for u,w in p],dtype=np.intp),np.array([w for u,w in p],dtype=float))
+                    for p in preds]
+
+        #Constraint endpoints and bounds, for vectorized violation checks
+        self._tc_start = np.array([self.event_index[tc.start] for tc in self.constraints],dtype=np.intp)
+        self._tc_end = np.array([self.event_index[tc.end] for tc in self.constraints],dtype=np.intp)
+        self._tc_lb = np.array([tc.lb if tc.type=='controllable' else -_INF for tc in self.constraints],dtype=float)
+        self._tc_ub = np.array([tc.ub if tc.type=='controllable' else _INF for tc in self.constraints],dtype=float)
+        self._compile_distributions()
+
+    @property
+    def num_events(self):
+        return len(self.events)
+
+    @property
+    def num_uncontrollable(self):
+        return len(self.uncontrollable)
+
+    def _add_event(self,ev):
+        if not ev in self.event_index:
+            self.event_index[ev]=len(self.events)
+            self.events.append(ev)
+        return self.event_index[ev]
+
+    def _topological_order(self,preds):
+        """Kahn's algorithm over the precedence edges."""
+        n = len(self.events)
+        succs=[[] for i in range(n)]
+        in_degree=[0]*n
+        for v in range(n):
+            sources = [u for u,w in preds[v]]
+            if self.contingent[v]!=None:
+                sources.append(self.contingent[v][0])
+            for u in sources:
+                succs[u].append(v)
+            in_degree[v]=len(sources)
+
+        order=[]
+        queue = deque([v for v in range(n) if in_degree[v]==0])
+        while len(queue)>0:
+            u = queue.popleft()
+            order.append(u)
+            for v in succs[u]:
+                in_degree[v]-=1
+                if in_degree[v]==0:
+                    queue.append(v)
+        if len(order)<n:
+            raise InvalidValueError('Precedence constraints (lb>=0) form a cycle, so schedules cannot be simulated.')
+        return order
+
+    def _compile_distributions(self):
+        """Groups uncontrollable durations by distribution type."""
+        uniform_idx=[]; uniform_lb=[]; uniform_ub=[]
+        gaussian_idx=[]; gaussian_mean=[]; gaussian_std=[]; gaussian_p0=[]
+        for k,tc in enumerate(self.uncontrollable):
+            dist = tc.distribution
+            if dist['type'] in ['uniform','unknown_bounded']:
+                #Set-bounded durations are sampled uniformly within their bounds
+                uniform_idx.append(k); uniform_lb.append(dist['lb']); uniform_ub.append(dist['ub'])
+            elif dist['type']=='gaussian':
+                std = dist['variance']**0.5
+                gaussian_idx.append(k); gaussian_mean.append(dist['mean']); gaussian_std.append(std)
+                #Probability of a negative duration, below which uniforms aren't mapped
+                gaussian_p0.append(norm_cdf(-dist['mean']/std) if std>0.0 else 0.0)
+            else:
+                raise InvalidTypeError('Unsupported duration distribution: '+str(dist['type']))
+        self._uniform = (np.array(uniform_idx,dtype=np.intp),
+                         np.array(uniform_lb,dtype=float)[:,None],
+                         np.array(uniform_ub,dtype=float)[:,None])
+        self._gaussian = (np.array(gaussian_idx,dtype=np.intp),
+                          np.array(gaussian_mean,dtype=float)[:,None],
+                          np.array(gaussian_std,dtype=float)[:,None],
+                          np.array(gaussian_p0,dtype=float)[:,None])
+
+    def durations(self,uniforms):
+        """
+        Maps uniform variates on [0,1), one row per uncontrollable duration
+        and one column per sample, to sampled durations by inverse transform.
+        Gaussian durations are truncated at zero: uniforms are mapped into
+        [F(0),1), where F is the duration's CDF, before the inverse transform,
+        so negative durations are never drawn (rather than clamped to zero).
+        """
+        durations = np.empty_like(uniforms,dtype=float)
+        idx,lb,ub = self._uniform
+        if len(idx)>0:
+            durations[idx] = lb+(ub-lb)*uniforms[idx]
+        idx,mean,std,p0 = self._gaussian
+        if len(idx)>0:
+            u = p0+(1.0-p0)*uniforms[idx]
+            #The maximum only guards against rounding errors
+            durations[idx] = np.maximum(mean+std*norm_ppf(u),0.0)
+        return durations
+
+    def schedule(self,durations):
+        """
+        Earliest-start event times (one row per event, one column per sample)
+        for a matrix of sampled durations.
+        """
+        times = np.zeros((len(self.events),durations.shape[1]))
+        for v in self.order:
+            contingent = self.contingent[v]
+            if contingent!=None:
+                u,k = contingent
+                times[v] = times[u]+durations[k]
+            else:
+                src,w = self.preds[v]
+                if len(src)==1:
+                    np.add(times[src[0]],w[0],out=times[v])
+                elif len(src)>1:
+                    np.max(times[src]+w[:,None],axis=0,out=times[v])
+        return times
+
+    def makespans(self,times):
+        """Time between the first and last events of each simulated schedule."""
+        if self.first!=None and self.last!=None:
+            return times[self.last]-times[self.first]
+        return times.max(axis=0)-times.min(axis=0)
+
+    def violations(self,times,tol=1e-9):
+        """
+        Boolean matrix (one row per temporal constraint, one column per sample)
+        of the constraints violated by each simulated schedule.
+        """
+        elapsed = times[self._tc_end]-times[self._tc_start]
+        return (elapsed<self._tc_lb[:,None]-tol)|(elapsed>self._tc_ub[:,None]+tol)
+
+    def run(self,num_samples,batch_size=10000,seed=None,sequence='random'):
+        """
+        Simulates num_samples schedules, in batches of at most batch_size
+        samples, and returns a SimulationResult. The seed can be an integer or
+        a NumPy random Generator. The uniform variates of the durations come
+        from a sequence of the given kind (see uniform_sequence()), so
+        'halton' or 'sobol' give quasi-Monte Carlo estimates.
+        """
+        rng = random_generator(seed)
+        uniform_seq = uniform_sequence(sequence,self.num_uncontrollable,rng)
+        result = SimulationResult(self)
+        remaining = num_samples
+        while remaining>0:
+            batch = min(batch_size,remaining)
+            uniforms = uniform_seq.random(batch)
+            times = self.schedule(self.durations(uniforms))
+            result.add_batch(self.makespans(times),self.violations(times))
+            remaining-=batch
+        return result
+
+
+class SimulationResult(object):
+    """
+    Makespan and constraint violation statistics of simulated schedules.
+    """
+    def __init__(self,simulator):
+        self.simulator = simulator
+        self.num_samples = 0
+        self._makespans=[]
+        self.violation_counts = np.zeros(len(simulator.constraints),dtype=np.int64)
+        self.any_violation_count = 0
+
+    def add_batch(self,makespans,violations):
+        self.num_samples+=len(makespans)
+        self._makespans.append(makespans)
+        self.violation_counts+=violations.sum(axis=1)
+        self.any_violation_count+=int(violations.any(axis=0).sum())
+
+    @property
+    def makespans(self):
+        """Makespans of all simulated schedules."""
+        if len(self._makespans)!=1:
+            self._makespans=[np.concatenate(self._makespans)]
+        return self._makespans[0]
+
+    @property
+    def mean_makespan(self):
+        return float(self.makespans.mean())
+
+    @property
+    def makespan_std(self):
+        return float(self.makespans.std())
+
+    def makespan_percentile(self,q):
+        """q-th percentile (0<=q<=100) of the makespan."""
+        return float(np.percentile(self.makespans,q))
+
+    def deadline_violation_probability(self,deadline):
+        """Fraction of the simulated schedules with makespan above a deadline."""
+        return float((self.makespans>deadline).mean())
+
+    @property
+    def violation_probability(self):
+        """Fraction of the simulated schedules violating any temporal constraint."""
+        return self.any_violation_count/float(self.num_samples)
+
+    def constraint_violation_probabilities(self):
+        """Dictionary from temporal constraints to their violation frequencies."""
+        return {tc:self.violation_counts[i]/float(self.num_samples)
+                for i,tc in enumerate(self.simulator.constraints)}
+
+
+class RandomSequence(object):
+    """Independent uniform variates, one row per dimension."""
+    def __init__(self,dim,seed=None):
+        self.dim = dim
+        self.rng = random_generator(seed)
+
+    def random(self,n):
+        return self.rng.random((self.dim,n))
+
+
+class HaltonSequence(object):
+    """
+    Halton low-discrepancy sequence (radical inverses in the first dim prime
+    bases), randomized by a Cranley-Patterson rotation: a uniform random shift
+    modulo one, which makes every point uniformly distributed (so estimates
+    remain unbiased) while preserving the sequence's even coverage. Successive
+    calls to random() continue the same sequence.
+    """
+    def __init__(self,dim,seed=None):
+        self.dim = dim
+        self.bases = first_primes(dim)
+        self.shift = random_generator(seed).random((dim,1))
+        self.index = 1 #Skips the origin
+
+    def random(self,n):
+        indices = np.arange(self.index,self.index+n,dtype=np.int64)
+        self.index+=n
+        points = np.empty((self.dim,n))
+        for j,base in enumerate(self.bases):
+            points[j] = radical_inverse(indices,base)
+        points+=self.shift
+        return points-np.floor(points)
+
+
+class SobolSequence(object):
+    """
+    Scrambled Sobol sequence from SciPy, which spreads points more evenly than
+    Halton's in high dimensions.
+    """
+    def __init__(self,dim,seed=None):
+        if qmc==None:
+            raise ImportError('SciPy is required for Sobol sequences.')
+        self.dim = dim
+        self.engine = qmc.Sobol(d=max(dim,1),scramble=True,seed=random_generator(seed))
+
+    def random(self,n):
+        with warnings.catch_warnings():
+            #Balance properties only hold for powers of two, which batches of
+            #arbitrary size don't need.
+            warnings.simplefilter('ignore',UserWarning)
+            return self.engine.random(n).T[:self.dim]
+
+
+def uniform_sequence(kind,dim,seed=None):
+    """
+    Sequence of dim-dimensional uniform variates on [0,1) of one of the kinds
+    'random' (independent), 'halton' or 'sobol' (randomized quasi-Monte Carlo).
+    """
+    if kind=='random':
+        return RandomSequence(dim,seed)
+    elif kind=='halton':
+        return HaltonSequence(dim,seed)
+    elif kind=='sobol':
+        return SobolSequence(dim,seed)
+    raise InvalidValueError('Unknown uniform sequence: '+str(kind))
+
+
+def radical_inverse(indices,base):
+    """Van der Corput radical inverses of an array of integers in a base."""
+    indices = np.array(indices,dtype=np.int64)
+    result = np.zeros(indices.shape)
+    factor = 1.0/base
+    while indices.any():
+        result+=factor*(indices%base)
+        indices//=base
+        factor/=base
+    return result
+
+
+def first_primes(n):
+    """The first n prime numbers."""
+    primes=[]; candidate=2
+    while len(primes)<n:
+        if all(candidate%p!=0 for p in primes if p*p<=candidate):
+            primes.append(candidate)
+        candidate+=1
+    return primes
+
+
+def norm_cdf(x):
+    """Standard normal CDF of a scalar."""
+    return 0.5*math.erfc(-x/math.sqrt(2.0))
+
+
+def norm_ppf(u):
+    """
+    Inverse of the standard normal CDF (Acklam's rational approximation,
+    relative error below 1.2e-9), applied element-wise to a NumPy array.
+    """
+    a = [-3.969683028665376e+01,2.209460984245205e+02,-2.759285104469687e+02,
+         1.383577518672690e+02,-3.066479806614716e+01,2.506628277459239e+00]
+    b = [-5.447609879822406e+01,1.615858368580409e+02,-1.556989798598866e+02,
+         6.680131188771972e+01,-1.328068155288572e+01]
+    c = [-7.784894002430293e-03,-3.223964580411365e-01,-2.400758277161838e+00,
+         -2.549732539343734e+00,4.374664141464968e+00,2.938163982698783e+00]
+    d = [7.784695709041462e-03,3.224671290700398e-01,2.445134137142996e+00,
+         3.754408661907416e+00]
+    u = np.clip(np.asarray(u,dtype=float),1e-300,1.0-1e-16)
+    x = np.empty_like(u)
+
+    low = u<0.02425; high = u>1.0-0.02425; mid = ~(low|high)
+
+    q = u[mid]-0.5; r = q*q
+    x[mid] = (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q / \
+             (((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1.0)
+
+    for mask,sign,p in [(low,1.0,u[low]),(high,-1.0,1.0-u[high])]:
+        q = np.sqrt(-2.0*np.log(p))
+        x[mask] = sign*(((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / \
+                  ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1.0)
+    return x
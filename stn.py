@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Consistency checking of Simple Temporal Networks (STN's) compiled from the
+temporal constraints of RMPyL programs.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+from collections import deque
+import heapq
+from .rmpylexceptions import TemporalInconsistencyError
+
+try:
+    import numpy as np
+except ImportError: #NumPy is optional, and only used for dense networks
+    np = None
+
+_INF = float('inf')
+
+class DistanceGraph(object):
+    """
+    Distance graph of an STN, with events mapped to consecutive integers. A
+    temporal constraint lb <= end-start <= ub becomes an edge start->end with
+    weight ub and an edge end->start with weight -lb (infinite bounds do not
+    generate edges).
+    """
+    def __init__(self,constraints,events=None,include_uncontrollable=False):
+        self.events=[]; self.event_index={}
+        if events!=None:
+            for ev in events:
+                self._add_event(ev)
+
+        #Edges are stored in parallel lists, indexed by edge number
+        self.src=[]; self.dst=[]; self.weight=[]
+        self.edge_constraint=[]; self.edge_bound=[]
+        for tc in constraints:
+            if tc.type!='controllable' and not include_uncontrollable:
+                continue
+            start = self._add_event(tc.start)
+            end = self._add_event(tc.end)
+            if tc.ub<_INF:
+                self._add_edge(start,end,tc.ub,tc,'ub')
+            if tc.lb>-_INF:
+                self._add_edge(end,start,-tc.lb,tc,'lb')
+
+        #Compressed adjacency lists (edge numbers sorted by source and target)
+        n = len(self.events)
+        self.out_edges=[[] for i in range(n)]
+        self.in_edges=[[] for i in range(n)]
+        for e,(u,v) in enumerate(zip(self.src,self.dst)):
+            self.out_edges[u].append(e)
+            self.in_edges[v].append(e)
+
+    @classmethod
+    def from_program(cls,prog,include_uncontrollable=False):
+        """
+        Compiles the temporal constraints of an RMPyL program (or of one of its
+        projections) into a distance graph.
+        """
+        return cls(prog.temporal_constraints,events=prog.events,
+                   include_uncontrollable=include_uncontrollable)
+
+    @property
+    def num_events(self):
+        return len(self.events)
+
+    @property
+    def num_edges(self):
+        return len(self.src)
+
+    def _add_event(self,ev):
+        """Returns the integer index of an event, adding it if necessary."""
+        if not ev in self.event_index:
+            self.event_index[ev]=len(self.events)
+            self.events.append(ev)
+        return self.event_index[ev]
+
+    def _add_edge(self,u,v,w,tc,bound):
+        self.src.append(u); self.dst.append(v); self.weight.append(w)
+        self.edge_constraint.append(tc); self.edge_bound.append(bound)
+
+    def edge_bounds(self,edges):
+        """Constraint bounds (tc,'lb' or 'ub') corresponding to a list of edges."""
+        return [(self.edge_constraint[e],self.edge_bound[e]) for e in edges]
+
+
+class STNResult(object):
+    """
+    Outcome of an STN consistency check. Consistent networks carry a feasible
+    potential function, which makes single-source queries run Dijkstra on
+    non-negative reduced costs. Inconsistent networks carry the conflicting
+    negative cycle as a list of (temporal constraint,'lb' or 'ub') pairs.
+    """
+    def __init__(self,graph,consistent,potentials=None,conflict=None,distance_matrix=None):
+        self.graph = graph
+        self.consistent = consistent
+        self.potentials = potentials
+        self.conflict = conflict if conflict!=None else []
+        self._matrix = distance_matrix
+        self._forward={}; self._backward={}
+
+    def __bool__(self):
+        return self.consistent
+    __nonzero__=__bool__
+
+    def distances_from(self,ev):
+        """Shortest-path distances from an event to all events."""
+        i = self.graph.event_index[ev]
+        if self._matrix is not None:
+            return [float(d) for d in self._matrix[i]]
+        if not i in self._forward:
+            self._forward[i] = self._dijkstra(i,reverse=False)
+        return self._forward[i]
+
+    def distances_to(self,ev):
+        """Shortest-path distances from all events to an event."""
+        i = self.graph.event_index[ev]
+        if self._matrix is not None:
+            return [float(d) for d in self._matrix[:,i]]
+        if not i in self._backward:
+            self._backward[i] = self._dijkstra(i,reverse=True)
+        return self._backward[i]
+
+    def earliest_times(self,origin):
+        """Earliest time of every event relative to an origin event."""
+        return [-d for d in self.distances_to(origin)]
+
+    def latest_times(self,origin):
+        """Latest time of every event relative to an origin event."""
+        return self.distances_from(origin)
+
+    def minimal_bounds(self,tc=None):
+        """
+        Tightest bounds implied by the network on a temporal constraint, or a
+        dictionary with the minimal bounds of every compiled constraint.
+        """
+        self._check_consistent()
+        if tc==None:
+            return {c:self.minimal_bounds(c) for c in set(self.graph.edge_constraint)}
+        start = self.graph.event_index[tc.start]
+        end = self.graph.event_index[tc.end]
+        from_start = self.distances_from(tc.start)
+        return (-self.distances_from(tc.end)[start],from_start[end])
+
+    def _check_consistent(self):
+        if not self.consistent:
+            raise ValueError('Inconsistent STN\'s do not have minimal bounds.')
+
+    def _dijkstra(self,source,reverse):
+        """
+        Dijkstra's algorithm over reduced costs w(u,v)+p(u)-p(v)>=0.
+        """
+        self._check_consistent()
+        g = self.graph; p = self.potentials
+        n = g.num_events
+        dist=[_INF]*n; dist[source]=0.0
+        done=[False]*n
+        queue=[(0.0,source)]
+        adjacency = g.in_edges if reverse else g.out_edges
+        neighbor = g.src if reverse else g.dst
+        sign = -1.0 if reverse else 1.0
+        while len(queue)>0:
+            d,u = heapq.heappop(queue)
+            if done[u]:
+                continue
+            done[u]=True
+            for e in adjacency[u]:
+                v = neighbor[e]
+                nd = d+g.weight[e]+sign*(p[u]-p[v])
+                if nd<dist[v]:
+                    dist[v]=nd
+                    heapq.heappush(queue,(nd,v))
+        #Converts reduced distances back to true distances
+        return [dist[v]-sign*(p[source]-p[v]) if dist[v]<_INF else _INF for v in range(n)]
+
+
+class IncrementalConsistencyChecker(object):
+    """
+    Incremental temporal consistency checker for an RMPyL program. It keeps a
+    feasible potential function for the program's distance graph, so adding or
+    tightening a constraint only updates the potentials of the events whose
+    shortest paths go through the new edges (incremental Bellman-Ford with
+    potentials, using Dijkstra on reduced costs). Every change is recorded in
+    a trail, so backtracking to a checkpoint only undoes what was changed.
+
+    Checkers are usually attached to a program with
+    RMPyL.attach_consistency_checker(), in which case every call to
+    add_temporal_constraint is checked before it modifies the program.
+    """
+    def __init__(self,prog,include_uncontrollable=False):
+        self.prog = prog
+        self.include_uncontrollable = include_uncontrollable
+        self._stale=True
+        self._trail=[]
+        self._rebuild()
+
+    @property
+    def graph(self):
+        """Distance graph of the program (including all checked additions)."""
+        self._rebuild()
+        return self._graph
+
+    @property
+    def potentials(self):
+        """Current feasible potential function, aligned with graph.events."""
+        self._rebuild()
+        return self._potentials
+
+    def mark_stale(self):
+        """
+        Signals that the program changed in a way that can't be tracked
+        incrementally, so the distance graph must be recompiled.
+        """
+        self._stale=True
+
+    def checkpoint(self):
+        """Returns a marker that can be passed to rollback()."""
+        self._rebuild()
+        return len(self._trail)
+
+    def check_addition(self,tc):
+        """
+        Compiles a temporal constraint into the distance graph if it is
+        consistent with the current network, or raises a
+        TemporalInconsistencyError with the conflicting cycle otherwise. The
+        program itself is not modified.
+        """
+        self._rebuild()
+        if tc.type!='controllable' and not self.include_uncontrollable:
+            return
+        mark = len(self._trail)
+        start = self._add_event(tc.start)
+        end = self._add_event(tc.end)
+        self._trail.append(('constraint',tc))
+        try:
+            if tc.ub<_INF:
+                self._add_edge(start,end,tc.ub,tc,'ub')
+            if tc.lb>-_INF:
+                self._add_edge(end,start,-tc.lb,tc,'lb')
+        except TemporalInconsistencyError:
+            self._undo(mark)
+            raise
+
+    def add_temporal_constraint(self,tc):
+        """
+        Adds a temporal constraint to the program, provided that it is
+        consistent with the constraints already in it.
+        """
+        if self.prog.consistency_checker is self:
+            self.prog.add_temporal_constraint(tc) #Calls check_addition
+        else:
+            self.check_addition(tc)
+            self.prog.add_temporal_constraint(tc)
+
+    def tighten(self,tc,lb=None,ub=None):
+        """
+        Tightens the bounds of a temporal constraint in the program, provided
+        that the new bounds are consistent with the rest of the network.
+        """
+        self._rebuild()
+        old_lb,old_ub = tc.bounds
+        lb = old_lb if lb==None else lb
+        ub = old_ub if ub==None else ub
+        if lb<old_lb or ub>old_ub:
+            raise ValueError('Bounds can only be tightened. Use rollback() to relax them.')
+        mark = len(self._trail)
+        start = self._add_event(tc.start)
+        end = self._add_event(tc.end)
+        try:
+            if ub<old_ub:
+                self._add_edge(start,end,ub,tc,'ub')
+            if lb>old_lb:
+                self._add_edge(end,start,-lb,tc,'lb')
+        except TemporalInconsistencyError:
+            self._undo(mark)
+            raise
+        self._trail.append(('bounds',tc,tc.bounds))
+        tc.bounds = (lb,ub)
+
+    def rollback(self,checkpoint):
+        """
+        Retracts every change made since a checkpoint, including the constraints
+        that were added to the program and the bounds that were tightened.
+        """
+        if self._stale:
+            raise ValueError('The program changed since the checkpoint, so it can\'t be rolled back.')
+        self._undo(checkpoint,update_program=True)
+
+    def retract(self,tc):
+        """
+        Removes a temporal constraint from the distance graph. Retracting the
+        most recent change, if it was the addition of that constraint, is
+        immediate; other retractions require the graph to be recompiled.
+        """
+        if not self._stale:
+            g = self._graph
+            for i in range(len(self._trail)-1,-1,-1):
+                record = self._trail[i]
+                if record[0]=='constraint' and record[1] is tc:
+                    self._undo(i)
+                    return
+                #Only the edges of the constraint and the potentials they
+                #changed may follow it, or undoing would revert other changes.
+                if not (record[0]=='potential' or
+                        (record[0]=='edge' and g.edge_constraint[record[1]] is tc)):
+                    break
+        self.mark_stale()
+
+    def _rebuild(self):
+        """Recompiles the distance graph from scratch, if necessary."""
+        if self._stale:
+            self._graph = DistanceGraph.from_program(self.prog,self.include_uncontrollable)
+            potentials,cycle = spfa_potentials(self._graph)
+            if cycle!=None:
+                raise TemporalInconsistencyError('The program is temporally inconsistent.',
+                                                 self._graph.edge_bounds(cycle))
+            self._potentials = potentials
+            self._trail=[]
+            self._stale=False
+
+    def _add_event(self,ev):
+        """Index of an event in the graph, adding it if necessary."""
+        g = self._graph
+        if not ev in g.event_index:
+            g._add_event(ev)
+            g.out_edges.append([]); g.in_edges.append([])
+            self._potentials.append(0.0)
+            self._trail.append(('event',ev))
+        return g.event_index[ev]
+
+    def _add_edge(self,u,v,w,tc,bound):
+        """
+        Adds an edge u->v to the graph and restores the feasibility of the
+        potentials. Only events whose potential decreases are visited, in order
+        of decreasing change, so each one is settled once.
+        """
+        g = self._graph; p = self._potentials
+        e = g.num_edges
+        g._add_edge(u,v,w,tc,bound)
+        g.out_edges[u].append(e); g.in_edges[v].append(e)
+        self._trail.append(('edge',e))
+
+        if p[u]+w>=p[v]:
+            return #Potentials are still feasible
+
+        new_p={v:p[u]+w}; pred={v:e}
+        queue=[(new_p[v]-p[v],v)]
+        while len(queue)>0:
+            delta,x = heapq.heappop(queue)
+            px = new_p[x]
+            if px-p[x]<delta:
+                continue #Outdated queue entry
+            for f in g.out_edges[x]:
+                y = g.dst[f]
+                cand = px+g.weight[f]
+                if cand<new_p.get(y,p[y]):
+                    pred[y]=f
+                    if y==u: #The new edge closes a negative cycle
+                        cycle=[f]; z=x
+                        while z!=v:
+                            cycle.append(pred[z]); z=g.src[pred[z]]
+                        cycle.append(e)
+                        cycle.reverse()
+                        raise TemporalInconsistencyError('Temporal constraint is inconsistent with the program.',
+                                                         g.edge_bounds(cycle))
+                    new_p[y]=cand
+                    heapq.heappush(queue,(cand-p[y],y))
+
+        for x,px in new_p.items():
+            self._trail.append(('potential',x,p[x]))
+            p[x]=px
+
+    def _undo(self,mark,update_program=False):
+        """Undoes the trail down to a marker."""
+        g = self._graph
+        while len(self._trail)>mark:
+            record = self._trail.pop()
+            if record[0]=='potential':
+                self._potentials[record[1]]=record[2]
+            elif record[0]=='edge':
+                e = record[1]
+                g.out_edges[g.src[e]].pop(); g.in_edges[g.dst[e]].pop()
+                for edge_list in [g.src,g.dst,g.weight,g.edge_constraint,g.edge_bound]:
+                    edge_list.pop()
+            elif record[0]=='event':
+                del g.event_index[g.events.pop()]
+                g.out_edges.pop(); g.in_edges.pop()
+                self._potentials.pop()
+            elif record[0]=='bounds':
+                record[1].bounds = record[2]
+            elif record[0]=='constraint':
+                if update_program:
+                    self.prog._discard_temporal_constraint(record[1])
+
+
+def check_consistency(prog_or_constraints,method='auto',include_uncontrollable=False):
+    """
+    Checks the temporal consistency of an RMPyL program, a projection of a
+    program, or an iterable of temporal constraints. Only controllable
+    constraints are considered, unless include_uncontrollable is True, in which
+    case the bounds of uncontrollable durations are enforced as requirements.
+
+    The method can be 'spfa' (sparse Bellman-Ford), 'floyd-warshall' (dense,
+    requires NumPy) or 'auto'.
+    """
+    if hasattr(prog_or_constraints,'temporal_constraints'):
+        graph = DistanceGraph.from_program(prog_or_constraints,include_uncontrollable)
+    else:
+        graph = DistanceGraph(prog_or_constraints,include_uncontrollable=include_uncontrollable)
+    return check_graph_consistency(graph,method=method)
+
+
+def check_graph_consistency(graph,method='auto'):
+    """
+    Checks the consistency of a compiled distance graph.
+    """
+    if method=='auto':
+        n = graph.num_events
+        dense = graph.num_edges>=0.1*n*n
+        method = 'floyd-warshall' if (np!=None and (n<=64 or (dense and n<=2000))) else 'spfa'
+
+    if method=='spfa':
+        potentials,cycle = spfa_potentials(graph)
+        if cycle==None:
+            return STNResult(graph,True,potentials=potentials)
+        return STNResult(graph,False,conflict=graph.edge_bounds(cycle))
+    elif method=='floyd-warshall':
+        matrix = floyd_warshall(graph)
+        if (matrix.diagonal()<0.0).any():
+            #Extracts the conflict from the sparse algorithm
+            potentials,cycle = spfa_potentials(graph)
+            return STNResult(graph,False,conflict=graph.edge_bounds(cycle))
+        #Distances to a virtual source connected to all events are a feasible
+        #potential function.
+        potentials = [float(p) for p in np.minimum(matrix.min(axis=0),0.0)]
+        return STNResult(graph,True,potentials=potentials,distance_matrix=matrix)
+    else:
+        raise ValueError('Invalid STN consistency method: '+str(method))
+
+
+def spfa_potentials(graph):
+    """
+    Queue-based Bellman-Ford (SPFA) from a virtual source connected to every
+    event with a zero-weight edge. Returns the shortest-path distances (a
+    feasible potential function) and None, or None and the list of edges
+    forming a negative cycle.
+
+    Negative cycles are detected by searching the predecessor graph for a
+    cycle after every n relaxations, which costs O(n) amortized over the
+    relaxations and finds cycles long before path lengths reach n.
+    """
+    n = graph.num_events
+    src = graph.src; dst = graph.dst; weight = graph.weight
+    out_edges = graph.out_edges
+    dist=[0.0]*n; pred=[-1]*n
+    queue = deque(range(n)); in_queue=[True]*n
+    relaxations=0
+    while len(queue)>0:
+        u = queue.popleft()
+        in_queue[u]=False
+        du = dist[u]
+        for e in out_edges[u]:
+            v = dst[e]
+            nd = du+weight[e]
+            if nd<dist[v]:
+                dist[v]=nd; pred[v]=e
+                if not in_queue[v]:
+                    in_queue[v]=True
+                    queue.append(v)
+                relaxations+=1
+                if relaxations>=n:
+                    relaxations=0
+                    cycle = _predecessor_cycle(pred,src)
+                    if cycle!=None:
+                        return None,cycle
+    return dist,None
+
+
+def _predecessor_cycle(pred,src):
+    """
+    Returns the edges of a cycle in the predecessor graph, or None if the
+    predecessor graph is a forest. Cycles in the predecessor graph of
+    Bellman-Ford are always negative.
+    """
+    n = len(pred)
+    mark=[-1]*n
+    for root in range(n):
+        v = root
+        while mark[v]<0:
+            mark[v]=root
+            if pred[v]<0:
+                break
+            v = src[pred[v]]
+        else:
+            if mark[v]==root: #Closed a cycle in the current walk
+                cycle=[]; u=v
+                while True:
+                    e = pred[u]
+                    cycle.append(e)
+                    u = src[e]
+                    if u==v:
+                        break
+                cycle.reverse()
+                return cycle
+    return None
+
+
+def floyd_warshall(graph):
+    """
+    All-pairs shortest paths of a distance graph as a dense NumPy matrix.
+    """
+    if np==None:
+        raise ImportError('NumPy is required by the Floyd-Warshall algorithm.')
+    n = graph.num_events
+    matrix = np.full((n,n),_INF)
+    if graph.num_edges>0:
+        np.minimum.at(matrix,(np.asarray(graph.src),np.asarray(graph.dst)),np.asarray(graph.weight,dtype=float))
+    np.fill_diagonal(matrix,np.minimum(matrix.diagonal(),0.0))
+    for k in range(n):
+        np.minimum(matrix,matrix[:,k,None]+matrix[None,k,:],out=matrix)
+    return matrix
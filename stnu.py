@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+#
+#  A Python package for writing RMPL programs.
+#
+#  Copyright (c) 2015 MIT. All rights reserved.
+#
+#   author: Pedro Santana
+#   e-mail: psantana@mit.edu
+#   website: people.csail.mit.edu/psantana
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#  3. Neither the name(s) of the copyright holders nor the names of its
+#     contributors or of the Massachusetts Institute of Technology may be
+#     used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+#  FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+#  COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+#  BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+#  OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+#  AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+#  LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+#  ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+"""
+RMPyL: a Python package for writing RMPL programs.
+
+Dynamic controllability checking of Simple Temporal Networks with Uncertainty
+(STNU's) compiled from RMPyL programs, using the O(N^3) algorithm in
+
+  P. Morris. Dynamic controllability and dispatchability relationships.
+  CPAIOR 2014.
+
+@author: Pedro Santana (psantana@mit.edu).
+"""
+import heapq
+from .rmpylexceptions import InvalidTypeError
+
+_INF = float('inf')
+
+class STNUGraph(object):
+    """
+    Labeled distance graph of an STNU. Requirement constraints become ordinary
+    edges, as in an STN. A contingent link A->C with duration in [x,y] adds
+    ordinary edges A->C (y) and C->A (-x), plus a lower-case edge A->C (x) and
+    an upper-case edge C->A (-y) labeled by the link.
+    """
+    def __init__(self,constraints,events=None):
+        self.events=[]; self.event_index={}
+        if events!=None:
+            for ev in events:
+                self._add_event(ev)
+
+        self.src=[]; self.dst=[]; self.weight=[]
+        self.kind=[]; self.label=[]
+        #Provenance of each edge: (constraint,bound) for original edges, or the
+        #list of edges from which a derived edge was obtained.
+        self.origin=[]
+        self.contingent_links=[]
+
+        contingent_ends={}
+        for tc in constraints:
+            start = self._add_event(tc.start)
+            end = self._add_event(tc.end)
+            if tc.type=='controllable':
+                if tc.ub<_INF:
+                    self.add_edge(start,end,tc.ub,'ordinary',None,(tc,'ub'))
+                if tc.lb>-_INF:
+                    self.add_edge(end,start,-tc.lb,'ordinary',None,(tc,'lb'))
+            else:
+                lb,ub = tc.lb,tc.ub
+                if not (0.0<=lb<=ub<_INF):
+                    raise InvalidTypeError('Contingent durations must have bounds 0<=lb<=ub<inf: '+str(tc))
+                if tc.end in contingent_ends:
+                    raise InvalidTypeError('Event is the end of more than one contingent duration: '+str(tc.end))
+                contingent_ends[tc.end]=tc
+                link = len(self.contingent_links)
+                self.contingent_links.append(tc)
+                self.add_edge(start,end,ub,'ordinary',None,(tc,'ub'))
+                self.add_edge(end,start,-lb,'ordinary',None,(tc,'lb'))
+                self.add_edge(start,end,lb,'lower',link,(tc,'lower-case'))
+                self.add_edge(end,start,-ub,'upper',link,(tc,'upper-case'))
+
+    @classmethod
+    def from_program(cls,prog):
+        """
+        Compiles the temporal constraints of an RMPyL program (or of one of its
+        projections) into a labeled distance graph.
+        """
+        return cls(prog.temporal_constraints,events=prog.events)
+
+    @property
+    def num_events(self):
+        return len(self.events)
+
+    def _add_event(self,ev):
+        """Returns the integer index of an event, adding it if necessary."""
+        if not ev in self.event_index:
+            self.event_index[ev]=len(self.events)
+            self.events.append(ev)
+        return self.event_index[ev]
+
+    def add_edge(self,u,v,w,kind,label,origin):
+        """Adds an edge u->v and returns its index."""
+        self.src.append(u); self.dst.append(v); self.weight.append(w)
+        self.kind.append(kind); self.label.append(label); self.origin.append(origin)
+        return len(self.src)-1
+
+    def expand(self,edges):
+        """
+        Expands a list of (possibly derived) edges into the constraint bounds
+        they were obtained from.
+        """
+        expanded=[]
+        stack = list(reversed(edges))
+        while len(stack)>0:
+            e = stack.pop()
+            if isinstance(self.origin[e],list):
+                stack.extend(reversed(self.origin[e]))
+            else:
+                expanded.append(self.origin[e])
+        return expanded
+
+
+class DCResult(object):
+    """
+    Outcome of a dynamic controllability check. When the network is not DC,
+    conflict holds the semi-reducible negative cycle as a list of (temporal
+    constraint,bound) pairs, where bound is 'lb' or 'ub' for ordinary edges and
+    'lower-case' or 'upper-case' for the labeled edges of contingent links.
+    """
+    def __init__(self,graph,controllable,conflict=None):
+        self.graph = graph
+        self.controllable = controllable
+        self.conflict = conflict if conflict!=None else []
+
+    def __bool__(self):
+        return self.controllable
+    __nonzero__=__bool__
+
+
+def check_dynamic_controllability(prog_or_constraints):
+    """
+    Checks whether an RMPyL program, one of its projections, or an iterable of
+    temporal constraints is dynamically controllable. Durations of type
+    uncontrollable_bounded are contingent links, as are probabilistic
+    durations with finite bounds (e.g., uniform distributions).
+    """
+    if hasattr(prog_or_constraints,'temporal_constraints'):
+        graph = STNUGraph.from_program(prog_or_constraints)
+    else:
+        graph = STNUGraph(prog_or_constraints)
+    return _DCChecker(graph).run()
+
+
+class _BackpropFrame(object):
+    """State of a single DCbackprop call on a negative node."""
+    def __init__(self,checker,source):
+        self.checker = checker
+        self.source = source
+        self.pred={}
+        self.steps = self._propagate()
+
+    def path_to_source(self,u):
+        """Edges of the shortest path found from an event to the source."""
+        g = self.checker.graph
+        path=[]
+        while u!=self.source or len(path)==0:
+            e = self.pred[u]
+            path.append(e)
+            u = g.dst[e]
+        return path
+
+    def _propagate(self):
+        """
+        Backwards Dijkstra from the source over non-negative edges, started at
+        the negative edges into the source. Yields ('call',node) when a negative
+        node has to be processed first, and ('return',True) at the end.
+        """
+        checker = self.checker; g = checker.graph
+        source = self.source
+        src = g.src; weight = g.weight; kind = g.kind; labels = g.label
+        in_edges = checker.in_edges; negative_nodes = checker.negative_nodes
+        pred = self.pred
+        dist={}; label={}
+        queue=[]
+        for e in in_edges[source]:
+            w = weight[e]
+            if w<0.0:
+                u = src[e]
+                if w<dist.get(u,_INF):
+                    dist[u]=w; pred[u]=e
+                    label[u] = labels[e] if kind[e]=='upper' else None
+                    heapq.heappush(queue,(w,u))
+
+        while len(queue)>0:
+            d,u = heapq.heappop(queue)
+            if d>dist[u]:
+                continue #Outdated queue entry
+            if d>=0.0:
+                #The negative edges into the source are replaced by a
+                #non-negative ordinary edge from u.
+                checker.add_derived_edge(u,source,d,self.path_to_source(u))
+                continue
+            if u in negative_nodes:
+                yield ('call',u)
+            label_u = label[u]
+            for e in in_edges[u]:
+                w = weight[e]
+                if w<0.0:
+                    continue
+                #A lower-case edge can't be followed by the upper-case edge of
+                #the same contingent link.
+                if label_u!=None and kind[e]=='lower' and labels[e]==label_u:
+                    continue
+                v = src[e]
+                nd = d+w
+                if nd<dist.get(v,_INF):
+                    dist[v]=nd; pred[v]=e; label[v]=label_u
+                    heapq.heappush(queue,(nd,v))
+        yield ('return',True)
+
+
+class _DCChecker(object):
+    """
+    Morris' DCbackprop procedure, with the recursion over negative nodes
+    managed by an explicit stack of frames so that long chains of negative
+    nodes don't hit Python's recursion limit.
+    """
+    def __init__(self,graph):
+        self.graph = graph
+        self.in_edges=[[] for i in range(graph.num_events)]
+        self.negative_nodes=set()
+        for e in range(len(graph.src)):
+            self.in_edges[graph.dst[e]].append(e)
+            if graph.weight[e]<0.0:
+                self.negative_nodes.add(graph.dst[e])
+        self.finished=set()
+
+    def add_derived_edge(self,u,v,w,path):
+        e = self.graph.add_edge(u,v,w,'ordinary',None,path)
+        self.in_edges[v].append(e)
+
+    def run(self):
+        for node in sorted(self.negative_nodes):
+            if node in self.finished:
+                continue
+            conflict = self._backprop(node)
+            if conflict!=None:
+                return DCResult(self.graph,False,self.graph.expand(conflict))
+        return DCResult(self.graph,True)
+
+    def _backprop(self,node):
+        """
+        Processes a negative node and, recursively, the negative nodes it
+        depends on. Returns None on success, or the edges of the negative cycle
+        formed by the chain of calls otherwise.
+        """
+        stack=[_BackpropFrame(self,node)]
+        active={node:0}
+        message=None
+        while len(stack)>0:
+            frame = stack[-1]
+            step,value = frame.steps.send(message)
+            message=None
+            if step=='call':
+                if value in active:
+                    #Repeated source: the chain of calls forms a negative cycle
+                    cycle=[]; u=value
+                    for f in reversed(stack[active[value]:]):
+                        cycle.extend(f.path_to_source(u))
+                        u = f.source
+                    return cycle
+                elif value in self.finished:
+                    message=True
+                else:
+                    active[value]=len(stack)
+                    stack.append(_BackpropFrame(self,value))
+            else:
+                stack.pop()
+                del active[frame.source]
+                self.finished.add(frame.source)
+                message=True
+        return None